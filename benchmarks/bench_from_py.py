@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""time of building the graph of a synthetic models module (look from_py.get_graph)
+compared with the dir()/getattr scan of model attributes used before, the graphs
+must be the same
+
+usage: python benchmarks/bench_from_py.py [models] [fields per model]"""
+import gc
+import sys
+import time
+import types
+
+from peewee import (
+    CharField, CompositeKey, DatabaseProxy, Field, ForeignKeyField, IntegerField, Model,
+)
+from peewee_extension.migration import from_py, graph
+
+MODULE_NAME = 'bench_models'
+
+
+def make_models_module(models_count: int, fields_count: int):
+    module = types.ModuleType(MODULE_NAME)
+    database = DatabaseProxy()
+    previous = None
+    for i in range(models_count):
+        attrs = {'__module__': MODULE_NAME}
+        for j in range(fields_count):
+            if j % 2:
+                attrs[f'field_{j}'] = CharField(max_length=32 + j, null=True, index=not j % 5)
+            else:
+                attrs[f'field_{j}'] = IntegerField(default=0)
+        if previous is not None:
+            attrs['parent'] = ForeignKeyField(previous, null=True)
+        attrs['Meta'] = type('Meta', (), {
+            'database': database, 'table_name': f'table_{i}',
+            'indexes': ((('field_0', 'field_1'), True),),
+        })
+        previous = type(f'Model{i}', (Model,), attrs)
+        setattr(module, f'Model{i}', previous)
+    sys.modules[MODULE_NAME] = module
+    return module
+
+
+def get_legacy_graph(module):
+    """columns and indexes found by the dir()/getattr scan of every model"""
+    tables = {}
+    for attr_name in dir(module):
+        attr = getattr(module, attr_name)
+        if not isinstance(attr, type) or not issubclass(attr, Model):
+            continue
+        primary_key = attr._meta.primary_key
+        if isinstance(primary_key, CompositeKey):
+            primary_key = graph.PrimaryKeyNode(list(primary_key.field_names))
+        else:
+            primary_key = graph.PrimaryKeyNode([primary_key.column_name.lower()])
+        indexes = [
+            graph.IndexNode([getattr(attr, name).column_name for name in index[0]], index[1])
+            for index in attr._meta.indexes
+        ]
+        columns = {}
+        for table_attr_name in dir(attr):
+            table_attr = getattr(attr, table_attr_name)
+            if not isinstance(table_attr, Field) or isinstance(table_attr, CompositeKey):
+                continue
+            if table_attr.column_name not in attr._meta.columns:
+                continue
+            if table_attr.index or table_attr.unique:
+                indexes.append(graph.IndexNode([table_attr.column_name], table_attr.unique))
+            field_class = type(table_attr)
+            dest_table = None
+            if isinstance(table_attr, ForeignKeyField):
+                field_class = ForeignKeyField
+                dest_table = table_attr.rel_model._meta.table_name
+            columns[table_attr.column_name] = graph.ColumnNode.lazy(
+                table_attr.column_name, from_py.make_refl_column, table_attr, field_class,
+                table_attr.null, max_length=getattr(table_attr, 'max_length', None),
+                dest_table=dest_table, raw_column_type=table_attr.field_type,
+            )
+        tables[attr._meta.table_name] = graph.TableNode(
+            name=attr._meta.table_name, primary_key=primary_key, columns=columns,
+            model=attr.__name__, indexes=indexes, has_foreign_keys=bool(attr._meta.refs),
+        )
+    return graph.DbNode(tables)
+
+
+def describe(db_graph):
+    """everything the migration script is built from, the dir() scan saw a foreign key
+    twice (author and author_id) and added its index twice, repeated indexes are dropped"""
+    return {
+        table_name: (
+            table.model, table.has_foreign_keys, table.primary_key.columns,
+            [(name, column.get_signature()) for name, column in table.columns.items()],
+            list(dict.fromkeys(index.get_signature() for index in table.indexes)),
+        )
+        for table_name, table in db_graph.tables.items()
+    }
+
+
+def measure(function, *args, repeat: int = 3):
+    """best time of the runs and the result, the garbage collector is off
+    while a run is measured as in timeit"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = function(*args)
+            seconds = time.perf_counter() - started
+        finally:
+            gc.enable()
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    models_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    fields_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    module = make_models_module(models_count, fields_count)
+
+    legacy_seconds, legacy_graph = measure(get_legacy_graph, module)
+    seconds, db_graph = measure(from_py.get_graph, MODULE_NAME)
+
+    if describe(db_graph) != describe(legacy_graph):
+        raise Exception('graphs differ')
+    columns = sum(len(table.columns) for table in db_graph.tables.values())
+    print(f'{len(db_graph.tables)} tables, {columns} columns, the graphs are the same')
+    print(f'dir() scan: {legacy_seconds:.2f} s, _meta: {seconds:.2f} s, '
+          f'{legacy_seconds / seconds:.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
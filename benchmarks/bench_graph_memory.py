@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""memory used by the graph of a synthetic models module (look from_py.get_graph)
+
+usage: python benchmarks/bench_graph_memory.py [models] [fields per model]"""
+import sys
+import tracemalloc
+import types
+
+from peewee import CharField, DatabaseProxy, IntegerField, Model
+from peewee_extension.migration import from_py
+
+MODULE_NAME = 'bench_models'
+
+
+def make_models_module(models_count: int, fields_count: int):
+    module = types.ModuleType(MODULE_NAME)
+    database = DatabaseProxy()
+    for i in range(models_count):
+        attrs = {'__module__': MODULE_NAME}
+        for j in range(fields_count):
+            if j % 2:
+                attrs[f'field_{j}'] = CharField(max_length=32 + j, null=True)
+            else:
+                attrs[f'field_{j}'] = IntegerField(default=0)
+        attrs['Meta'] = type('Meta', (), {'database': database, 'table_name': f'table_{i}'})
+        setattr(module, f'Model{i}', type(f'Model{i}', (Model,), attrs))
+    sys.modules[MODULE_NAME] = module
+
+
+def main():
+    models_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    fields_count = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    make_models_module(models_count, fields_count)
+
+    tracemalloc.start()
+    db_graph = from_py.get_graph(MODULE_NAME)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    columns = sum(len(table.columns) for table in db_graph.tables.values())
+    print(f'{len(db_graph.tables)} tables, {columns} columns')
+    print(f'graph: {current / 2 ** 20:.1f} MiB, peak {peak / 2 ** 20:.1f} MiB, '
+          f'{current / columns:.0f} bytes per column')
+
+
+if __name__ == '__main__':
+    main()
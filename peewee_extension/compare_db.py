@@ -1,16 +1,116 @@
 # -*- coding: utf-8 -*-
 """console tool, compares database with python models"""
-from peewee_extension.migration import from_db
+import sys
+from pathlib import Path
+
+from peewee_extension.migration import fingerprint, from_db, shards, snapshot
+from peewee_extension.migration.generator import check_blocking_changes
 from peewee_extension.utils import CompareDbConfigurator
+from playhouse.db_url import connect
+from termcolor import colored, cprint
+
+
+def get_graph(db_url, cache_dir=None):
+    """db_url may be a connect string or a snapshot file (look snapshot.py)"""
+    if snapshot.is_snapshot(db_url):
+        return snapshot.load(db_url)
+    return from_db.get_graph(db_url, cache_dir=cache_dir)
+
+
+def get_checksum(db_url) -> str:
+    """schema checksum of a database by one query (look fingerprint.py)"""
+    if snapshot.is_snapshot(db_url):
+        raise Exception('Schema checksum needs a database, not a snapshot: %s' % db_url)
+    database = connect(db_url)
+    try:
+        return fingerprint.get_schema_checksum(database)
+    finally:
+        database.close()
+
+
+def check_drift(reference_url, db_urls, jobs=4, use_checksum=True, cache_dir=None) -> tuple:
+    """compares the schemas of the databases with the schema of the reference one,
+    with use_checksum only the databases whose checksum differs from the reference
+    checksum are introspected. returns (drift, failed shards), drift maps db_url to
+    the diff graph turning the database into the reference one, None if there is no drift"""
+    candidates = list(db_urls)
+    drift = {}
+    failed = []
+    if use_checksum:
+        checksums = shards.run_on_shards([reference_url] + candidates, get_checksum, jobs)
+        reference = checksums[0]
+        if not reference.ok:
+            raise Exception('Failed to read the reference schema') from reference.error
+        candidates = []
+        for shard in checksums[1:]:
+            if not shard.ok:
+                failed.append(shard)
+            elif shard.result == reference.result:
+                drift[shard.db_url] = None
+            else:
+                candidates.append(shard.db_url)
+        print('%d of %d databases differ from the reference checksum' % (
+            len(candidates), len(checksums) - 1,
+        ))
+    if candidates:
+        reference_graph = get_graph(reference_url, cache_dir=cache_dir)
+
+        def compare(db_url):
+            shard_cache_dir = None
+            if cache_dir:
+                shard_cache_dir = Path(cache_dir) / shards.get_shard_dirname(db_url)
+            return get_graph(db_url, cache_dir=shard_cache_dir).get_diff(other=reference_graph)
+
+        for shard in shards.run_on_shards(candidates, compare, jobs):
+            if shard.ok:
+                drift[shard.db_url] = shard.result if shard.result.tables else None
+            else:
+                failed.append(shard)
+    return {db_url: drift[db_url] for db_url in db_urls if db_url in drift}, failed
+
+
+def print_drift(drift: dict, failed: list) -> bool:
+    """prints the databases without drift and the statements fixing the others,
+    True if all the databases have the reference schema"""
+    for db_url, diff_graph in drift.items():
+        name = shards.get_shard_name(db_url)
+        if diff_graph is None:
+            cprint(f'[{name}] no drift', color='green')
+            continue
+        cprint(f'[{name}] drifted:', color='red')
+        for statement in diff_graph.iter_sql():
+            sys.stdout.write(statement)
+    for shard in failed:
+        print(colored(f'[{shard.name}] failed:', color='red'), shard.error)
+    drifted = [db_url for db_url, diff_graph in drift.items() if diff_graph is not None]
+    print('%d databases checked, %d drifted, %d failed' % (
+        len(drift) + len(failed), len(drifted), len(failed),
+    ))
+    return not drifted and not failed
 
 
 def main():
     configurator = CompareDbConfigurator()
     configurator.run()
-    source_graph = from_db.get_graph(configurator.get_target())
-    target_graph = from_db.get_graph(configurator.get_source())
+    cache_dir = configurator.get_schema_cache()
+    shard_urls = configurator.get_shard_urls()
+    if shard_urls or configurator.is_fingerprint():
+        db_urls = ([configurator.get_target()] if configurator.get_target() else []) + shard_urls
+        drift, failed = check_drift(
+            configurator.get_source(), db_urls, jobs=configurator.jobs,
+            use_checksum=configurator.is_fingerprint(), cache_dir=cache_dir,
+        )
+        if not print_drift(drift, failed):
+            sys.exit(1)
+        return
+    source_graph = get_graph(configurator.get_target(), cache_dir=cache_dir)
+    target_graph = get_graph(configurator.get_source(), cache_dir=cache_dir)
     diff_graph = source_graph.get_diff(other=target_graph)
-    print(diff_graph.as_sql())
+    if configurator.is_no_copy():
+        check_blocking_changes(diff_graph)
+    for statement in diff_graph.iter_sql():
+        sys.stdout.write(statement)
+    sys.stdout.write('\n')
 
 
 if __name__ == '__main__':
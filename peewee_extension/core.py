@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 import datetime
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from collections.abc import Iterable  # добавила импорт из абс, было предупреждение
 
-from peewee import ColumnBase, Model, SQL
+from peewee import (
+    AutoField, BigAutoField, ColumnBase, ColumnMetadata, ForeignKeyMetadata, IndexMetadata, Model,
+    SQL,
+)
 from playhouse.reflection import (
     BigIntegerField, BlobField, CharField, DateField, DateTimeField, DecimalField, DoubleField,
-    Field, FixedCharField, FloatField, IntegerField, MySQLMetadata, SmallIntegerField,
+    Column, Field, FixedCharField, FloatField, IntegerField, MySQLMetadata, SmallIntegerField,
     TextField, TimeField, UnknownField, BooleanField
 )
 
@@ -180,6 +183,147 @@ class MxMySQLMetadata(MySQLMetadata):
 
     }
 
+    def __init__(self, database, batched=False, tables=None, **kwargs):
+        """
+        :param batched: если True, метаданные схемы читаются из information_schema
+        четырьмя запросами (COLUMNS, STATISTICS, KEY_COLUMN_USAGE, REFERENTIAL_CONSTRAINTS)
+        при первом обращении, а дальше Introspector получает их из памяти
+        :param tables: ограничить batched-загрузку этими таблицами, остальные (например
+        таблицы, на которые ссылаются внешние ключи) догружаются по требованию
+        """
+        super(MxMySQLMetadata, self).__init__(database, **kwargs)
+        self.batched = batched
+        self.tables = tables
+        self._schema_cache = None
+
+    def _fetch_dicts(self, sql, params):
+        cursor = self.database.execute_sql(sql, params)
+        names = [d[0].lower() for d in cursor.description]
+        return [{name: val for name, val in zip(names, row)} for row in cursor]
+
+    def load_schema(self, tables=None):
+        """
+        Загружает метаданные таблиц схемы за четыре запроса к information_schema
+        :param tables: список таблиц, None - вся схема
+        :return: словарь имя таблицы -> {'columns', 'indexes', 'foreign_keys'}
+        """
+        schema = self.database.database
+        params = [schema]
+        table_filter = ''
+        if tables is not None:
+            table_filter = ' AND table_name IN (%s)' % ', '.join(['%s'] * len(tables))
+            params += list(tables)
+        result = defaultdict(
+            lambda: {'columns': [], 'indexes': OrderedDict(), 'foreign_keys': []},
+        )
+
+        sql = (
+            'SELECT * FROM information_schema.columns WHERE table_schema = %s'
+            + table_filter + ' ORDER BY table_name, ordinal_position'
+        )
+        for descr in self._fetch_dicts(sql, params):
+            result[descr['table_name']]['columns'].append(descr)
+
+        sql = (
+            'SELECT table_name, index_name, non_unique, seq_in_index, column_name '
+            'FROM information_schema.statistics WHERE table_schema = %s' + table_filter
+            + ' ORDER BY table_name, index_name, seq_in_index'
+        )
+        for descr in self._fetch_dicts(sql, params):
+            table_indexes = result[descr['table_name']]['indexes']
+            table_indexes.setdefault(descr['index_name'], []).append(descr)
+
+        sql = (
+            'SELECT constraint_name FROM information_schema.referential_constraints '
+            'WHERE constraint_schema = %s' + table_filter
+        )
+        constraints = {descr['constraint_name'] for descr in self._fetch_dicts(sql, params)}
+
+        sql = (
+            'SELECT table_name, constraint_name, column_name, '
+            'referenced_table_name, referenced_column_name '
+            'FROM information_schema.key_column_usage WHERE table_schema = %s '
+            'AND referenced_table_name IS NOT NULL AND referenced_column_name IS NOT NULL'
+            + table_filter + ' ORDER BY table_name, constraint_name, ordinal_position'
+        )
+        for descr in self._fetch_dicts(sql, params):
+            if descr['constraint_name'] in constraints:
+                result[descr['table_name']]['foreign_keys'].append(ForeignKeyMetadata(
+                    descr['column_name'], descr['referenced_table_name'],
+                    descr['referenced_column_name'], descr['table_name'],
+                ))
+
+        return dict(result)
+
+    def get_table_metadata(self, table) -> dict:
+        """метаданные одной таблицы из batched-кэша, при необходимости догружает таблицу"""
+        if self._schema_cache is None:
+            self._schema_cache = self.load_schema(self.tables)
+        if table not in self._schema_cache and self.tables is not None:
+            self._schema_cache.update(self.load_schema([table]))
+        return self._schema_cache.setdefault(
+            table, {'columns': [], 'indexes': OrderedDict(), 'foreign_keys': []},
+        )
+
+    def get_columns(self, table, schema=None):
+        if not self.batched:
+            return super(MxMySQLMetadata, self).get_columns(table, schema)
+        # то же самое, что Metadata.get_columns, но без обращений к БД
+        pk_names = self.get_primary_keys(table, schema)
+        metadata = OrderedDict()
+        for descr in self.get_table_metadata(table)['columns']:
+            name = descr['column_name']
+            metadata[name] = ColumnMetadata(
+                name, descr['data_type'], descr['is_nullable'] == 'YES', name in pk_names,
+                table, descr['column_default'],
+            )
+        column_types, extra_params = self.get_column_types(table, schema)
+        if len(pk_names) == 1:
+            pk = pk_names[0]
+            if column_types[pk] is IntegerField:
+                column_types[pk] = AutoField
+            elif column_types[pk] is BigIntegerField:
+                column_types[pk] = BigAutoField
+
+        columns = OrderedDict()
+        for name, column_data in metadata.items():
+            field_class = column_types[name]
+            default = self._clean_default(field_class, column_data.default)
+            columns[name] = Column(
+                name,
+                field_class=field_class,
+                raw_column_type=column_data.data_type,
+                nullable=column_data.null,
+                primary_key=column_data.primary_key,
+                column_name=name,
+                default=default,
+                extra_parameters=extra_params.get(name),
+            )
+        return columns
+
+    def get_primary_keys(self, table, schema=None):
+        if not self.batched:
+            return super(MxMySQLMetadata, self).get_primary_keys(table, schema)
+        rows = self.get_table_metadata(table)['indexes'].get('PRIMARY', [])
+        return [descr['column_name'] for descr in sorted(rows, key=lambda d: d['seq_in_index'])]
+
+    def get_indexes(self, table, schema=None):
+        if not self.batched:
+            return super(MxMySQLMetadata, self).get_indexes(table, schema)
+        indexes = []
+        for name, rows in self.get_table_metadata(table)['indexes'].items():
+            rows = sorted(rows, key=lambda d: d['seq_in_index'])
+            unique = not int(rows[0]['non_unique'])
+            indexes.append(IndexMetadata(
+                name, None, [descr['column_name'] for descr in rows], unique, table,
+            ))
+        return indexes
+
+    def get_foreign_keys(self, table, schema=None):
+        if not self.batched:
+            return super(MxMySQLMetadata, self).get_foreign_keys(table, schema)
+        return list(self.get_table_metadata(table)['foreign_keys'])
+
     def get_column_types(self, table, schema=None):
         """
         Переопределенный метод для получения ПОЛНОЙ информации из БД
@@ -187,13 +331,21 @@ class MxMySQLMetadata(MySQLMetadata):
         :param schema:
         :return:
         """
+        if self.batched:
+            result = self.get_table_metadata(table)['columns']
+        else:
+            sql = 'SELECT * FROM information_schema.columns WHERE table_schema = %s AND table_name = %s'
+            result = self._fetch_dicts(sql, [self.database.database, table])
+        return self.parse_column_types(result)
+
+    def parse_column_types(self, result):
+        """
+        Разбирает строки information_schema.columns одной таблицы
+        :param result: список словарей с описанием колонок
+        :return: column_types, extra_params
+        """
         column_types = {}
         extra_params = defaultdict(dict)
-
-        sql = 'SELECT * FROM information_schema.columns WHERE table_schema = %s AND table_name = %s'
-        cursor = self.database.execute_sql(sql, [self.database.database, table])
-        names = [d[0].lower() for d in cursor.description]
-        result = [{name: val for name, val in zip(names, row)} for row in cursor]
         for descr in result:
             name = descr['column_name']
             data_type = descr['data_type']
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """console tool, compares database with python models"""
 import sys
+from pathlib import Path
 
-from peewee_extension.migration.generator import MigrationGenerator
+from peewee_extension.migration import cost, from_db, shards
+from peewee_extension.migration.generator import MigrationGenerator, format_timings
 from peewee_extension.utils import CreateMigrationConfigurator
 from termcolor import colored
 
@@ -10,25 +12,94 @@ from termcolor import colored
 def do_create(
         db_url: str, models: str, migrations_path: str,
         migration_name: str = None, make_empty_migration: bool = False,
-        only_tables: list = None,
+        only_tables: list = None, schema_cache: str = None, no_copy: bool = False,
+        plan: bool = False, online_rebuild: bool = False, source_graph=None,
+        static_models: bool = False, jobs: int = 4,
 ):
     generator = MigrationGenerator(
         db_url=db_url,
         models=models,
         make_empty_migration=make_empty_migration,
+        schema_cache=schema_cache,
+        no_copy=no_copy,
+        online_rebuild=online_rebuild,
+        static_models=static_models,
+        jobs=jobs,
     )
-    generator.generate(only_tables=only_tables)
+    generator.generate(only_tables=only_tables, source_graph=source_graph)
+    print('Graphs built:', format_timings(generator.timings))
     filename = generator.write_in_file(
         migrations_path=migrations_path,
         migration_name=migration_name,
     )
     print('Wrote', colored(filename, color='red'))
+    if plan and generator.diff_graph is not None:
+        report = generator.estimate_cost()
+        print(''.join(cost.iter_text(report)))
+        for report_filename in cost.write_report(filename, report):
+            print('Wrote', colored(str(report_filename), color='red'))
+
+
+def get_shard_graphs(shard_urls: list, schema_cache: str = None, jobs: int = 4) -> list:
+    """introspects the shards at most jobs at the same time,
+    every shard has its own directory in the schema cache"""
+
+    def introspect(db_url):
+        cache_dir = None
+        if schema_cache:
+            cache_dir = Path(schema_cache) / shards.get_shard_dirname(db_url)
+        return from_db.get_graph(db_url, cache_dir=cache_dir)
+
+    return shards.run_on_shards(shard_urls, introspect, jobs)
+
+
+def do_create_on_shards(shard_urls: list, models: str, migrations_path: str, jobs: int = 4,
+                        schema_cache: str = None, **kwargs) -> bool:
+    """makes one migration for shards with the same schema, the shards are
+    introspected concurrently and their schemas compared by fingerprint.
+    if the schemas differ no migration is written. returns True if all the shards succeeded"""
+    results = get_shard_graphs(shard_urls, schema_cache, jobs)
+    introspected = [shard for shard in results if shard.ok]
+    schemas = {}
+    for shard in introspected:
+        schemas.setdefault(shard.result.get_fingerprint(), []).append(shard.name)
+    if len(schemas) > 1:
+        print(colored('Shards have different schemas, migration is not created:', color='red'))
+        for names in schemas.values():
+            print('   ', ', '.join(names))
+        shards.print_summary(results)
+        return False
+    if introspected:
+        do_create(
+            introspected[0].db_url, models, migrations_path, schema_cache=schema_cache,
+            source_graph=introspected[0].result, jobs=jobs, **kwargs,
+        )
+    return shards.print_summary(results)
 
 
 def main():
     sys.path.append('')
     configurator = CreateMigrationConfigurator()
     configurator.run()
+    shard_urls = configurator.get_shard_urls()
+    if shard_urls:
+        succeeded = do_create_on_shards(
+            shard_urls,
+            configurator.get_models(),
+            configurator.get_filepath(),
+            jobs=configurator.jobs,
+            schema_cache=configurator.get_schema_cache(),
+            migration_name=configurator.migration_name,
+            make_empty_migration=configurator.is_empty_migration(),
+            only_tables=configurator.only_tables,
+            no_copy=configurator.is_no_copy(),
+            plan=configurator.is_plan(),
+            online_rebuild=configurator.is_online_rebuild(),
+            static_models=configurator.is_static_models(),
+        )
+        if not succeeded:
+            sys.exit(1)
+        return
     do_create(
         configurator.get_dburl(),
         configurator.get_models(),
@@ -36,6 +107,12 @@ def main():
         configurator.migration_name,
         configurator.is_empty_migration(),
         only_tables=configurator.only_tables,
+        schema_cache=configurator.get_schema_cache(),
+        no_copy=configurator.is_no_copy(),
+        plan=configurator.is_plan(),
+        online_rebuild=configurator.is_online_rebuild(),
+        static_models=configurator.is_static_models(),
+        jobs=configurator.jobs,
     )
 
 
@@ -38,9 +38,9 @@ class UnknownField(object):
 """
 
 
-def make_introspector(db_url, schema=None):
+def make_introspector(db_url, schema=None, batched=True):
     db = connect(db_url)
-    meta = MxMySQLMetadata(db)
+    meta = MxMySQLMetadata(db, batched=batched)
     return Introspector(metadata=meta, schema=schema)
 
 
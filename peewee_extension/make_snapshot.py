@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""console tool, saves a graph of a database or python models into a snapshot file"""
+import sys
+
+from peewee_extension.migration import from_db, from_py, snapshot
+from peewee_extension.utils import SnapshotConfigurator
+from termcolor import colored
+
+
+def main():
+    sys.path.append('')
+    configurator = SnapshotConfigurator()
+    configurator.run()
+    if configurator.get_dburl():
+        db_graph = from_db.get_graph(configurator.get_dburl())
+    else:
+        db_graph = from_py.get_graph(
+            configurator.get_models(), static=configurator.is_static_models(),
+        )
+    filename = snapshot.save(db_graph, configurator.get_output())
+    print('Wrote', colored(filename, color='red'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,80 +1,254 @@
 # -*- coding: utf-8 -*-
 """console tool, compares database with python models"""
 import datetime
-import importlib
+import importlib.util
 import sys
 from os import chdir
 from pathlib import Path
 
 
-from peewee_extension.migration import models_migration_table
-from peewee_extension.migration.models_migration_table import Migration
+from peewee import PostgresqlDatabase, SqliteDatabase
+from peewee_extension.migration import shards
+from peewee_extension.migration.lock import MigrationLock
+from peewee_extension.migration.models_migration_table import Migration, bind_copy
 from peewee_extension.utils import MigrateConfigurator
 from playhouse.db_url import connect
 from termcolor import colored, cprint
 
+TRANSACTIONAL_DDL_DATABASES = (SqliteDatabase, PostgresqlDatabase)
 
-def do_migrate(migration_module, db):
+
+def load_migration(migration_module):
+    """loads a migration script of the current directory as a new module object,
+    so databases migrated at the same time get their own db proxy and migrator"""
+    path = Path(f'{migration_module}.py')
+    if not path.is_file():
+        raise Exception(f'Migration {migration_module} not found')
+    spec = importlib.util.spec_from_file_location(migration_module, path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    return migration
+
+
+def apply_migration(migration_module, db, workers: int = 1) -> list:
+    """applies a migration, returns the names to record in pe_migrations:
+    the migration itself and the migrations squashed into it (look squash.py)"""
     # put' k papke s migraciey ili nazvanie modulya .py c migracieydb
-    try:
-        migration = importlib.import_module(migration_module)
-    except ImportError as err:
-        raise Exception(err)
+    migration = load_migration(migration_module)
     if not hasattr(migration, 'apply'):
         raise Exception('Migration must contain apply()')
     if not hasattr(migration, 'db'):
         raise Exception('Migration must contain db attr')
-    migration.db.initialize(db)
-    migration.apply()
+    migration_model = bind_copy(Migration, db)
+    squashed = list(getattr(migration, 'squashed', None) or [])
+    applied = set()
+    if squashed:
+        # базовая миграция (см. squash.py) не нужна базе, в которой уже есть вся история
+        applied = {
+            row.name for row in
+            migration_model.select(migration_model.name).where(migration_model.name.in_(squashed))
+        }
+        if applied and len(applied) < len(set(squashed)):
+            raise Exception(
+                f'{len(applied)} of {len(set(squashed))} migrations squashed into '
+                f'{migration_module} are applied, apply the others from squashed/ first',
+            )
+    if not applied:
+        migration.db.initialize(db)
+        if hasattr(migration, 'migrator'):
+            # независимые таблицы мигрируются параллельно (см. migration/scheduler.py)
+            migration.migrator.workers = workers
+        migration.apply()
+    return [migration_module] + [name for name in dict.fromkeys(squashed) if name not in applied]
 
-    Migration.create(
-        name=migration_module, is_applied=True,
-        created_at=datetime.datetime.now(),
-        applied_at=datetime.datetime.now(),
-    )
 
+def record_migrations(db, names: list):
+    """marks the migrations as applied with one insert"""
+    now = datetime.datetime.now()
+    bind_copy(Migration, db).insert_many([
+        {'name': name, 'is_applied': True, 'created_at': now, 'applied_at': now}
+        for name in names
+    ]).execute()
 
-def main():
-    sys.path.append('')
-    # db_url i path to migrations peredat params
-    conf = MigrateConfigurator()
-    conf.run()
-    # connect to database
-    db = connect(conf.get_dburl())
-    models_migration_table.db.initialize(db)
-    if 'pe_migrations' not in db.get_tables():
-        db.create_tables([Migration])
-    migrations_path = Path(conf.get_filepath())
-    unapplied_migrations = {f.name[:-3] for f in migrations_path.iterdir() if f.is_file()}
-    # TODO: testing протестировать применение нескольких миграций из папки
-    print('Migrations from directory:', unapplied_migrations)
-    migrations_from_db = {
-        migration_name.name for migration_name in Migration.select(Migration.name)
+
+def do_migrate(migration_module, db, workers: int = 1):
+    record_migrations(db, apply_migration(migration_module, db, workers=workers))
+
+
+def apply_batch(migrations: list, db, workers: int = 1) -> list:
+    """applies the migrations in the given order in one session and records them
+    with one insert. databases with transactional DDL apply the whole batch in one
+    transaction, MySQL commits every DDL statement, so there the migrations applied
+    before a failure are recorded anyway. returns the recorded names"""
+    recorded = []
+    # открытое соединение не закрываем, на нем может держаться блокировка (см. lock.py)
+    db.connect(reuse_if_open=True)
+    if isinstance(db, TRANSACTIONAL_DDL_DATABASES):
+        with db.atomic():
+            for migration_module in migrations:
+                recorded.extend(apply_migration(migration_module, db, workers=workers))
+            record_migrations(db, recorded)
+        return recorded
+    try:
+        for migration_module in migrations:
+            recorded.extend(apply_migration(migration_module, db, workers=workers))
+    finally:
+        if recorded:
+            record_migrations(db, recorded)
+    return recorded
+
+
+def get_unapplied_migrations(db, migrations_path, name: str = None) -> list:
+    """names of the migration scripts not applied to the database in the order
+    of their names, they start with the creation time"""
+    migration_model = bind_copy(Migration, db)
+    migration_model.create_table(safe=True)
+    migrations = {
+        f.name[:-3] for f in Path(migrations_path).iterdir() if f.is_file() and f.suffix == '.py'
     }
-    if migrations_from_db:
-        print('Migrations from db: ', migrations_from_db)
-        unapplied_migrations -= set(migrations_from_db)
+    migrations -= {migration.name for migration in migration_model.select(migration_model.name)}
+    if name:
+        migrations &= {name}
+    return sorted(migrations)
+
+
+def follow_leader(lock: MigrationLock, db, migrations_path, name=None):
+    """waits until the process holding the lock has applied the migrations,
+    raises if it has left some of them unapplied"""
+    cprint('Migrations are applied by another process, waiting for it', color='yellow')
+    lock.wait_released()
+    unapplied_migrations = get_unapplied_migrations(db, migrations_path, name)
+    if unapplied_migrations:
+        raise Exception(
+            'Another process failed to apply migrations: ' + ', '.join(unapplied_migrations),
+        )
+    cprint('Migrations are applied by another process', color='green')
+
+
+def migrate_database(
+        db_url, migrations_path, name=None, ask_user=True, workers=1, batch=False,
+        lock_timeout=None, follow=False,
+):
+    """with batch the migrations are confirmed once and applied by apply_batch.
+    migrations are applied under MigrationLock, a process which finds the lock held
+    waits for it up to lock_timeout seconds, with follow it waits for the holder
+    to finish and exits without applying anything"""
+    db = connect(db_url)
+    lock = MigrationLock(db, timeout=lock_timeout)
+    if not lock.acquire(wait=not follow):
+        follow_leader(lock, db, migrations_path, name)
+        return
+    try:
+        apply_unapplied(db, migrations_path, name, ask_user, workers, batch)
+    finally:
+        lock.release()
+
+
+def apply_unapplied(db, migrations_path, name=None, ask_user=True, workers=1, batch=False):
+    unapplied_migrations = get_unapplied_migrations(db, migrations_path, name)
     print('to apply: ', unapplied_migrations)
-    if conf.options.name:
-        unapplied_migrations &= {conf.options.name}
     if not unapplied_migrations:
         cprint('Nothing to do', color='yellow')
         return
     chdir(migrations_path)
+    if batch:
+        if ask_user:
+            feedback = input(f'Apply {len(unapplied_migrations)} migrations? [y/N]')
+            if feedback.upper() != 'Y':
+                cprint('Skipped', color='yellow')
+                return
+        apply_batch(unapplied_migrations, db, workers=workers)
+        cprint(f'Applied {len(unapplied_migrations)} migrations', color='green')
+        return
     for filename in unapplied_migrations:
         need_apply = True
-        if conf.ask_user:
+        if ask_user:
             red_filename = colored(filename, color='red')
             feedback = input(
                 f'Migration {red_filename} is not applied, do you want to apply it? [y/N]',
             )
             need_apply = feedback.upper() == 'Y'
         if need_apply:
-            do_migrate(filename, db)
+            do_migrate(filename, db, workers=workers)
             cprint(f'Applied {filename}', color='green')
         else:
             cprint(f'Skipped {filename}', color='yellow')
 
 
+def migrate_shards(
+        db_urls, migrations_path, name=None, ask_user=True, workers=1, jobs=4,
+        lock_timeout=None, follow=False,
+):
+    """applies migrations to many databases at most jobs at the same time: unapplied
+    migrations of all the shards are found first, the user confirms them once,
+    then every shard applies its migrations under its lock (look migrate_database).
+    returns True if all the shards succeeded"""
+    migrations_path = Path(migrations_path).resolve()
+
+    def find(db_url):
+        db = connect(db_url)
+        try:
+            return get_unapplied_migrations(db, migrations_path, name)
+        finally:
+            db.close()
+
+    found = shards.run_on_shards(db_urls, find, jobs)
+    pending = [shard for shard in found if shard.ok and shard.result]
+    for shard in found:
+        if shard.ok:
+            print(f'[{shard.name}] to apply:', shard.result or '-')
+    if not pending:
+        cprint('Nothing to do', color='yellow')
+        return shards.print_summary(found)
+    if ask_user:
+        feedback = input(f'Apply the migrations to {len(pending)} shards? [y/N]')
+        if feedback.upper() != 'Y':
+            cprint('Skipped', color='yellow')
+            return shards.print_summary(found)
+
+    unapplied = {shard.db_url: shard.result for shard in pending}
+
+    def apply(db_url):
+        db = connect(db_url)
+        lock = MigrationLock(db, timeout=lock_timeout)
+        if not lock.acquire(wait=not follow):
+            follow_leader(lock, db, migrations_path, name)
+            return []
+        try:
+            # пока ждали блокировку, часть миграций мог применить другой процесс
+            migrations = get_unapplied_migrations(db, migrations_path, name)
+            apply_batch(migrations, db, workers=workers)
+        finally:
+            lock.release()
+        return migrations
+
+    chdir(migrations_path)
+    applied = {shard.db_url: shard for shard in shards.run_on_shards(list(unapplied), apply, jobs)}
+    return shards.print_summary([applied.get(shard.db_url, shard) for shard in found])
+
+
+def main():
+    sys.path.append('')
+    # db_url i path to migrations peredat params
+    conf = MigrateConfigurator()
+    conf.run()
+    shard_urls = conf.get_shard_urls()
+    if shard_urls:
+        succeeded = migrate_shards(
+            shard_urls, conf.get_filepath(), conf.options.name,
+            ask_user=conf.ask_user, workers=conf.workers, jobs=conf.jobs,
+            lock_timeout=conf.options.lock_timeout, follow=conf.options.follow,
+        )
+        if not succeeded:
+            sys.exit(1)
+        return
+    # TODO: testing протестировать применение нескольких миграций из папки
+    migrate_database(
+        conf.get_dburl(), conf.get_filepath(), conf.options.name,
+        ask_user=conf.ask_user, workers=conf.workers, batch=conf.options.batch,
+        lock_timeout=conf.options.lock_timeout, follow=conf.options.follow,
+    )
+
+
 if __name__ == '__main__':
     main()
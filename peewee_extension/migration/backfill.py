@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""batched update of existing rows for migrations (look MxMySQLMigrator.backfill)
+
+the table is walked in primary key order by ranges of chunk_size rows (keyset
+pagination, composite keys are compared as rows), every range is updated and
+committed separately together with the last processed key, so an interrupted
+backfill continues from that key on the next run"""
+import json
+import time
+
+from peewee import Node
+from peewee_extension.migration.models_migration_table import BackfillProgress, bind_copy
+
+
+def quote(name) -> str:
+    return '`%s`' % name.replace('`', '``')
+
+
+def quote_list(names) -> str:
+    return ', '.join(quote(name) for name in names)
+
+
+def get_range_condition(key: list, lower=None, upper=None, param='%s') -> tuple:
+    """returns (sql, params) of the condition lower < key <= upper, bounds may be None"""
+    columns = quote_list(key)
+    placeholders = ', '.join([param] * len(key))
+    conditions = []
+    params = []
+    if lower is not None:
+        conditions.append('(%s) > (%s)' % (columns, placeholders))
+        params.extend(lower)
+    if upper is not None:
+        conditions.append('(%s) <= (%s)' % (columns, placeholders))
+        params.extend(upper)
+    return ' AND '.join(conditions) or '1 = 1', params
+
+
+def iter_key_ranges(database, table: str, key: list, chunk_size: int, lower=None):
+    """yields (lower, upper) key bounds of consecutive batches of chunk_size rows,
+    lower is None for the first batch and upper is None for the last one"""
+    columns = quote_list(key)
+    while True:
+        condition, params = get_range_condition(key, lower, param=database.param)
+        upper = database.execute_sql(
+            'SELECT %s FROM %s WHERE %s ORDER BY %s LIMIT 1 OFFSET %d' % (
+                columns, quote(table), condition, columns, chunk_size - 1,
+            ),
+            params,
+        ).fetchone()
+        yield lower, (list(upper) if upper is not None else None)
+        if upper is None:
+            return
+        lower = list(upper)
+
+
+class Backfill:
+    """Batched UPDATE table SET values WHERE where.
+
+    values maps column names to python values or peewee nodes (SQL('...')),
+    throttle is called after every batch with the number of updated rows
+    and the last processed key, it may sleep while replicas are behind"""
+
+    def __init__(
+            self, database, table, values, primary_key, where=None, chunk_size=1000,
+            sleep=0, throttle=None, name=None,
+    ):
+        if not primary_key:
+            raise ValueError('Table %s has no primary key, it can not be backfilled' % table)
+        self.database = database
+        self.table = table
+        self.values = values
+        self.primary_key = list(primary_key)
+        self.where = where
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+        self.throttle = throttle
+        self.name = name or '%s:%s' % (table, ','.join(sorted(values)))
+        self.rows = 0
+        self.model = bind_copy(BackfillProgress, database)
+
+    def get_update(self) -> tuple:
+        """returns (sql, params) of UPDATE ... SET ... without the WHERE part"""
+        assignments = []
+        params = []
+        for column, value in self.values.items():
+            if isinstance(value, Node):
+                sql, node_params = self.database.get_sql_context().sql(value).query()
+                assignments.append('%s = %s' % (quote(column), sql))
+                params.extend(node_params)
+            else:
+                assignments.append('%s = %s' % (quote(column), self.database.param))
+                params.append(value)
+        return 'UPDATE %s SET %s' % (quote(self.table), ', '.join(assignments)), params
+
+    def run(self):
+        self.model.create_table(safe=True)
+        progress = self.model.get_or_none(self.model.name == self.name)
+        lower = None
+        if progress is not None:
+            lower = json.loads(progress.last_key)
+            self.rows = progress.rows
+            print('Resuming backfill', self.name, 'after key', lower)
+
+        update, update_params = self.get_update()
+        for lower, upper in iter_key_ranges(
+                self.database, self.table, self.primary_key, self.chunk_size, lower):
+            condition, params = get_range_condition(
+                self.primary_key, lower, upper, param=self.database.param,
+            )
+            if self.where:
+                condition = '%s AND (%s)' % (condition, self.where)
+            with self.database.atomic():
+                cursor = self.database.execute_sql(
+                    update + ' WHERE ' + condition, update_params + params,
+                )
+                self.rows += cursor.rowcount
+                if upper is not None:
+                    self.save_progress(upper)
+            if upper is not None:
+                self.wait(upper)
+
+        self.model.delete().where(self.model.name == self.name).execute()
+        print('Backfilled', self.table, self.rows, 'rows')
+
+    def save_progress(self, last_key):
+        last_key = json.dumps(last_key, default=str)
+        updated = (self.model
+                   .update(last_key=last_key, rows=self.rows)
+                   .where(self.model.name == self.name)
+                   .execute())
+        if not updated:
+            self.model.create(name=self.name, last_key=last_key, rows=self.rows)
+
+    def wait(self, last_key):
+        if self.sleep:
+            time.sleep(self.sleep)
+        if self.throttle is not None:
+            self.throttle(self.rows, last_key)
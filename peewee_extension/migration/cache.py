@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""on-disk snapshot caches: of database graphs, one entry per table,
+and of python models graphs, one entry per module"""
+import hashlib
+import pickle
+from pathlib import Path
+
+CACHE_VERSION = 7
+MODELS_CACHE_VERSION = 2
+
+TABLE_STAMPS_SQL = """
+    SELECT t.table_name, t.create_time, c.checksum, s.checksum, k.checksum
+    FROM information_schema.tables t
+    LEFT JOIN (
+        SELECT table_name, MD5(GROUP_CONCAT(
+            column_name, ':', column_type, ':', is_nullable, ':',
+            IFNULL(column_default, ''), ':', column_comment
+            ORDER BY ordinal_position
+        )) AS checksum
+        FROM information_schema.columns WHERE table_schema = %s{tables} GROUP BY table_name
+    ) c ON c.table_name = t.table_name
+    LEFT JOIN (
+        SELECT table_name, MD5(GROUP_CONCAT(
+            index_name, ':', non_unique, ':', seq_in_index, ':', column_name
+            ORDER BY index_name, seq_in_index
+        )) AS checksum
+        FROM information_schema.statistics WHERE table_schema = %s{tables} GROUP BY table_name
+    ) s ON s.table_name = t.table_name
+    LEFT JOIN (
+        SELECT table_name, MD5(GROUP_CONCAT(
+            constraint_name, ':', column_name, ':',
+            referenced_table_name, ':', referenced_column_name
+            ORDER BY constraint_name, ordinal_position
+        )) AS checksum
+        FROM information_schema.key_column_usage
+        WHERE table_schema = %s{tables} AND referenced_table_name IS NOT NULL
+        GROUP BY table_name
+    ) k ON k.table_name = t.table_name
+    WHERE t.table_schema = %s{t_tables} AND t.table_type != 'VIEW'
+"""
+
+
+def load_pickle(path: Path, kind: str) -> dict:
+    if not path.is_file():
+        return {}
+    try:
+        with open(path, 'rb') as file_handle:
+            return pickle.load(file_handle)
+    except (
+            OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError,
+    ):
+        print('WARNING', kind, 'cache', path, 'is broken and will be rebuilt')
+        return {}
+
+
+def save_pickle(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'wb') as file_handle:
+        pickle.dump(data, file_handle, protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path.replace(path)
+
+
+def get_source_stamp(path) -> tuple:
+    """mtime, size and sha1 of a source file"""
+    path = Path(path)
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size, hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+class SchemaCache:
+    """Snapshot cache of TableNode's for one database.
+
+    Every table entry is stored together with its stamp: CREATE_TIME from
+    information_schema.TABLES plus checksums of the table's columns, indexes
+    and foreign keys. An entry is valid while the stamp in the database is the same.
+    The cache file is named after host:port/db of the database (look from_db.get_cached_graph)."""
+
+    def __init__(self, cache_dir, name: str):
+        self.path = Path(cache_dir) / f'{name}.schema_cache'
+        self.tables = {}
+        self.load()
+
+    def load(self):
+        data = load_pickle(self.path, 'schema')
+        if data.get('version') == CACHE_VERSION:
+            self.tables = data['tables']
+
+    def save(self):
+        save_pickle(self.path, {'version': CACHE_VERSION, 'tables': self.tables})
+
+    @staticmethod
+    def get_table_stamps(database, tables=None) -> dict:
+        """returns dict table_name -> stamp for every table of the database,
+        with tables only for these tables, the others are not scanned"""
+        filters = {'tables': '', 't_tables': ''}
+        names = []
+        if tables is not None:
+            names = sorted(tables)
+            if not names:
+                return {}
+            placeholders = ', '.join(['%s'] * len(names))
+            filters = {
+                'tables': f' AND table_name IN ({placeholders})',
+                't_tables': f' AND t.table_name IN ({placeholders})',
+            }
+        database.execute_sql('SET SESSION group_concat_max_len = 1048576')
+        params = ([database.database] + names) * 4
+        stamps = {}
+        for table_name, *stamp in database.execute_sql(TABLE_STAMPS_SQL.format(**filters), params):
+            stamps[table_name] = tuple(str(value) for value in stamp)
+        return stamps
+
+    def get_stale_tables(self, stamps: dict) -> list:
+        """returns tables which are absent in the cache or whose stamp has changed"""
+        stale = []
+        for table_name, stamp in sorted(stamps.items()):
+            if table_name not in self.tables or self.tables[table_name][0] != stamp:
+                stale.append(table_name)
+        return stale
+
+    def get(self, table_name):
+        if table_name not in self.tables:
+            return None
+        return self.tables[table_name][1]
+
+    def put(self, table_name, stamp, table_node):
+        self.tables[table_name] = (stamp, table_node)
+
+    def retain(self, table_names):
+        """drops the entries of tables that no longer exist"""
+        table_names = set(table_names)
+        for table_name in list(self.tables):
+            if table_name not in table_names:
+                del self.tables[table_name]
+
+
+class ModelsCache:
+    """Snapshot cache of the graphs of python models, one entry per module.
+
+    Every entry is stored together with the stamps of the module source and of
+    the sources of the package modules it imports: mtime, size and sha1. An entry
+    is valid while the sources have the same sha1, the hash is computed only for
+    the files whose mtime or size has changed."""
+
+    def __init__(self, cache_dir, name: str):
+        self.path = Path(cache_dir) / f'{name}.models_cache'
+        self.modules = {}
+        self.changed = False
+        self.load()
+
+    def load(self):
+        data = load_pickle(self.path, 'models')
+        if data.get('version') == MODELS_CACHE_VERSION:
+            self.modules = data['modules']
+
+    def save(self):
+        if self.changed:
+            save_pickle(self.path, {'version': MODELS_CACHE_VERSION, 'modules': self.modules})
+            self.changed = False
+
+    def get(self, module_name: str):
+        """the graph dict of the module (look snapshot.dump_graph), None if it is stale"""
+        if module_name not in self.modules:
+            return None
+        stamps, data = self.modules[module_name]
+        for path, (mtime_ns, size, digest) in stamps.items():
+            try:
+                stat = Path(path).stat()
+                if (stat.st_mtime_ns, stat.st_size) == (mtime_ns, size):
+                    continue
+                stamp = get_source_stamp(path)
+            except OSError:
+                return None
+            if stamp[2] != digest:
+                return None
+            # the file is touched but not changed
+            stamps[path] = stamp
+            self.changed = True
+        return data
+
+    def put(self, module_name: str, stamps: dict, data: dict):
+        self.modules[module_name] = (stamps, data)
+        self.changed = True
+
+    def retain(self, module_names):
+        """drops the entries of modules that no longer exist"""
+        module_names = set(module_names)
+        for module_name in list(self.modules):
+            if module_name not in module_names:
+                del self.modules[module_name]
+                self.changed = True
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""module to estimate the cost of a migration: rebuild time and extra disk space
+of every change of a diff graph (look graph.py) out of the table statistics
+in information_schema.TABLES and the online DDL algorithm of the change
+
+the estimate is rough: TABLE_ROWS of InnoDB is itself an estimate and the speeds
+below are the order of magnitude for a server with SSD disks"""
+import json
+from pathlib import Path
+
+from peewee_extension.migration import graph
+
+TABLE_STATS_SQL = """
+    SELECT table_name, table_rows, data_length, index_length
+    FROM information_schema.tables
+    WHERE table_schema = %s AND table_type != 'VIEW'
+"""
+
+COPY_BYTES_PER_SECOND = 30 * 1024 * 1024
+INPLACE_BYTES_PER_SECOND = 60 * 1024 * 1024
+INDEX_SCAN_BYTES_PER_SECOND = 120 * 1024 * 1024
+# запись вторичного индекса: служебная часть + ключ на каждую колонку
+INDEX_ENTRY_BYTES = 16
+INDEX_COLUMN_BYTES = 12
+
+
+def get_table_stats(database, tables=None) -> dict:
+    """function that reads TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH of the tables,
+    returns dict table_name -> {'rows', 'data_length', 'index_length'}"""
+    sql = TABLE_STATS_SQL
+    params = [database.database]
+    if tables is not None:
+        if not tables:
+            return {}
+        sql += ' AND table_name IN (%s)' % ', '.join(['%s'] * len(tables))
+        params += list(tables)
+    stats = {}
+    for table_name, rows, data_length, index_length in database.execute_sql(sql, params):
+        stats[table_name] = {
+            'rows': int(rows or 0),
+            'data_length': int(data_length or 0),
+            'index_length': int(index_length or 0),
+        }
+    return stats
+
+
+def estimate_change(change, stats: dict) -> tuple:
+    """returns (seconds, extra disk bytes) of a column or index change of a table"""
+    data_length = stats.get('data_length') or 0
+    table_size = data_length + (stats.get('index_length') or 0)
+    if change.rebuilds_table():
+        if change.get_algorithm() == graph.ALGORITHM_COPY:
+            return table_size / COPY_BYTES_PER_SECOND, table_size
+        return table_size / INPLACE_BYTES_PER_SECOND, table_size
+    if isinstance(change, graph.IndexNode) and change.mode == graph.MODE_ADD:
+        rows = stats.get('rows') or 0
+        index_size = rows * (INDEX_ENTRY_BYTES + INDEX_COLUMN_BYTES * len(change.indexes))
+        return data_length / INDEX_SCAN_BYTES_PER_SECOND, index_size
+    return 0, 0
+
+
+def estimate_table(table: graph.TableNode, stats: dict) -> dict:
+    """cost of the changes of a diff table, all of them are applied with one ALTER TABLE,
+    so the table is rebuilt at most once and new indexes are built on top of it"""
+    report = {
+        'table': table.name,
+        'rows': stats.get('rows'),
+        'data_length': stats.get('data_length'),
+        'index_length': stats.get('index_length'),
+        'algorithm': None,
+        'lock': None,
+        'seconds': 0,
+        'extra_disk': 0,
+        'operations': [],
+    }
+    if table.mode == graph.MODE_ADD:
+        report['operations'].append(make_operation(f'CREATE TABLE `{table.name}`'))
+        return report
+    if table.mode == graph.MODE_DELETE:
+        report['operations'].append(make_operation(f'DROP TABLE `{table.name}`'))
+        return report
+    if table.mode != graph.MODE_MODIFY:
+        return None
+
+    rebuild = (0, 0)
+    for change in table.iter_changes():
+        if isinstance(change, graph.IndexNode):
+            clause = change.as_sql_clause(table.name)
+        else:
+            clause = change.as_sql_clause()
+        if not clause:
+            continue
+        seconds, extra_disk = estimate_change(change, stats)
+        rebuilds_table = change.rebuilds_table()
+        report['operations'].append(make_operation(
+            clause, change.get_algorithm(), rebuilds_table, seconds, extra_disk,
+        ))
+        if rebuilds_table:
+            rebuild = max(rebuild, (seconds, extra_disk))
+        else:
+            report['seconds'] += seconds
+            report['extra_disk'] += extra_disk
+    report['seconds'] += rebuild[0]
+    report['extra_disk'] += rebuild[1]
+    report['algorithm'] = table.get_algorithm()
+    report['lock'] = graph.get_lock(report['algorithm'])
+    return report
+
+
+def make_operation(clause, algorithm=None, rebuilds_table=False, seconds=0, extra_disk=0):
+    return {
+        'operation': clause,
+        'algorithm': algorithm,
+        'rebuilds_table': rebuilds_table,
+        'seconds': round(seconds, 1),
+        'extra_disk': int(extra_disk),
+    }
+
+
+def estimate(diff_graph: graph.DbNode, table_stats: dict) -> dict:
+    """function that estimates the cost of every table of a diff graph,
+    table_stats is made by get_table_stats, tables without statistics cost nothing"""
+    tables = []
+    for table in diff_graph.tables.values():
+        report = estimate_table(table, table_stats.get(table.name, {}))
+        if report is not None:
+            report['seconds'] = round(report['seconds'], 1)
+            report['extra_disk'] = int(report['extra_disk'])
+            tables.append(report)
+    return {
+        'tables': tables,
+        'seconds': round(sum(table['seconds'] for table in tables), 1),
+        'extra_disk': max([table['extra_disk'] for table in tables], default=0),
+    }
+
+
+def format_size(size) -> str:
+    if size is None:
+        return '?'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def format_seconds(seconds) -> str:
+    if seconds < 60:
+        return f'{seconds:.1f} s'
+    if seconds < 3600:
+        return f'{seconds / 60:.1f} min'
+    return f'{seconds / 3600:.1f} h'
+
+
+def iter_text(report: dict):
+    """yields the cost report as text line by line"""
+    for table in report['tables']:
+        rows = '?' if table['rows'] is None else table['rows']
+        yield 'table `%s`: %s rows, data %s, indexes %s\n' % (
+            table['table'], rows,
+            format_size(table['data_length']), format_size(table['index_length']),
+        )
+        if table['algorithm'] is not None:
+            lock = f', LOCK={table["lock"]}' if table['lock'] else ''
+            yield '    ALGORITHM=%s%s, ~%s, extra disk %s\n' % (
+                table['algorithm'], lock,
+                format_seconds(table['seconds']), format_size(table['extra_disk']),
+            )
+        for operation in table['operations']:
+            yield '    %-8s %-8s ~%-10s %-10s %s\n' % (
+                operation['algorithm'] or '-',
+                'rebuild' if operation['rebuilds_table'] else '',
+                format_seconds(operation['seconds']), format_size(operation['extra_disk']),
+                operation['operation'],
+            )
+    yield 'total: ~%s, extra disk up to %s\n' % (
+        format_seconds(report['seconds']), format_size(report['extra_disk']),
+    )
+
+
+def write_report(script_path, report: dict) -> list:
+    """writes the cost report next to the migration script as .cost.txt and .cost.json"""
+    script_path = Path(str(script_path))
+    text_path = script_path.with_suffix('.cost.txt')
+    json_path = script_path.with_suffix('.cost.json')
+    with open(text_path, 'w') as file_handle:
+        file_handle.writelines(iter_text(report))
+    with open(json_path, 'w') as file_handle:
+        json.dump(report, file_handle, indent=2)
+    return [text_path, json_path]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""schema checksum of a database computed by one query to information_schema,
+used to find servers whose schema drifted without introspecting all of them
+
+columns and indexes are normalized like the graph (look graph.py) compares them:
+column order, index names, comments and defaults are ignored, integer display
+widths too (data_type is used instead of column_type), duplicate indexes count once.
+the checksum is at least as strict as the graph: servers with equal checksums
+have no diff, servers with different checksums may still have none (e.g. columns
+of unknown types, which the graph skips), so they are compared by graphs"""
+import hashlib
+
+from peewee_extension.migration.models_migration_table import SERVICE_TABLES
+
+# every column and index is hashed separately and the hashes are summed,
+# the sum doesn't depend on the order of rows and has no group_concat_max_len limit
+SCHEMA_CHECKSUM_SQL = """
+    SELECT COUNT(*),
+        SUM(CAST(CONV(SUBSTRING(h, 1, 15), 16, 10) AS UNSIGNED)),
+        SUM(CAST(CONV(SUBSTRING(h, 16, 15), 16, 10) AS UNSIGNED))
+    FROM (
+        SELECT MD5(CONCAT_WS(':', 'column', c.table_name, c.column_name,
+            CONCAT(c.data_type, IF(c.column_type LIKE '%%unsigned%%', ' unsigned', '')),
+            IF(c.data_type IN ('char', 'varchar'), c.character_maximum_length, ''),
+            IF(c.data_type = 'enum', c.column_type, ''),
+            c.is_nullable
+        )) AS h
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+            ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = %s AND t.table_type = 'BASE TABLE'
+            AND c.table_name NOT IN ({service_tables})
+        UNION ALL
+        SELECT MD5(CONCAT_WS(':', kind, table_name, non_unique, columns)) AS h
+        FROM (
+            SELECT DISTINCT
+                IF(index_name = 'PRIMARY', 'primary', 'index') AS kind, table_name,
+                MIN(non_unique) AS non_unique,
+                GROUP_CONCAT(column_name ORDER BY
+                    IF(index_name = 'PRIMARY', column_name, LPAD(seq_in_index, 4, '0'))
+                ) AS columns
+            FROM information_schema.statistics
+            WHERE table_schema = %s AND table_name NOT IN ({service_tables})
+            GROUP BY table_name, index_name
+        ) i
+    ) hashes
+""".format(service_tables=', '.join("'%s'" % table for table in SERVICE_TABLES))
+
+
+def get_schema_checksum(database) -> str:
+    """checksum of the schema of the database the connection is made to"""
+    schema = database.database
+    row = database.execute_sql(SCHEMA_CHECKSUM_SQL, (schema, schema)).fetchone()
+    description = ':'.join(str(int(value or 0)) for value in row)
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""static extraction of python models: the models module is parsed with ast instead
+of being imported, so the import chain of the application (settings, clients of
+services) is not executed. the model classes are rebuilt out of the parsed class
+definitions with the real peewee field classes, only peewee, playhouse, peewee_extension
+and standard library modules are imported, other modules of the application are parsed too.
+
+a construct which can't be resolved this way (a call of a function in a model, a statement
+executed on import which uses a model, a base class or a field class of an unknown module) raises
+Unresolvable, from_py.get_graph imports the module then"""
+import ast
+import builtins
+import importlib
+import importlib.util
+import operator
+import sys
+import sysconfig
+from pathlib import Path
+
+from peewee import SQL, Check, CompositeKey, Field, Model
+
+# modules which are imported while the models are parsed, besides the standard library,
+# peewee_extension gives EnumField
+IMPORTABLE_MODULES = ('peewee', 'playhouse', 'peewee_extension')
+# calls evaluated in the models source besides the constructors of fields
+ALLOWED_CALLS = (CompositeKey, SQL, Check)
+# Meta options which don't change the schema, they are not evaluated
+IGNORED_META_OPTIONS = ('database',)
+STDLIB_PATH = sysconfig.get_paths()['stdlib']
+BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: operator.pow, ast.BitOr: operator.or_,
+}
+
+
+class Unresolvable(Exception):
+    pass
+
+
+class Unresolved:
+    """a name bound to something the parser doesn't evaluate,
+    fails only if the name is used by a model"""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class LazyImport:
+    """an imported name, the module is imported or parsed when the name is used"""
+
+    def __init__(self, module_name: str, attr: str = None):
+        self.module_name = module_name
+        self.attr = attr
+
+    def resolve(self, parser):
+        module = parser.get_module(self.module_name)
+        if self.attr is None:
+            return module
+        return parser.get_attribute(module, self.attr)
+
+
+def find_source(module_name: str):
+    """path of the module source found on sys.path without importing its packages"""
+    parts = module_name.split('.')
+    for entry in sys.path:
+        base = Path(entry or '.').joinpath(*parts)
+        for path in (base.parent / (base.name + '.py'), base / '__init__.py'):
+            if path.is_file():
+                return path
+    return None
+
+
+def is_importable(module_name: str) -> bool:
+    top = module_name.split('.')[0]
+    if top in IMPORTABLE_MODULES or top in sys.builtin_module_names:
+        return True
+    stdlib_module_names = getattr(sys, 'stdlib_module_names', None)
+    if stdlib_module_names is not None:
+        return top in stdlib_module_names
+    spec = importlib.util.find_spec(top)
+    origin = spec and spec.origin or ''
+    return origin.startswith(STDLIB_PATH) and 'site-packages' not in origin
+
+
+def get_constant(node):
+    # ast.Str before python 3.8
+    return getattr(node, 'value', getattr(node, 's', None))
+
+
+def is_docstring(statement) -> bool:
+    return isinstance(statement, ast.Expr) and isinstance(get_constant(statement.value), str)
+
+
+def is_type_checking(test) -> bool:
+    name = getattr(test, 'id', None) or getattr(test, 'attr', None)
+    return name == 'TYPE_CHECKING'
+
+
+def is_main_check(test) -> bool:
+    return (
+        isinstance(test, ast.Compare) and getattr(test.left, 'id', None) == '__name__'
+        and len(test.comparators) == 1 and get_constant(test.comparators[0]) == '__main__'
+    )
+
+
+def is_model(value) -> bool:
+    return isinstance(value, type) and issubclass(value, Model)
+
+
+class StaticModule:
+    """namespace of a module built out of its source"""
+
+    def __init__(self, name: str, parser):
+        self.name = name
+        self.parser = parser
+        self.path = find_source(name)
+        if self.path is None:
+            raise Unresolvable('source of %s is not found' % name)
+        self.is_package = self.path.name == '__init__.py'
+        self.namespace = {}
+        # a star import of a module which can't be parsed, any unknown name may come from it
+        self.unresolved_star = None
+        tree = ast.parse(self.path.read_bytes(), str(self.path))
+        for statement in tree.body:
+            self.execute(statement)
+
+    def where(self, node) -> str:
+        return '%s line %s' % (self.path, getattr(node, 'lineno', '?'))
+
+    def get_package(self, level: int) -> str:
+        parts = self.name.split('.')
+        if not self.is_package:
+            parts = parts[:-1]
+        if level > 1:
+            parts = parts[:-(level - 1)]
+        return '.'.join(parts)
+
+    def execute(self, statement):
+        if isinstance(statement, ast.Import):
+            for alias in statement.names:
+                if alias.asname:
+                    self.namespace[alias.asname] = LazyImport(alias.name)
+                else:
+                    top = alias.name.split('.')[0]
+                    self.namespace[top] = LazyImport(top)
+        elif isinstance(statement, ast.ImportFrom):
+            module_name = statement.module or ''
+            if statement.level:
+                package = self.get_package(statement.level)
+                module_name = '.'.join(part for part in (package, module_name) if part)
+            for alias in statement.names:
+                if alias.name == '*':
+                    self.import_star(module_name)
+                else:
+                    self.namespace[alias.asname or alias.name] = LazyImport(
+                        module_name, alias.name,
+                    )
+        elif isinstance(statement, (ast.Assign, ast.AnnAssign)):
+            if statement.value is None:
+                return
+            targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+            try:
+                value = self.evaluate(statement.value)
+            except Unresolvable as error:
+                value = Unresolved(str(error))
+            for target in targets:
+                if not isinstance(target, ast.Name):
+                    raise Unresolvable('assignment to an attribute at %s' % self.where(statement))
+                self.namespace[target.id] = value
+        elif isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name):
+            self.namespace[statement.target.id] = Unresolved(
+                'changed at %s' % self.where(statement),
+            )
+        elif isinstance(statement, ast.ClassDef):
+            self.namespace[statement.name] = self.parser.build_class(self, statement)
+        elif isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            self.namespace[statement.name] = Unresolved(
+                '%s is a function' % statement.name,
+            )
+        elif isinstance(statement, ast.If) and (
+                is_type_checking(statement.test) or is_main_check(statement.test)):
+            for orelse_statement in statement.orelse:
+                self.execute(orelse_statement)
+        elif isinstance(statement, ast.Expr) and not self.uses_models(statement):
+            # db.connect() and the like don't change the schema, they are skipped
+            pass
+        elif not isinstance(statement, ast.Pass):
+            raise Unresolvable('statement executed on import at %s' % self.where(statement))
+
+    def uses_models(self, node) -> bool:
+        return any(
+            isinstance(child, ast.Name) and is_model(self.namespace.get(child.id))
+            for child in ast.walk(node)
+        )
+
+    def import_star(self, module_name: str):
+        try:
+            module = self.parser.get_module(module_name)
+        except Unresolvable as error:
+            self.unresolved_star = 'import * from %s: %s' % (module_name, error)
+            return
+        if isinstance(module, StaticModule):
+            names = module.namespace.get('__all__')
+            if not isinstance(names, (list, tuple)):
+                names = [name for name in module.namespace if not name.startswith('_')]
+            for name in names:
+                self.namespace[name] = LazyImport(module_name, name)
+            if module.unresolved_star:
+                self.unresolved_star = module.unresolved_star
+            return
+        names = getattr(module, '__all__', None)
+        if names is None:
+            names = [name for name in dir(module) if not name.startswith('_')]
+        for name in names:
+            self.namespace[name] = getattr(module, name)
+
+    def lookup(self, name: str, scope: dict = None):
+        if scope is not None and name in scope:
+            return scope[name]
+        if name not in self.namespace:
+            if self.unresolved_star:
+                raise Unresolvable('%s may come from %s' % (name, self.unresolved_star))
+            if hasattr(builtins, name):
+                return getattr(builtins, name)
+            raise Unresolvable('%s is not defined in %s' % (name, self.name))
+        value = self.namespace[name]
+        if isinstance(value, LazyImport):
+            value = value.resolve(self.parser)
+            self.namespace[name] = value
+        if isinstance(value, Unresolved):
+            raise Unresolvable('%s: %s' % (name, value.reason))
+        return value
+
+    def evaluate(self, node, scope: dict = None):
+        """value of an expression: literals, names, attributes and the calls of
+        field classes and ALLOWED_CALLS"""
+        try:
+            return ast.literal_eval(node)
+        except (ValueError, TypeError, SyntaxError):
+            pass
+        if isinstance(node, ast.Name):
+            return self.lookup(node.id, scope)
+        if isinstance(node, ast.Attribute):
+            return self.parser.get_attribute(self.evaluate(node.value, scope), node.attr)
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            if any(isinstance(element, ast.Starred) for element in node.elts):
+                raise Unresolvable('unpacking at %s' % self.where(node))
+            elements = [self.evaluate(element, scope) for element in node.elts]
+            if isinstance(node, ast.List):
+                return elements
+            return tuple(elements) if isinstance(node, ast.Tuple) else set(elements)
+        if isinstance(node, ast.Dict):
+            if any(key is None for key in node.keys):
+                raise Unresolvable('unpacking at %s' % self.where(node))
+            return {
+                self.evaluate(key, scope): self.evaluate(value, scope)
+                for key, value in zip(node.keys, node.values)
+            }
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            return BINARY_OPERATORS[type(node.op)](
+                self.evaluate(node.left, scope), self.evaluate(node.right, scope),
+            )
+        if isinstance(node, ast.Call):
+            return self.call(node, scope)
+        raise Unresolvable('%s at %s' % (type(node).__name__, self.where(node)))
+
+    def call(self, node, scope: dict = None):
+        function = self.evaluate(node.func, scope)
+        is_field = isinstance(function, type) and issubclass(function, Field)
+        if not is_field and function not in ALLOWED_CALLS:
+            raise Unresolvable('call of %r at %s' % (function, self.where(node)))
+        if any(isinstance(arg, ast.Starred) for arg in node.args) or any(
+                keyword.arg is None for keyword in node.keywords):
+            raise Unresolvable('unpacking at %s' % self.where(node))
+        args = [self.evaluate(arg, scope) for arg in node.args]
+        kwargs = {keyword.arg: self.evaluate(keyword.value, scope) for keyword in node.keywords}
+        try:
+            return function(*args, **kwargs)
+        except Exception as error:
+            raise Unresolvable('%s at %s' % (error, self.where(node))) from error
+
+
+class StaticParser:
+    """parses a models module and the modules of the application it imports from,
+    every module is parsed once"""
+
+    def __init__(self):
+        self.modules = {}
+
+    def get_module(self, module_name: str):
+        """an imported module of IMPORTABLE_MODULES or of the standard library,
+        StaticModule for other modules"""
+        if is_importable(module_name):
+            try:
+                return importlib.import_module(module_name)
+            except ImportError as error:
+                raise Unresolvable(str(error)) from error
+        if module_name in self.modules:
+            module = self.modules[module_name]
+            if module is None:
+                raise Unresolvable('circular import of %s' % module_name)
+            return module
+        self.modules[module_name] = None
+        try:
+            module = StaticModule(module_name, self)
+        except SyntaxError as error:
+            raise Unresolvable(str(error)) from error
+        finally:
+            self.modules.pop(module_name)
+        self.modules[module_name] = module
+        return module
+
+    def get_attribute(self, value, attr: str):
+        if isinstance(value, StaticModule):
+            try:
+                return value.lookup(attr)
+            except Unresolvable:
+                if find_source('%s.%s' % (value.name, attr)) is None:
+                    raise
+            return self.get_module('%s.%s' % (value.name, attr))
+        try:
+            return getattr(value, attr)
+        except AttributeError:
+            if isinstance(value, type(sys)):
+                # a submodule which is not imported by its package
+                return self.get_module('%s.%s' % (value.__name__, attr))
+            raise Unresolvable('%r has no attribute %s' % (value, attr))
+
+    def build_class(self, module: StaticModule, node: ast.ClassDef):
+        """model class rebuilt out of its definition, Unresolved for other classes"""
+        bases = [module.evaluate(base) for base in node.bases]
+        if not any(is_model(base) for base in bases):
+            return Unresolved('%s is not a model' % node.name)
+        if node.decorator_list or node.keywords:
+            raise Unresolvable('model %s has decorators or metaclass' % node.name)
+        attrs = {'__module__': module.name, '__qualname__': node.name}
+        for statement in node.body:
+            if isinstance(statement, ast.ClassDef) and statement.name == 'Meta':
+                attrs['Meta'] = type('Meta', (), self.get_meta_options(module, statement))
+            elif isinstance(statement, (ast.Assign, ast.AnnAssign)):
+                if statement.value is None:
+                    continue
+                if isinstance(statement, ast.Assign):
+                    targets = statement.targets
+                else:
+                    targets = [statement.target]
+                value = module.evaluate(statement.value, attrs)
+                for target in targets:
+                    if not isinstance(target, ast.Name):
+                        raise Unresolvable('assignment at %s' % module.where(statement))
+                    attrs[target.id] = value
+            elif not (
+                    isinstance(statement, (
+                        ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Pass,
+                    )) or is_docstring(statement)):
+                raise Unresolvable('statement in model %s at %s' % (
+                    node.name, module.where(statement),
+                ))
+        try:
+            return type(node.name, tuple(bases), attrs)
+        except Exception as error:
+            raise Unresolvable('model %s: %s' % (node.name, error)) from error
+
+    @staticmethod
+    def get_meta_options(module: StaticModule, node: ast.ClassDef) -> dict:
+        options = {}
+        for statement in node.body:
+            if isinstance(statement, ast.Assign) and all(
+                    isinstance(target, ast.Name) for target in statement.targets):
+                names = [target.id for target in statement.targets]
+                if all(name in IGNORED_META_OPTIONS for name in names):
+                    continue
+                value = module.evaluate(statement.value)
+                options.update(dict.fromkeys(names, value))
+            elif not (isinstance(statement, ast.Pass) or is_docstring(statement)):
+                raise Unresolvable('statement in Meta at %s' % module.where(statement))
+        return options
+
+
+def get_namespace(module_name: str) -> dict:
+    """models and the other resolved names of the module by name, as dir() of
+    the imported module would give them"""
+    module = StaticParser().get_module(module_name)
+    if not isinstance(module, StaticModule):
+        raise Unresolvable('%s is not parsed' % module_name)
+    return {
+        name: value for name, value in module.namespace.items()
+        if not isinstance(value, (LazyImport, Unresolved))
+    }
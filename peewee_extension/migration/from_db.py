@@ -2,15 +2,17 @@
 """module to build a graph out of a database"""
 from peewee import ForeignKeyField
 from peewee_extension.core import MxMySQLMetadata
-from peewee_extension.migration import graph
+from peewee_extension.migration import cache, graph, shards, table_filter
+from peewee_extension.migration.models_migration_table import SERVICE_TABLES
 from playhouse.db_url import connect
 from playhouse.reflection import Introspector, UnknownField
 
 
-def make_introspector(db_url, schema=None) -> Introspector:
-    """function that connects to a database and gets all the metainformation from it"""
+def make_introspector(db_url, schema=None, batched=True, tables=None) -> Introspector:
+    """function that connects to a database and gets all the metainformation from it,
+    with batched=True the whole schema is read in a few information_schema queries"""
     database = connect(db_url)
-    meta = MxMySQLMetadata(database)
+    meta = MxMySQLMetadata(database, batched=batched, tables=tables)
     return Introspector(metadata=meta, schema=schema)
 
 
@@ -26,53 +28,138 @@ def get_primary_key_from_indexes(indexes: list) -> list:
     return None
 
 
-def get_graph(db_url, tables=None) -> graph.DbNode:
-    """function connects to a database, makes introspection and then builds
-    a database graph (look graph.py) out of introspector
-    returns object of type DbNode (look graph.py)"""
-    introspector = make_introspector(db_url)
+def build_tables(introspector: Introspector, tables=None) -> dict:
+    """function makes introspection and builds TableNode's (look graph.py)
+    for the given tables and the tables they reference by foreign keys,
+    returns dict table_name -> TableNode"""
     database = introspector.introspect(table_names=tables)
-    seen = set()
     tabs = {}
     for table in sorted(database.model_names.keys()):
         has_foreign_keys = False
-        if table == 'pe_migrations':
+        if table in SERVICE_TABLES:
             continue
-        if table not in seen:
-            if not tables or table in tables:
-                cols = {}
-
-                columns = database.columns[table].items()
-
-                indexes = []
-                #  print(table)
-                for index in database.indexes[table]:
-
-                    #  print('         ', index.name, index)
-                    if index.name != 'PRIMARY':
-                        curr_index = graph.IndexNode(index.columns, index.unique)
-                        indexes.append(curr_index)
-                primary_key = get_primary_key_from_indexes(database.indexes[table])
-                primary_key = graph.PrimaryKeyNode(primary_key)
-                for name, column in columns:
-                    curr = graph.ColumnNode(
-                        name=name,
-                        refl_column=column,
-
-                    )
-                    if column.field_class == UnknownField:
-                        continue
-                    if column.field_class == ForeignKeyField:
-                        has_foreign_keys = True
-
-                    cols[name] = curr
-
-                curr = graph.TableNode(
-                    table, primary_key=primary_key, columns=cols, indexes=indexes,
-                    model=database.model_names[table], has_foreign_keys=has_foreign_keys
-                )
-                #print(curr.name, curr.primary_key.columns)
-                tabs[curr.name] = curr
-    db1 = graph.DbNode(tabs)
+        cols = {}
+
+        columns = database.columns[table].items()
+
+        indexes = []
+        for index in database.indexes[table]:
+            if index.name != 'PRIMARY':
+                curr_index = graph.IndexNode(index.columns, index.unique, name=index.name)
+                indexes.append(curr_index)
+        primary_key = get_primary_key_from_indexes(database.indexes[table])
+        primary_key = graph.PrimaryKeyNode(primary_key)
+        for name, column in columns:
+            curr = graph.ColumnNode(
+                name=name,
+                refl_column=column,
+
+            )
+            if column.field_class == UnknownField:
+                continue
+            if column.field_class == ForeignKeyField:
+                has_foreign_keys = True
+
+            cols[name] = curr
+
+        curr = graph.TableNode(
+            table, primary_key=primary_key, columns=cols, indexes=indexes,
+            model=database.model_names[table], has_foreign_keys=has_foreign_keys
+        )
+        tabs[curr.name] = curr
+    return tabs
+
+
+def get_graph(db_url, tables=None, batched=True, cache_dir=None) -> graph.DbNode:
+    """function connects to a database, makes introspection and then builds
+    a database graph (look graph.py) out of introspector
+    returns object of type DbNode (look graph.py)
+    with cache_dir only the tables changed since the previous run are introspected.
+    tables - names or patterns (look table_filter.py), only the matching tables and
+    the tables they reference by foreign keys are introspected"""
+    if cache_dir is not None:
+        return get_cached_graph(db_url, cache_dir, tables=tables, batched=batched)
+    introspector = make_introspector(db_url, batched=batched)
+    if tables:
+        tables = select_tables(introspector, tables)
+        if not tables:
+            return graph.DbNode({})
+        introspector.metadata.tables = tables
+    db1 = graph.DbNode(build_tables(introspector, tables))
 
     return db1
+
+
+def select_tables(introspector: Introspector, tables) -> list:
+    """names of the tables matching the filter, with patterns the tables of the database
+    are listed with get_tables() on the connection of the same introspector.
+    playhouse lists the tables again in introspect(), both are one information_schema
+    query, the columns, indexes and foreign keys are read only for the selected tables"""
+    tables_filter = table_filter.TableFilter(tables)
+    if not tables_filter.has_patterns:
+        return sorted(tables_filter.names)
+    return tables_filter.select(introspector.metadata.database.get_tables())
+
+
+def get_cached_graph(db_url, cache_dir, tables=None, batched=True) -> graph.DbNode:
+    """function builds a database graph using the on-disk snapshot cache (look cache.py),
+    tables whose stamp in information_schema has changed are introspected again.
+    with tables only the matching tables and the tables they reference are taken.
+    the stamps are read at most twice and the stale tables are introspected in one call,
+    however long the chains of foreign keys are"""
+    introspector = make_introspector(db_url, batched=batched)
+    # одноименные базы разных серверов не должны делить один файл кэша
+    schema_cache = cache.SchemaCache(cache_dir, shards.get_shard_dirname(db_url))
+    database = introspector.metadata.database
+    tables_filter = table_filter.TableFilter(tables or [])
+
+    def get_cached_references(table):
+        table_node = schema_cache.get(table)
+        return table_filter.get_references(table_node) if table_node is not None else ()
+
+    scan_all = not tables or tables_filter.has_patterns
+    if scan_all:
+        stamps = schema_cache.get_table_stamps(database)
+        selected = tables_filter.select(stamps) if tables else list(stamps)
+    else:
+        # без шаблонов в фильтре штампы читаются только для перечисленных таблиц
+        # и таблиц, на которые они ссылаются по данным кэша
+        stamps = schema_cache.get_table_stamps(
+            database, table_filter.expand(tables_filter.names, get_cached_references),
+        )
+        selected = sorted(tables_filter.names & stamps.keys())
+
+    stale = set()
+
+    def get_references(table):
+        if table not in stamps:
+            return ()
+        if schema_cache.get_stale_tables({table: stamps[table]}):
+            stale.add(table)
+            return ()
+        return get_cached_references(table)
+
+    needed = table_filter.expand(selected, get_references)
+    if stale:
+        introspector.metadata.tables = sorted(stale)
+        # playhouse добавляет таблицы, на которые ссылаются перечитанные, в тот же вызов
+        fresh = build_tables(introspector, sorted(stale))
+        missing = fresh.keys() - stamps.keys()
+        if missing and not scan_all:
+            stamps.update(schema_cache.get_table_stamps(database, missing))
+        for table in stale | fresh.keys():
+            if table in stamps:
+                schema_cache.put(table, stamps[table], fresh.get(table))
+        needed |= table_filter.expand(
+            stale, lambda table: table_filter.get_references(fresh[table])
+            if table in fresh else (),
+        )
+    if not tables:
+        schema_cache.retain(stamps.keys())
+    schema_cache.save()
+    tabs = {}
+    for table in sorted(needed & stamps.keys()):
+        table_node = schema_cache.get(table)
+        if table_node is not None:
+            tabs[table] = table_node
+    return graph.DbNode(tabs)
@@ -1,27 +1,272 @@
 # -*- coding: utf-8 -*-
+import ast
 import importlib
+import importlib.util
+import multiprocessing
+import pkgutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
 from peewee import CompositeKey, Field, ForeignKeyField, ForeignKeyMetadata
-from peewee_extension.migration import graph
+from peewee_extension.migration import cache, from_ast, graph, snapshot, table_filter
+from peewee_extension.migration.models_migration_table import SERVICE_TABLES
 from playhouse.reflection import Column
 
 
-def get_graph(module_name: str):
+def make_refl_column(table_attr: Field) -> Column:
+    """function that describes a model field as playhouse.reflection.Column,
+    used by ColumnNode when the column is needed for code generation"""
+    table_name = table_attr.model._meta.table_name
+    is_primary_key = table_attr.primary_key
+    if hasattr(table_attr, 'max_length'):
+        extra = {}
+
+        extra['max_length'] = table_attr.max_length
+        refl_column = Column(
+            name=table_attr.column_name,
+            column_name=table_attr.column_name,
+            default=table_attr.default,
+            nullable=table_attr.null,
+            raw_column_type=table_attr.field_type,
+            field_class=type(table_attr),
+            extra_parameters=extra,
+            index=table_attr.index,
+            unique=table_attr.unique,
+            primary_key=is_primary_key,
+        )
+    else:
+        refl_column = Column(
+            name=table_attr.column_name,
+            nullable=table_attr.null,
+            column_name=table_attr.column_name,
+            default=table_attr.default,
+            raw_column_type=table_attr.field_type,
+            field_class=type(table_attr),
+            index=table_attr.index,
+            unique=table_attr.unique,
+            primary_key=is_primary_key,
+        )
+    if isinstance(table_attr, ForeignKeyField):
+        model_names = {
+            table_name: table_attr.model.__name__,
+            table_attr.rel_model._meta.table_name: table_attr.rel_model.__name__,
+        }
+        foreign_key_meta = ForeignKeyMetadata(
+            column=table_attr.column_name,
+            dest_table=table_attr.rel_model._meta.table_name,
+            dest_column=table_attr.rel_field.column_name, table=table_name,
+
+        )
+
+        refl_column.set_foreign_key(foreign_key=foreign_key_meta, model_names=model_names)
+
+    if hasattr(table_attr, 'values'):
+        refl_column.extra_parameters = {'values': getattr(table_attr, 'values')}
+    return refl_column
+
+
+def import_namespace(module_name: str) -> dict:
     try:
         module = importlib.import_module(module_name)
     except ImportError as exception:
         print('Failure in improting', module_name)
         raise Exception(exception)
+    return {attr_name: getattr(module, attr_name) for attr_name in dir(module)}
+
+
+def get_package_modules(module_name: str) -> dict:
+    """module name -> source path of the module and, if it is a package, of all
+    its submodules, they are found without importing the package if possible.
+    a module without source (made at runtime) has None"""
+    source = from_ast.find_source(module_name)
+    if source is None:
+        try:
+            spec = importlib.util.find_spec(module_name)
+        except ValueError:
+            # a module made at runtime has no spec
+            spec = None
+        if spec is None or not spec.origin:
+            if module_name in sys.modules:
+                return {module_name: None}
+            raise Exception('Failed to find models %s' % module_name)
+        source = Path(spec.origin)
+    modules = {module_name: source}
+    if source.name != '__init__.py':
+        return modules
+    for module_info in pkgutil.iter_modules([str(source.parent)]):
+        modules.update(get_package_modules('%s.%s' % (module_name, module_info.name)))
+    return modules
+
+
+def get_local_imports(module_name: str, source: Path, modules: dict) -> set:
+    """modules of the package imported by the module and their parent packages,
+    found in the module source"""
+    package = module_name if source.name == '__init__.py' else module_name.rpartition('.')[0]
+    imported = set()
+    for node in ast.walk(ast.parse(source.read_bytes(), str(source))):
+        if isinstance(node, ast.Import):
+            imported.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                parts = package.split('.')
+                parts = parts[:len(parts) - node.level + 1]
+                base = '.'.join(part for part in ('.'.join(parts), base) if part)
+            imported.add(base)
+            imported.update('%s.%s' % (base, alias.name) for alias in node.names)
+    local = set()
+    for name in imported | {module_name}:
+        parts = name.split('.')
+        local.update(
+            '.'.join(parts[:length]) for length in range(1, len(parts) + 1)
+            if '.'.join(parts[:length]) in modules
+        )
+    return local
+
+
+def get_dependencies(module_name: str, modules: dict, local_imports: dict) -> set:
+    """the module and the package modules it imports directly or through others,
+    its graph depends on all of them (base models, models of foreign keys)"""
+    dependencies = set()
+    pending = [module_name]
+    while pending:
+        name = pending.pop()
+        if name in dependencies:
+            continue
+        dependencies.add(name)
+        if name not in local_imports:
+            local_imports[name] = get_local_imports(name, modules[name], modules)
+        pending.extend(local_imports[name] - dependencies)
+    return dependencies
+
+
+def extract_module(module_name: str, static: bool = False, sys_path: list = None) -> dict:
+    """graph of one module as a dict (look snapshot.dump_graph), runs in a worker process"""
+    if sys_path is not None:
+        sys.path[:] = sys_path
+    return snapshot.dump_graph(get_module_graph(module_name, static=static))
+
+
+def extract_modules(module_names: list, static: bool = False, jobs: int = 4) -> dict:
+    """module name -> graph dict, modules are extracted in at most jobs worker processes.
+    the workers are spawned, not forked: the database may be introspected in another
+    thread at the same time (look generator.MigrationGenerator.generate).
+    an error of any module is raised as soon as it happens"""
+    if jobs <= 1 or len(module_names) <= 1:
+        return {name: extract_module(name, static) for name in module_names}
+    executor = ProcessPoolExecutor(
+        max_workers=min(jobs, len(module_names)),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+    futures = {
+        executor.submit(extract_module, name, static, list(sys.path)): name
+        for name in module_names
+    }
+    try:
+        graphs = {futures[future]: future.result() for future in as_completed(futures)}
+    except BaseException:
+        # первая ошибка пробрасывается сразу, модули в очереди не извлекаются
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        raise
+    executor.shutdown()
+    return {name: graphs[name] for name in module_names}
 
-    tables = {}
-    columns = {}
-    if hasattr(module, 'ABSTRACT_MODELS'):
-        abstract_models = module.ABSTRACT_MODELS
-    else:
-        abstract_models = []
 
-    for attr_name in dir(module):
-        attr = getattr(module, attr_name)
+def get_graph(
+        module_name: str, static: bool = False, cache_dir=None, jobs: int = 4, tables=None,
+):
+    """graph of the models of a module or of all the modules of a package.
+    modules of a package are extracted in parallel worker processes, with cache_dir
+    their graphs are cached (look cache.ModelsCache) and only edited modules are
+    extracted again. static - look get_module_graph.
+    tables - names or patterns (look table_filter.py), the graph has only the matching
+    tables and the tables they reference by foreign keys"""
+    modules = get_package_modules(module_name)
+    if len(modules) == 1 and (cache_dir is None or modules[module_name] is None):
+        return get_module_graph(module_name, static=static, tables=tables)
+
+    models_cache = cache.ModelsCache(cache_dir, module_name) if cache_dir else None
+    graphs = {}
+    for name in modules:
+        data = models_cache.get(name) if models_cache else None
+        if data is not None:
+            graphs[name] = data
+    stale = sorted(set(modules) - set(graphs))
+    if models_cache:
+        # sources are stamped before the extraction, an edit made meanwhile is seen next time
+        local_imports = {}
+        stamps = {
+            name: {
+                str(modules[dependency]): cache.get_source_stamp(modules[dependency])
+                for dependency in get_dependencies(name, modules, local_imports)
+            }
+            for name in stale
+        }
+    if stale:
+        print('Extracting models of', len(stale), 'of', len(modules), 'modules')
+    for name, data in extract_modules(stale, static=static, jobs=jobs).items():
+        graphs[name] = data
+        if models_cache:
+            models_cache.put(name, stamps[name], data)
+    if models_cache:
+        models_cache.retain(modules)
+        models_cache.save()
+
+    # модули кэшируются целиком, фильтр применяется при сборке графа
+    tables_data = {}
+    owners = {}
+    for name in sorted(graphs):
+        for table_name, table_data in graphs[name]['tables'].items():
+            if table_name in tables_data:
+                raise Exception(
+                    'Table %s is defined in %s and %s' % (table_name, owners[table_name], name),
+                )
+            tables_data[table_name] = table_data
+            owners[table_name] = name
+    selected = tables_data.keys()
+    if tables:
+        selected = table_filter.expand(
+            table_filter.TableFilter(tables).select(tables_data),
+            lambda table_name: snapshot.get_table_references(tables_data[table_name])
+            if table_name in tables_data else (),
+        ) & tables_data.keys()
+    return graph.DbNode({
+        table_name: snapshot.load_table(table_name, tables_data[table_name])
+        for table_name in sorted(selected)
+    })
+
+
+def get_module_graph(module_name: str, static: bool = False, tables=None):
+    """static: the models are parsed out of the module source without importing it
+    (look from_ast.py), the module is imported if they can't be resolved this way.
+    tables - look get_models_graph"""
+    namespace = None
+    if static:
+        try:
+            namespace = from_ast.get_namespace(module_name)
+        except from_ast.Unresolvable as error:
+            print('Failure in parsing', module_name, '-', error, '- importing it')
+    if namespace is None:
+        namespace = import_namespace(module_name)
+    return get_models_graph(module_name, namespace, tables=tables)
+
+
+def get_field_order(field: Field) -> str:
+    """columns are kept in the order of the names of model attributes, a foreign key
+    is also reachable by its object id name (author and author_id)"""
+    return min(field.name, getattr(field, 'object_id_name', None) or field.name)
+
+
+def get_models(module_name: str, namespace: dict) -> dict:
+    """table name -> model for the models of the module"""
+    models = {}
+    abstract_models = namespace.get('ABSTRACT_MODELS') or []
+
+    for attr_name in sorted(namespace):
+        attr = namespace[attr_name]
         if not isinstance(attr, type):
             continue
         if not hasattr(attr, '_meta'):
@@ -35,8 +280,29 @@ def get_graph(module_name: str):
         if len(attr._meta.columns.keys()) < 2:
             continue
         table_name = getattr(attr._meta, 'table_name')
-        if table_name == 'pe_migrations':
+        if table_name in SERVICE_TABLES or table_name == 'basemodel':
             continue
+        models[table_name] = attr
+    return models
+
+
+def get_models_graph(module_name: str, namespace: dict, tables=None):
+    """graph of the models of the module, namespace - names of the module by name.
+    tables - names or patterns (look table_filter.py), only the matching models
+    and the models they reference by foreign keys are extracted"""
+    models = get_models(module_name, namespace)
+    if tables:
+        selected = table_filter.expand(
+            table_filter.TableFilter(tables).select(models),
+            lambda table_name: {
+                rel_model._meta.table_name for rel_model in models[table_name]._meta.refs.values()
+            } if table_name in models else (),
+        )
+        models = {
+            table_name: attr for table_name, attr in models.items() if table_name in selected
+        }
+    tables = {}
+    for table_name, attr in models.items():
         indexes = getattr(attr._meta, 'indexes')
         # if indexes:
         #   print(indexes)
@@ -50,93 +316,38 @@ def get_graph(module_name: str):
         if isinstance(primary_key, Field):
             temp = [primary_key.column_name.lower()]
             primary_key = graph.PrimaryKeyNode(temp)
-        # indexes.append(attr.id)
         indexes_list = []
-        for index in indexes:
-            curr_index_list = []
-            for field_name in index[0]:
-                curr_index_list.append(getattr(attr, field_name).column_name)
-            # print(curr_index_list)
-            # print(list(index[0]))
-            curr_index = graph.IndexNode(curr_index_list, unique=index[1])
-            indexes_list.append(curr_index)
-        # for i in indexes_list:
-        #    print(i.indexes, i.unique, i.mode)
-        if table_name == 'basemodel':
-            continue
+        for field_names, unique in indexes:
+            curr_index_list = [getattr(attr, field_name).column_name for field_name in field_names]
+            indexes_list.append(graph.IndexNode(curr_index_list, unique=unique))
         model = attr.__name__
         columns = {}
-        has_foreign_keys = False
-        for table_attr_name in dir(attr):
-            foreign_key_meta = None
-            table_attr = getattr(attr, table_attr_name)
-            if not isinstance(table_attr, Field):
-                continue
-            if isinstance(table_attr, CompositeKey):
-                continue
-            if table_attr.column_name not in attr._meta.columns:
-                continue
+        refs = attr._meta.refs
+        for table_attr in sorted(attr._meta.sorted_fields, key=get_field_order):
             if table_attr.index or table_attr.unique:
                 indexes_list.append(graph.IndexNode([table_attr.column_name], table_attr.unique))
-            is_primary_key = table_attr.primary_key
-            if hasattr(table_attr, 'max_length'):
-                extra = {}
-
-                extra['max_length'] = table_attr.max_length
-                refl_column = Column(
-                    name=table_attr.column_name,
-                    column_name=table_attr.column_name,
-                    default=table_attr.default,
-                    nullable=table_attr.null,
-                    raw_column_type=table_attr.field_type,
-                    field_class=type(table_attr),
-                    extra_parameters=extra,
-                    index=table_attr.index,
-                    unique=table_attr.unique,
-                    primary_key=is_primary_key,
-                )
-            else:
-                refl_column = Column(
-                    name=table_attr.column_name,
-                    nullable=table_attr.null,
-                    column_name=table_attr.column_name,
-                    default=table_attr.default,
-                    raw_column_type=table_attr.field_type,
-                    field_class=type(table_attr),
-                    index=table_attr.index,
-                    unique=table_attr.unique,
-                    primary_key=is_primary_key,
-                )
-            if isinstance(table_attr, ForeignKeyField):
-                model_names = {
-                    table_name: attr_name,
-                    table_attr.rel_model._meta.table_name: table_attr.rel_model.__name__,
-                }
-                has_foreign_keys = True
-                foreign_key_meta = ForeignKeyMetadata(
-                    column=table_attr_name,
-                    dest_table=table_attr.rel_model._meta.table_name,
-                    dest_column=table_attr.rel_field.column_name, table=table_name,
-
-                )
-
-                refl_column.set_foreign_key(foreign_key=foreign_key_meta, model_names=model_names)
-
+            field_class = type(table_attr)
+            dest_table = None
+            if table_attr in refs:
+                field_class = ForeignKeyField
+                dest_table = refs[table_attr]._meta.table_name
             if hasattr(table_attr, 'values'):
-                refl_column.extra_parameters = {'values': getattr(table_attr, 'values')}
-            columns[table_attr.column_name] = graph.ColumnNode(
-                table_attr.column_name,
-                refl_column=refl_column,
-
+                max_length = None
+                enum_values = getattr(table_attr, 'values')
+            else:
+                max_length = getattr(table_attr, 'max_length', None)
+                enum_values = None
+            columns[table_attr.column_name] = graph.ColumnNode.lazy(
+                table_attr.column_name, make_refl_column, table_attr, field_class, table_attr.null,
+                max_length=max_length, enum_values=enum_values, dest_table=dest_table,
+                raw_column_type=table_attr.field_type,
             )
 
         tables[table_name] = graph.TableNode(
             name=table_name, primary_key=primary_key, columns=columns, model=model,
-            indexes=indexes_list, has_foreign_keys=has_foreign_keys,
+            indexes=indexes_list, has_foreign_keys=bool(refs),
         )
 
-        tables[table_name].get_model()
-
         # print(tables[table_name].indexes)
     db2 = graph.DbNode(tables)
 
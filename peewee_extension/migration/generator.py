@@ -1,16 +1,51 @@
 # -*- coding: utf-8 -*-
-from peewee_extension.migration import from_db, from_py, script
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from peewee_extension.migration import cost, from_db, from_py, script, snapshot, table_filter
+from peewee_extension.utils import get_db_name
+from playhouse.db_url import connect
+
+
+def check_blocking_changes(diff_graph):
+    """raises if some change of the diff graph needs a blocking table copy"""
+    blocking_changes = diff_graph.get_blocking_changes()
+    if blocking_changes:
+        raise Exception(
+            'Changes need ALGORITHM=COPY and block writes: ' + ', '.join(blocking_changes),
+        )
+
+
+def timed(timings: dict, phase: str, function, *args, **kwargs):
+    """calls function and records its time in seconds as timings[phase]"""
+    started = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        timings[phase] = time.perf_counter() - started
+
+
+def format_timings(timings: dict) -> str:
+    return ', '.join(f'{phase} {seconds:.2f} s' for phase, seconds in timings.items())
 
 
 class MigrationGenerator:
 
     def __init__(
             self, db_url: str, models: str, make_empty_migration: bool = False,
+            schema_cache: str = None, no_copy: bool = False, online_rebuild: bool = False,
+            static_models: bool = False, jobs: int = 4,
     ):
         self.db_url = db_url
         self.models = models
         self.make_empty_migration = make_empty_migration
-        self.script: str = ''
+        self.schema_cache = schema_cache
+        self.no_copy = no_copy
+        self.online_rebuild = online_rebuild
+        self.static_models = static_models
+        self.jobs = jobs
+        self.diff_graph = None
+        self.timings = {}
 
     def get_db_url(self):
         return self.db_url
@@ -20,28 +55,107 @@ class MigrationGenerator:
 
     def get_db_name(self) -> str:
         """function to get database name out of db_url"""
-        temp = self.db_url.split('/')
-        return temp[-1]
+        if snapshot.is_snapshot(self.db_url):
+            return snapshot.get_snapshot_name(self.db_url)
+        return get_db_name(self.db_url)
 
     def get_script_name(self):
         pass  # sdelat
 
-    def generate(self, only_tables: list = None):
-        source_graph = from_db.get_graph(self.db_url)
-        target_graph = from_py.get_graph(self.models)
+    def get_source_graph(self, tables: list = None):
+        """graph of the database, db_url may point to a snapshot file (look snapshot.py).
+        tables - names or patterns (look table_filter.py), only the matching tables
+        and the tables they reference are introspected"""
+        if snapshot.is_snapshot(self.db_url):
+            return snapshot.load(self.db_url)
+        return from_db.get_graph(self.db_url, tables=tables, cache_dir=self.schema_cache)
+
+    def get_target_graph(self, tables: list = None):
+        """graph of the models, models may point to a snapshot file (look snapshot.py),
+        with static_models the models module is parsed instead of imported (look from_ast.py).
+        modules of a models package are extracted by jobs processes and cached in schema_cache.
+        tables - look get_source_graph"""
+        if snapshot.is_snapshot(self.models):
+            return snapshot.load(self.models)
+        return from_py.get_graph(
+            self.models, static=self.static_models, cache_dir=self.schema_cache, jobs=self.jobs,
+            tables=tables,
+        )
+
+    def generate(self, only_tables: list = None, source_graph=None):
+        """source_graph may be given if the database is already introspected.
+        only_tables - names or patterns (look table_filter.py), the graphs are built
+        only for the matching tables and the tables they reference.
+        the database is introspected in a thread while the models are loaded,
+        the time of every phase is kept in timings.
+        an error of the models is raised without waiting for the introspection"""
+        self.timings = {}
+        started = time.perf_counter()
+        if source_graph is None:
+            # интроспекция ждет ответов БД, модели импортируются в основном потоке
+            executor = ThreadPoolExecutor(max_workers=1)
+            source_future = executor.submit(
+                timed, self.timings, 'source', self.get_source_graph, tables=only_tables,
+            )
+            try:
+                target_graph = timed(
+                    self.timings, 'target', self.get_target_graph, tables=only_tables,
+                )
+            except BaseException:
+                # ошибка моделей не ждет конца интроспекции
+                source_future.cancel()
+                executor.shutdown(wait=False)
+                raise
+            source_graph = source_future.result()
+            executor.shutdown()
+        else:
+            target_graph = timed(
+                self.timings, 'target', self.get_target_graph, tables=only_tables,
+            )
         if self.make_empty_migration:
-            diff_graph = None
+            self.diff_graph = None
         else:
-            diff_graph = source_graph.get_diff(other=target_graph, only_tables=only_tables)
-        self.script = script.make(
-            diff_graph, self.models,
+            if only_tables:
+                only_tables = table_filter.TableFilter(only_tables).select(
+                    source_graph.tables.keys() | target_graph.tables.keys(),
+                )
+                if not only_tables:
+                    raise Exception('No tables match only_tables')
+            self.diff_graph = timed(
+                self.timings, 'diff', source_graph.get_diff,
+                other=target_graph, only_tables=only_tables,
+            )
+            if self.no_copy and not self.online_rebuild:
+                check_blocking_changes(self.diff_graph)
+        self.timings['total'] = time.perf_counter() - started
+
+    def estimate_cost(self) -> dict:
+        """cost report of the migration (look cost.py), a snapshot file has no
+        table statistics so its tables are estimated as empty"""
+        table_stats = {}
+        if not snapshot.is_snapshot(self.db_url):
+            database = connect(self.db_url)
+            try:
+                table_stats = cost.get_table_stats(database, list(self.diff_graph.tables))
+            finally:
+                database.close()
+        return cost.estimate(self.diff_graph, table_stats)
+
+    def iter_script(self):
+        """yields the migration script part by part (look script.iter_script)"""
+        return script.iter_script(
+            self.diff_graph, self.models, online_rebuild=self.online_rebuild,
             #  'peewee_extension/migration/templates/migration_template.j2',
             #  'peewee_extension/migration/templates/table_model_template.j2',
         )
 
+    @property
+    def script(self) -> str:
+        return ''.join(self.iter_script())
+
     def write_in_file(self, migrations_path, migration_name: str = None):
         db_name = self.get_db_name()
         filename = script.write_in_file(
-            migrations_path, db_name, self.script, migration_name,
+            migrations_path, db_name, self.iter_script(), migration_name,
         )
         return filename
@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
-from peewee import AutoField, IntegerField
+import copy
+import hashlib
+import heapq
+from collections import deque
+
+from peewee import AutoField, ForeignKeyField, IntegerField
 from peewee_extension.core import EnumField
+from playhouse.migrate import make_index_name
 from playhouse.reflection import Column, UnknownField
 
 
@@ -11,8 +17,62 @@ def get_key(my_dict, wanted_value):
             return key
 
 
+def sort_tables(graph: dict) -> tuple:
+    """function that orders tables of a foreign keys graph (table -> set of referenced
+    tables) so that referenced tables go first, Kahn's algorithm, O(V+E).
+    self references and references to tables outside the graph are ignored.
+    returns (order, deferred), deferred is a list of (table, referenced table) edges
+    that were dropped to break reference cycles"""
+    position = {table: i for i, table in enumerate(graph)}
+    dependencies = {
+        table: {dest for dest in refs if dest in position and dest != table}
+        for table, refs in graph.items()
+    }
+    dependents = {table: [] for table in graph}
+    for table, refs in dependencies.items():
+        for dest in refs:
+            dependents[dest].append(table)
+
+    order = []
+    deferred = []
+    ready = [position[table] for table, refs in dependencies.items() if not refs]
+    heapq.heapify(ready)
+    tables = list(graph)
+    while len(order) != len(tables):
+        if not ready:
+            table, dest = find_cycle_edge(dependencies, tables, position, order)
+            deferred.append((table, dest))
+            dependencies[table].discard(dest)
+            dependents[dest].remove(table)
+            if not dependencies[table]:
+                heapq.heappush(ready, position[table])
+            continue
+        table = tables[heapq.heappop(ready)]
+        order.append(table)
+        for dependent in dependents[table]:
+            dependencies[dependent].discard(table)
+            if not dependencies[dependent]:
+                heapq.heappush(ready, position[dependent])
+    return order, deferred
+
+
+def find_cycle_edge(dependencies: dict, tables: list, position: dict, order: list) -> tuple:
+    """function that finds a reference cycle among the tables which are not ordered yet
+    and returns the edge which closes it"""
+    placed = set(order)
+    start = min((table for table in tables if table not in placed), key=position.get)
+    path = [start]
+    visited = {start: 0}
+    while True:
+        dest = min(dependencies[path[-1]], key=position.get)
+        if dest in visited:
+            return path[-1], dest
+        visited[dest] = len(path)
+        path.append(dest)
+
+
 class Node:
-    pass
+    __slots__ = ()
 
 
 MODE_NONE = 0
@@ -22,8 +82,37 @@ MODE_MODIFY = 3
 MODE_RENAME = 4
 MODE_STUB = 5
 
+REVERSED_MODES = {MODE_ADD: MODE_DELETE, MODE_DELETE: MODE_ADD}
+
+# алгоритмы online DDL MySQL 8, от самого дешевого к самому дорогому
+ALGORITHM_INSTANT = 'INSTANT'
+ALGORITHM_INPLACE = 'INPLACE'
+ALGORITHM_COPY = 'COPY'
+ALGORITHMS = (ALGORITHM_INSTANT, ALGORITHM_INPLACE, ALGORITHM_COPY)
+# INSTANT allows only the default lock, COPY can't be done without blocking writes
+ALGORITHM_LOCKS = {ALGORITHM_INSTANT: None, ALGORITHM_INPLACE: 'NONE', ALGORITHM_COPY: 'SHARED'}
+# varchar keeps the length in 1 byte up to 255 bytes, that is 63 chars of utf8mb4
+VARCHAR_SHORT_MAX_LENGTH = 63
+ENUM_MAX_VALUES = 255
+# типы первичных ключей моделей, под которыми они хранятся в MySQL
+FOREIGN_KEY_SQL_TYPES = {'INTEGER': 'INT', 'AUTO': 'INT', 'BIGAUTO': 'BIGINT', 'UUID': 'VARCHAR'}
+
+
+def get_costliest_algorithm(algorithms) -> str:
+    """the algorithm of an ALTER TABLE is the costliest algorithm of its clauses"""
+    algorithms = [algorithm for algorithm in algorithms if algorithm is not None]
+    if not algorithms:
+        return None
+    return max(algorithms, key=ALGORITHMS.index)
+
+
+def get_lock(algorithm):
+    return ALGORITHM_LOCKS.get(algorithm)
+
 
 class PrimaryKeyNode(Node):
+    __slots__ = ('columns', 'mode')
+
     def __init__(self, columns: list, mode=None):
         self.columns = columns
         self.mode = mode
@@ -49,95 +138,215 @@ class PrimaryKeyNode(Node):
 
 
 class IndexNode(Node):
-    def __init__(self, indexes: list, unique=False, mode=None):
+    __slots__ = ('indexes', 'unique', 'mode', 'name')
+
+    def __init__(self, indexes: list, unique=False, mode=None, name=None):
         self.indexes = indexes
         self.unique = unique
         self.mode = mode
+        self.name = name
 
-    def is_equal(self, other):
-        if len(self.indexes) != len(other.indexes):
-            return False
-        for i in range(len(self.indexes)):
-            if self.indexes[i] != other.indexes[i]:
-                return False
-        if not self.unique == other.unique:
-            return False
+    def get_signature(self) -> tuple:
+        """canonical hashable description of the index, two indexes are equal
+        if their signatures are equal"""
+        return tuple(self.indexes), bool(self.unique)
 
-        return True
+    def is_equal(self, other):
+        return self.get_signature() == other.get_signature()
 
     def get_columns(self):
         return self.indexes
 
+    def get_name(self, table) -> str:
+        """name of the index in the database, indexes without a known name
+        are named the way playhouse.migrate names them"""
+        return self.name or make_index_name(table, self.indexes)
+
+    def get_mode(self, reverse=False):
+        if reverse:
+            return REVERSED_MODES.get(self.mode, self.mode)
+        return self.mode
+
+    def get_algorithm(self, reverse=False):
+        """secondary indexes are added and dropped in place without blocking writes"""
+        if self.get_mode(reverse) in (MODE_ADD, MODE_DELETE):
+            return ALGORITHM_INPLACE
+        return None
+
+    def rebuilds_table(self, reverse=False) -> bool:
+        """indexes are built next to the table data, the table itself is not rebuilt"""
+        return False
+
+    def as_sql_clause(self, table, reverse=False) -> str:
+        """clause of ALTER TABLE for the index change"""
+        mode = self.get_mode(reverse)
+        if mode == MODE_ADD:
+            columns = ', '.join('`%s`' % column for column in self.indexes)
+            unique = 'UNIQUE ' if self.unique else ''
+            return f'ADD {unique}INDEX `{self.get_name(table)}` ({columns})'
+        if mode == MODE_DELETE:
+            return f'DROP INDEX `{self.get_name(table)}`'
+        return ''
+
+    def get_pycode(self, table, reverse=False) -> str:
+        """peewee migrator operation for the index change"""
+        mode = self.get_mode(reverse)
+        if mode == MODE_ADD:
+            return f'migrator.add_index(\'{table}\', {tuple(self.indexes)}, {bool(self.unique)})'
+        if mode == MODE_DELETE:
+            return f'migrator.drop_index(\'{table}\', \'{self.get_name(table)}\')'
+        return ''
+
     def as_pycode(self, table):
-        columns = '('
-        for index in self.indexes:
-            columns = columns + '\'' + index + '\'' + ', '
-        columns = columns[:-1]
-        columns = columns + ')'
-        if self.mode == MODE_ADD:
-            code = f'        migrator.add_index(\'{table}\', {columns}, {self.unique}),\n'
-            return code
-        if self.mode == MODE_DELETE:
-            code = f'        migrator.drop_index(\'{table}\', {columns}, {self.unique}),\n'
-            return code
+        code = self.get_pycode(table)
+        if code:
+            return f'        {code},\n'
 
     def as_pycode_reversed(self, table):
-        columns = '('
-        for index in self.indexes:
-            columns = columns + '\'' + index + '\'' + ', '
-        columns = columns[:-1]
-        columns = columns + ')'
-        if self.mode == MODE_ADD:
-            code = f'        migrator.drop_index(\'{table}\', {columns}, {self.unique}),\n'
-            return code
-        if self.mode == MODE_DELETE:
-            code = f'        migrator.add_index(\'{table}\', {columns}, {self.unique}),\n'
-            return code
+        code = self.get_pycode(table, reverse=True)
+        if code:
+            return f'        {code},\n'
+
+
+def get_foreign_key_sql_type(raw_column_type) -> str:
+    """sql type of a foreign key column, the type of the referenced column:
+    field_type of a python field ('BIGINT') or data_type of a database column ('bigint')"""
+    if not raw_column_type:
+        return 'INT'
+    sql_type = str(raw_column_type).split('(')[0].split()[0].upper()
+    return FOREIGN_KEY_SQL_TYPES.get(sql_type, sql_type)
+
+
+def get_enum_values(values) -> list:
+    """function that converts enum values of a database column ("('a','b')")
+    or of a python field (['a', 'b']) into a list of quoted values"""
+    if type(values) == str:
+        return values[1:-1].split(',')
+    converted_values_to_list = []
+    for value in values:
+        converted_values_to_list.append('\'' + value + '\'')
+    return converted_values_to_list
 
 
 class ColumnNode(Node):
-    def __init__(self, name: str, refl_column: Column, mode=None, other=None):
+    """Column of a table.
+
+    Only the data needed for diffing is kept in the node: field class, sql type,
+    nullability, max_length and the referenced table. The playhouse.reflection.Column,
+    which is needed for code generation, is either given on creation or built
+    on the first access by column_factory(column_source)"""
+    __slots__ = (
+        'name', 'mode', 'other', 'field_class', 'sql_type', 'null', 'max_length',
+        'dest_table', 'previous', '_refl_column', '_column_factory', '_column_source',
+    )
+
+    def __init__(self, name: str, refl_column: Column = None, mode=None, other=None):
         self.name = name
-        self.refl_column = refl_column
         self.mode = mode
         self.other = other
+        self.previous = None
+        self._column_factory = None
+        self._column_source = None
+        self.refl_column = refl_column
+
+    @classmethod
+    def lazy(
+            cls, name: str, column_factory, column_source, field_class, null: bool,
+            max_length=None, enum_values=None, dest_table=None, raw_column_type=None,
+    ):
+        """column node whose playhouse.reflection.Column is built by
+        column_factory(column_source) only when it is needed,
+        raw_column_type is needed for foreign keys only (look get_foreign_key_sql_type)"""
+        # bypasses __init__, it would set the compact data of an empty column first
+        column = cls.__new__(cls)
+        column.name = name
+        column.mode = None
+        column.other = None
+        column.previous = None
+        column._refl_column = None
+        column._column_factory = column_factory
+        column._column_source = column_source
+        column.set_compact(
+            field_class, null, max_length, enum_values, dest_table, raw_column_type,
+        )
+        return column
+
+    def set_compact(
+            self, field_class, null, max_length=None, enum_values=None, dest_table=None,
+            raw_column_type=None,
+    ):
+        self.field_class = field_class
+        self.null = null
+        self.max_length = max_length
+        self.dest_table = dest_table
+        if field_class is None:
+            self.sql_type = None
+        elif field_class == EnumField:
+            self.sql_type = 'ENUM({})'.format(', '.join(get_enum_values(enum_values)))
+        elif issubclass(field_class, ForeignKeyField):
+            # field_type внешнего ключа - property, тип берется у колонки, на которую он ссылается
+            self.sql_type = get_foreign_key_sql_type(raw_column_type)
+        elif field_class.field_type == 'AUTO':
+            self.sql_type = 'INT'
+        else:
+            self.sql_type = field_class.field_type
+
+    @property
+    def refl_column(self):
+        if self._refl_column is None and self._column_factory is not None:
+            self._refl_column = self._column_factory(self._column_source)
+            self._column_factory = None
+            self._column_source = None
+        return self._refl_column
+
+    @refl_column.setter
+    def refl_column(self, refl_column):
+        self._refl_column = refl_column
+        self._column_factory = None
+        self._column_source = None
+        if refl_column is None:
+            self.set_compact(None, None)
+            return
+        extra = refl_column.extra_parameters or {}
+        dest_table = None
+        if refl_column.is_foreign_key() and getattr(refl_column, 'foreign_key', None):
+            dest_table = refl_column.foreign_key.dest_table
+        self.set_compact(
+            refl_column.field_class, refl_column.nullable, extra.get('max_length'),
+            extra.get('values'), dest_table, refl_column.raw_column_type,
+        )
+
+    def copy_column(self, other):
+        """takes the column definition of other node without building its reflection Column"""
+        self._refl_column = other._refl_column
+        self._column_factory = other._column_factory
+        self._column_source = other._column_source
+        self.field_class = other.field_class
+        self.sql_type = other.sql_type
+        self.null = other.null
+        self.max_length = other.max_length
+        self.dest_table = other.dest_table
 
     def get_name(self):
         return self.name
 
     def get_sql_type(self):
-        if self.refl_column.field_class == EnumField:
-            values = []
-            if type(self.refl_column.get_field_parameters()['values']) == str:
-                enum_values = self.refl_column.get_field_parameters()['values']
-                converted_values_to_list = enum_values[1:-1].split(',')
-            else:
-                converted_values_to_list = []
-                for value in self.refl_column.get_field_parameters()['values']:
-                    converted_values_to_list.append('\'' + value + '\'')
-            for value in converted_values_to_list:
-                values.append(value)
-            sql_type = 'ENUM({})'.format(', '.join(values))
-            return sql_type
-        if self.refl_column.field_class.field_type == 'AUTO':
-            return 'INT'
-        return self.refl_column.field_class.field_type
+        return self.sql_type
 
     def get_null(self):
-        return self.refl_column.nullable
+        return self.null
 
     def get_field_name(self):
-        return self.refl_column.field_class.__name__
+        return self.field_class.__name__
 
     def get_field(self):
-        return self.refl_column.field_class
+        return self.field_class
 
     def get_max_length(self):
-        self_extra = self.refl_column.extra_parameters
-        if self_extra:
-            if 'max_length' in self_extra:
-                return self_extra['max_length']
-        return None
+        return self.max_length
+
+    def is_foreign_key(self) -> bool:
+        return self.dest_table is not None
 
     def get_full_sql_type(self) -> str:
         sql_type = str(self.get_sql_type())
@@ -158,28 +367,26 @@ class ColumnNode(Node):
             return True
         return False
 
+    def get_signature(self) -> tuple:
+        """canonical hashable description of the column type, two columns are equal
+        if their signatures are equal"""
+        return self.get_sql_type(), self.get_null(), self.get_max_length()
+
     def is_equal(self, other) -> bool:
         """function that takes two values of column_node and returns True if they are equal
         False otherwise"""
-        self_type = self.get_sql_type()
-        other_type = other.get_sql_type()
-        self_null = self.get_null()
-        other_null = other.get_null()
-        if self_type != other_type or self_null != other_null:
-            return False
-        if not self.is_max_length_equal(other):
-            return False
-        return True
+        return self.get_signature() == other.get_signature()
 
     def get_diff(self, mode: int, other=None):
         curr = ColumnNode(name=None, refl_column=None, mode=mode)
         if mode == MODE_MODIFY:
             if not self.is_equal(other):
-                curr.refl_column = other.refl_column
+                curr.copy_column(other)
                 curr.name = other.name
+                curr.previous = self
         if mode in (MODE_DELETE, MODE_ADD):
             curr.name = self.name
-            curr.refl_column = self.refl_column
+            curr.copy_column(self)
         if mode == MODE_RENAME:
             curr.name = other.name
             curr.other = self.name
@@ -187,57 +394,145 @@ class ColumnNode(Node):
             return None
         return curr
 
-    def as_sql(self, table):
+    def get_algorithm(self, reverse=False):
+        """the cheapest online DDL algorithm of MySQL 8 that can apply the column change,
+        with reverse the algorithm of the change undoing it.
+        only what is available since 8.0.12 is used: instant add column (at the end),
+        drop and rename columns are in place"""
+        if self.mode == MODE_RENAME:
+            return ALGORITHM_INPLACE
+        mode = REVERSED_MODES.get(self.mode, self.mode) if reverse else self.mode
+        if mode == MODE_ADD:
+            if self.is_foreign_key():
+                # with foreign_key_checks a new foreign key is added only by copying
+                return ALGORITHM_COPY
+            return ALGORITHM_INSTANT
+        if mode == MODE_DELETE:
+            return ALGORITHM_INPLACE
+        if mode == MODE_MODIFY:
+            if self.previous is None:
+                return ALGORITHM_COPY
+            if reverse:
+                return get_modify_algorithm(self, self.previous)
+            return get_modify_algorithm(self.previous, self)
+        return None
+
+    def rebuilds_table(self, reverse=False) -> bool:
+        """True if the column change rewrites all the rows of the table,
+        instant and metadata only changes (rename, varchar growth) don't"""
+        algorithm = self.get_algorithm(reverse=reverse)
+        if algorithm == ALGORITHM_COPY:
+            return True
+        if algorithm != ALGORITHM_INPLACE or self.mode == MODE_RENAME:
+            return False
+        mode = REVERSED_MODES.get(self.mode, self.mode) if reverse else self.mode
+        if mode == MODE_MODIFY:
+            # in place меняется только NULL / NOT NULL (перестройка) или длина varchar (нет)
+            return self.previous is not None and self.is_max_length_equal(self.previous)
+        return True
+
+    def get_backfill_pycode(self, table, primary_key=None, reverse=False) -> str:
+        """migrator.backfill filling NULL values of a column that becomes NOT NULL
+        with the default of the column, a comment if the default is unknown"""
+        if self.mode != MODE_MODIFY or self.previous is None:
+            return ''
+        column_from, column_to = (self, self.previous) if reverse else (self.previous, self)
+        if not column_from.get_null() or column_to.get_null():
+            return ''
+        default = column_to.refl_column.default
+        if default is None or not isinstance(default, (str, int, float, bool)):
+            return f'# {table}.{self.name} becomes NOT NULL, fill its NULL values with migrator.backfill'
+        primary_key = f', {list(primary_key)!r}' if primary_key else ''
+        return (
+            f'migrator.backfill(\'{table}\', {{\'{self.name}\': {default!r}}}{primary_key}, '
+            f'where=\'`{self.name}` IS NULL\')'
+        )
+
+    def as_sql_clause(self) -> str:
+        """clause of ALTER TABLE for the column change"""
         if self.mode == MODE_NONE:
             return ''  # такого в принципе не может быть но пусть
         if self.mode == MODE_DELETE:
-            return f'ALTER TABLE `{table}` DROP COLUMN `{self.name}`;\n'
+            return f'DROP COLUMN `{self.name}`'
         if self.mode == MODE_RENAME:
-            return f'ALTER TABLE `{table}` RENAME COLUMN `{self.other}` to `{self.name}`;\n'
+            return f'RENAME COLUMN `{self.other}` to `{self.name}`'
         sql_type = self.get_full_sql_type()
         if self.mode == MODE_ADD:
-            return f'ALTER TABLE `{table}` ADD COLUMN `{self.name}` {sql_type};\n'
+            return f'ADD COLUMN `{self.name}` {sql_type}'
         if self.mode == MODE_MODIFY:
-            return f'ALTER TABLE `{table}` MODIFY COLUMN `{self.name}` {sql_type};\n'
+            return f'MODIFY COLUMN `{self.name}` {sql_type}'
         return ''
 
-    def as_pycode(self, table) -> str:
+    def as_sql(self, table):
+        clause = self.as_sql_clause()
+        if not clause:
+            return ''
+        return f'ALTER TABLE `{table}` {clause};\n'
+
+    def get_migrator_field(self) -> str:
+        field = self.refl_column.get_field()
+        return field[len(self.name) + 3:]
+
+    def get_pycode(self, table, reverse=False) -> str:
+        """peewee migrator operation for the column change,
+        with reverse the operation undoing it for roll_back()"""
         if self.mode == MODE_NONE:
             return ''  # такого в принципе не может быть но пусть
-        if self.mode == MODE_DELETE:
-            return f'        migrator.drop_column(\"{table}\", \"{self.name}\"),\n'
-        if self.mode == MODE_ADD:
-            field = self.refl_column.get_field()
-            field = field[len(self.name) + 3:]
-            return f'        migrator.add_column(\"{table}\", \"{self.name}\", {field}),\n'
-        if self.mode == MODE_MODIFY:
-            field = self.refl_column.get_field()
-            field = field[len(self.name) + 3:]
-            return f'        migrator.alter_column_type(\"{table}\", \"{self.name}\", {field}),\n'
         if self.mode == MODE_RENAME:
-            return f'        migrator.rename_column(\"{table}\", \"{self.name}\", \"{self.other}\"),\n' # noqa E501
+            old_name, new_name = (self.name, self.other) if reverse else (self.other, self.name)
+            return f'migrator.rename_column(\"{table}\", \"{old_name}\", \"{new_name}\")'
+        mode = REVERSED_MODES.get(self.mode, self.mode) if reverse else self.mode
+        if mode == MODE_DELETE:
+            return f'migrator.drop_column(\"{table}\", \"{self.name}\")'
+        if mode == MODE_ADD:
+            field = self.get_migrator_field()
+            return f'migrator.add_column(\"{table}\", \"{self.name}\", {field})'
+        if mode == MODE_MODIFY:
+            column = self.previous if reverse and self.previous is not None else self
+            field = column.get_migrator_field()
+            return f'migrator.alter_column_type(\"{table}\", \"{self.name}\", {field})'
         return ''
 
-    def as_pycode_reversed(self, table) -> str:
-        if self.mode == MODE_NONE:
-            return ''
-        if self.mode == MODE_DELETE:
+    def as_pycode(self, table) -> str:
+        code = self.get_pycode(table)
+        return f'        {code},\n' if code else ''
 
-            field = self.refl_column.get_field()
-            field = field[len(self.name) + 3:]
-            return f'        migrator.add_column(\"{table}\", \"{self.name}\", {field}),\n'
-        if self.mode == MODE_ADD:
-            return f'        migrator.drop_column(\"{table}\", \"{self.name}\"),\n'
-        if self.mode == MODE_MODIFY:
-            field = self.refl_column.get_field()
-            field = field[len(self.name) + 3:]
-            return f'        migrator.alter_column_type(\"{table}\", \"{self.name}\", {field}),\n'
-        if self.mode == MODE_RENAME:
-            return f'        migrator.rename_column(\"{table}\", \"{self.other}\", \"{self.name}\"),\n' # noqa E501
-        return ''
+    def as_pycode_reversed(self, table) -> str:
+        code = self.get_pycode(table, reverse=True)
+        return f'        {code},\n' if code else ''
+
+
+def get_modify_algorithm(column_from: ColumnNode, column_to: ColumnNode) -> str:
+    """online DDL algorithm of MODIFY COLUMN from one column definition to another"""
+    type_from = column_from.get_sql_type()
+    type_to = column_to.get_sql_type()
+    if type_from == type_to and column_from.is_max_length_equal(column_to):
+        # только NULL / NOT NULL, таблица перестраивается на месте
+        return ALGORITHM_INPLACE
+    if column_from.get_null() != column_to.get_null():
+        return ALGORITHM_COPY
+    if type_from.startswith('ENUM(') and type_to.startswith('ENUM('):
+        values_from = type_from[5:-1].split(', ')
+        values_to = type_to[5:-1].split(', ')
+        appended = values_to[:len(values_from)] == values_from
+        if appended and len(values_to) <= ENUM_MAX_VALUES:
+            return ALGORITHM_INSTANT
+        return ALGORITHM_COPY
+    if type_from == type_to == 'VARCHAR':
+        length_from = column_from.get_max_length()
+        length_to = column_to.get_max_length()
+        if length_from is not None and length_to is not None and length_to >= length_from:
+            if (length_from <= VARCHAR_SHORT_MAX_LENGTH) == (length_to <= VARCHAR_SHORT_MAX_LENGTH):
+                return ALGORITHM_INPLACE
+    return ALGORITHM_COPY
 
 
 class TableNode(Node):
+    __slots__ = (
+        'name', 'columns', 'mode', 'model', 'indexes', 'primary_key', 'has_foreign_keys',
+        'stub', '_fingerprint',
+    )
+
     def __init__(
             self, name: str, primary_key=None,
             columns=None, mode=None, model=None, indexes=None, has_foreign_keys=False,
@@ -249,35 +544,59 @@ class TableNode(Node):
         self.indexes = indexes
         self.primary_key = primary_key
         self.has_foreign_keys = has_foreign_keys
+        # модель измененной таблицы, на которую ссылаются добавленные или удаленные таблицы
+        self.stub = None
+        self._fingerprint = None
+
+    def get_fingerprint(self) -> str:
+        """structural hash of the table built from the signatures of its columns,
+        indexes and primary key, two tables with equal fingerprints have no diff.
+        it is computed once, so the table must not be changed after that"""
+        if self._fingerprint is None:
+            columns = sorted(
+                (name, repr(column.get_signature())) for name, column in self.columns.items()
+            )
+            indexes = sorted({repr(index.get_signature()) for index in self.indexes or []})
+            primary_key = sorted(self.primary_key.columns or []) if self.primary_key else []
+            description = repr((columns, indexes, primary_key))
+            self._fingerprint = hashlib.sha1(description.encode('utf-8')).hexdigest()
+        return self._fingerprint
 
     def get_foreign_key_columns(self):
         columns_foreign_keys = []
         for column_name, column in self.columns.items():
-            if column.refl_column.is_foreign_key():
+            if column.is_foreign_key():
                 columns_foreign_keys.append(column_name)
         return columns_foreign_keys
 
+    def get_stub(self):
+        """table node with the primary key and the model of the table but no columns,
+        the columns referenced by foreign keys are added to it (look DbNode.get_diff)"""
+        return TableNode(
+            name=self.name, mode=MODE_STUB, columns={},
+            primary_key=self.primary_key, model=self.model,
+        )
+
     def get_foreign_key_refl_columns(self):
         columns_foreign_keys = []
         for column_name, column in self.columns.items():
-            if column.refl_column.is_foreign_key():
+            if column.is_foreign_key():
                 columns_foreign_keys.append(column.refl_column)
         return columns_foreign_keys
 
-    def get_model(self, ignore_unknown=False, lower_case=False):
+    def iter_model(self, ignore_unknown=False, lower_case=False):
+        """yields the peewee model description of the table line by line"""
 
         pk_classes = [AutoField, IntegerField]
         if self.model:
             name = self.model
         else:
             name = self.name
-        model_description = ''
-
         if self.mode == MODE_ADD:
-            model_description += '#  MODE_ADD\n'
+            yield '#  MODE_ADD\n'
         if self.mode == MODE_DELETE:
-            model_description += '#  MODE_DELETE\n'
-        model_description += 'class %s(BaseModel):\n' % name
+            yield '#  MODE_DELETE\n'
+        yield 'class %s(BaseModel):\n' % name
         columns = self.columns.items()
         primary_keys = self.primary_key.columns
         for name, column in columns:
@@ -295,17 +614,19 @@ class TableNode(Node):
 
             is_unknown = column.refl_column.field_class is UnknownField
             if is_unknown and ignore_unknown:
-                disp = '%s - %s' % (column.name, column.raw_column_type or '?')
-                model_description += '    # %s\n' % disp
+                disp = '%s - %s' % (column.name, column.refl_column.raw_column_type or '?')
+                yield '    # %s\n' % disp
+            elif lower_case:
+                # иначе пишет column_name='DECIMALS' в кваргах поля,
+                # колонка графа не меняется, ее еще сравнивают и выводят
+                refl_column = copy.copy(column.refl_column)
+                refl_column.column_name = refl_column.column_name.lower()
+                yield '    %s\n' % refl_column.get_field()
             else:
-                column.default = None  # зануляем что бы не было constraints=[SQL("DEFAULT 35")]
-                if lower_case:
-                    # иначе пишет column_name='DECIMALS' в кваргах поля
-                    column.column_name = column.column_name.lower()
-                model_description += '    %s\n' % column.refl_column.get_field()
+                yield '    %s\n' % column.refl_column.get_field()
 
-        model_description += '\n    class Meta:\n'
-        model_description += '        table_name = \'%s\'\n' % self.name
+        yield '\n    class Meta:\n'
+        yield '        table_name = \'%s\'\n' % self.name
 
         if len(primary_keys) > 1:
             pk_field_names_2 = []
@@ -318,20 +639,20 @@ class TableNode(Node):
             pk_field_names_2 = False
 
         if self.indexes:
-            index_declarating = '        indexes = ('
+            index_declarating = ['        indexes = (']
             multi_column_indexes = False
             for index in self.indexes:
                 if len(index.indexes) > 1:
                     multi_column_indexes = True
                     # print(fields, pk_field_names_2)
-                    index_declarating += '((%s), %s),\n        ' % (
+                    index_declarating.append('((%s), %s),\n        ' % (
                         ', '.join("'%s'" % field for field in index.indexes),
                         index.unique,
-                    )
+                    ))
                 # print(pk_field_names, fields)
-            index_declarating += '        )\n'
+            index_declarating.append('        )\n')
             if multi_column_indexes:
-                model_description += index_declarating
+                yield ''.join(index_declarating)
 
         if len(primary_keys) > 1:
             pk_field_names = sorted(
@@ -341,32 +662,93 @@ class TableNode(Node):
             pk_field_names.reverse()
             pk_list = ', '.join("'%s'" % pk for pk in pk_field_names)
 
-            model_description += '        primary_key = CompositeKey(%s)\n' % pk_list
+            yield '        primary_key = CompositeKey(%s)\n' % pk_list
         elif not primary_keys:
-            model_description += '        primary_key = False\n'
-        model_description += '\n\n'
-        return model_description
+            yield '        primary_key = False\n'
+        yield '\n\n'
+
+    def get_model(self, ignore_unknown=False, lower_case=False):
+        return ''.join(self.iter_model(ignore_unknown=ignore_unknown, lower_case=lower_case))
 
     def get_columns(self):
         pass
 
-    def as_sql(self):
+    def iter_sql(self):
+        """yields sql statements of a diff table one by one"""
         if self.mode == MODE_DELETE:
-            return f'DROP TABLE `{self.name}`;\n'
+            yield f'DROP TABLE `{self.name}`;\n'
+            return
 
         if self.mode == MODE_ADD:
-            query = 'CREATE TABLE `' + str(self.name) + '` (\n'
             column_names = []
             for column in self.columns.values():
                 column_def = '`' + column.get_name() + '` ' + str(column.get_full_sql_type())
                 column_names.append(column_def)
-            query = query + ',\n'.join(column_names)
-            query = query + ');\n'
-            return query
-        code = ''
+            yield 'CREATE TABLE `' + str(self.name) + '` (\n' + ',\n'.join(column_names) + ');\n'
+            return
+        clauses = [clause for clause in self.iter_sql_clauses() if clause]
+        if clauses:
+            clauses.append(', '.join(self.get_alter_options()))
+            yield 'ALTER TABLE `%s`\n    %s;\n' % (self.name, ',\n    '.join(clauses))
+
+    def iter_changes(self):
+        """yields column and index changes of a diff table"""
+        yield from self.columns.values()
+        yield from self.indexes or []
+
+    def get_algorithm(self, reverse=False):
+        """online DDL algorithm of the single ALTER TABLE of a diff table"""
+        if self.mode != MODE_MODIFY:
+            return None
+        return get_costliest_algorithm(
+            change.get_algorithm(reverse=reverse) for change in self.iter_changes()
+        )
+
+    def get_alter_options(self, reverse=False) -> list:
+        """ALGORITHM and LOCK options of the ALTER TABLE of a diff table"""
+        algorithm = self.get_algorithm(reverse=reverse)
+        options = ['ALGORITHM=%s' % algorithm]
+        if get_lock(algorithm):
+            options.append('LOCK=%s' % get_lock(algorithm))
+        return options
+
+    def get_blocking_changes(self, reverse=False) -> list:
+        """names of the columns and indexes of a diff table that can be changed
+        only with a blocking table copy"""
+        if self.mode != MODE_MODIFY:
+            return []
+        changes = []
+        for change in self.iter_changes():
+            if change.get_algorithm(reverse=reverse) == ALGORITHM_COPY:
+                name = change.name if isinstance(change, ColumnNode) else change.get_name(self.name)
+                changes.append('%s.%s' % (self.name, name))
+        return changes
+
+    def get_ordered_indexes(self, reverse=False) -> tuple:
+        """index changes of a diff table split into (dropped, added),
+        indexes are dropped before the column changes and added after them"""
+        dropped = []
+        added = []
+        for index in self.indexes or []:
+            mode = index.get_mode(reverse)
+            if mode == MODE_DELETE:
+                dropped.append(index)
+            elif mode == MODE_ADD:
+                added.append(index)
+        return dropped, added
+
+    def iter_sql_clauses(self):
+        """yields clauses of the single ALTER TABLE of a diff table"""
+        dropped, added = self.get_ordered_indexes()
+        for index in dropped:
+            yield index.as_sql_clause(self.name)
         for column in self.columns.values():
-            code = code + column.as_sql(self.name)
-        return code
+            yield column.as_sql_clause()
+        for index in added:
+            yield index.as_sql_clause(self.name)
+
+    def as_sql(self):
+        return ''.join(self.iter_sql())
 
     def get_fields_names(self) -> list:
         """method for a diff_graph to get all the field's types that
@@ -375,7 +757,8 @@ class TableNode(Node):
         field types from peewee to make an appropriate migration"""
         fields = []
         for column in self.columns.values():
-            fields.append(column.get_field_name())
+            if column.get_field() is not None:  # у переименованных колонок поля нет
+                fields.append(column.get_field_name())
 
         if (self.mode in [MODE_ADD, MODE_DELETE]) and len(self.primary_key.columns) > 1:
             fields.append('CompositeKey')
@@ -383,8 +766,6 @@ class TableNode(Node):
 
     def get_diff(self, other=None):
         cols = {}
-        not_seen_self = set()
-        not_seen_other = set()
         if other is None:
 
             return TableNode(
@@ -407,105 +788,146 @@ class TableNode(Node):
             )
 
         indexes = []
+        signatures_self = {index.get_signature() for index in self.indexes}
+        signatures_other = {index.get_signature() for index in other.indexes}
         for index_self in self.indexes:
-            for index_other in other.indexes:
-                if index_self.is_equal(index_other):
-                    break
-            else:
-                curr = IndexNode(index_self.indexes, index_self.unique, mode=MODE_DELETE)
+            if index_self.get_signature() not in signatures_other:
+                curr = IndexNode(
+                    index_self.indexes, index_self.unique, mode=MODE_DELETE, name=index_self.name,
+                )
                 indexes.append(curr)
         for index_other in other.indexes:
-            for index_self in self.indexes:
-                if index_other.is_equal(index_self):
-                    break
-            else:
-
-                curr = IndexNode(index_other.indexes, index_other.unique, mode=MODE_ADD)
+            if index_other.get_signature() not in signatures_self:
+                curr = IndexNode(
+                    index_other.indexes, index_other.unique, mode=MODE_ADD, name=index_other.name,
+                )
                 indexes.append(curr)
 
+        not_seen_self = [name for name in self.columns if name not in other.columns]
+        not_seen_other = [name for name in other.columns if name not in self.columns]
         for column_name, column in self.columns.items():
-            if column_name in other.columns.keys():  # одинаковые имена
+            if column_name in other.columns:  # одинаковые имена
                 curr = column.get_diff(other=other.columns[column_name], mode=MODE_MODIFY)
                 if curr is not None:
                     cols[column_name] = curr
-            else:
-                not_seen_self.add(column_name)  # те которых нет в дб 2
 
-        for column_name in other.columns.keys():
-            if column_name not in self.columns.keys():
-                not_seen_other.add(column_name)  # те которых нет в дб 1
+        # колонки из дб2 без пары группируем по типу, переименование ищем только внутри группы
+        buckets = {}
+        for column_name_other in not_seen_other:
+            signature = other.columns[column_name_other].get_signature()
+            buckets.setdefault(signature, deque()).append(column_name_other)
 
         rename_self = set()
         rename_other = set()
         for column_name_self in not_seen_self:  # колонки из дб1, не нашедшие пару в дб2, удаляем
-            for column_name_other in not_seen_other:
-                if (
-                        self.columns[column_name_self].is_equal(other.columns[column_name_other])
-                        and column_name_other not in rename_other
-                ):
-                    curr = self.columns[column_name_self].get_diff(
-                        other=other.columns[column_name_other],
-                        mode=MODE_RENAME,
-                    )
-                    cols[column_name_other] = curr
-                    rename_self.add(column_name_self)
-                    rename_other.add(column_name_other)
-                    break
-
-        for column_name_self in not_seen_self - rename_self:
-            curr = self.columns[column_name_self].get_diff(mode=MODE_DELETE)
-            cols[column_name_self] = curr
-
-        for column_name_other in not_seen_other - rename_other:  # из дб2 не нашедшие пару добавляем
-            curr = other.columns[column_name_other].get_diff(mode=MODE_ADD)
-            cols[column_name_other] = curr
+            bucket = buckets.get(self.columns[column_name_self].get_signature())
+            if bucket:
+                column_name_other = bucket.popleft()
+                curr = self.columns[column_name_self].get_diff(
+                    other=other.columns[column_name_other],
+                    mode=MODE_RENAME,
+                )
+                cols[column_name_other] = curr
+                rename_self.add(column_name_self)
+                rename_other.add(column_name_other)
+
+        for column_name_self in not_seen_self:
+            if column_name_self not in rename_self:
+                curr = self.columns[column_name_self].get_diff(mode=MODE_DELETE)
+                cols[column_name_self] = curr
+
+        for column_name_other in not_seen_other:  # из дб2 не нашедшие пару добавляем
+            if column_name_other not in rename_other:
+                curr = other.columns[column_name_other].get_diff(mode=MODE_ADD)
+                cols[column_name_other] = curr
 
         if not self.primary_key.are_equal(other.primary_key):
             print('WARNING primary keys for table', self.name, 'were changed')
             print(self.primary_key.columns, '   |   ', other.primary_key.columns)
 
         if len(cols) != 0 or len(indexes) != 0:
-            return TableNode(self.name, columns=cols, indexes=indexes, mode=MODE_MODIFY)
+            return TableNode(
+                self.name, columns=cols, indexes=indexes, mode=MODE_MODIFY,
+                primary_key=self.primary_key,
+                has_foreign_keys=any(column.is_foreign_key() for column in cols.values()),
+            )
         return None
 
-    def as_pycode(self) -> str:
-        if self.mode == MODE_DELETE:
-            return ''
-
-        if self.mode == MODE_ADD:
-            return ''
-        code = ''
+    def is_migrated_index(self, index) -> bool:
+        """single column indexes of changed columns are made by the field itself"""
+        return len(index.indexes) > 1 or index.indexes[0] not in self.columns.keys()
 
+    def iter_pycode_operations(self, reverse=False):
+        """yields migrator operations of a diff table in the order they are applied"""
+        dropped, added = self.get_ordered_indexes(reverse)
+        for index in dropped:
+            if self.is_migrated_index(index):
+                yield index.get_pycode(self.name, reverse=reverse)
+        for column in self.columns.values():
+            yield column.get_pycode(self.name, reverse=reverse)
+        for index in added:
+            if self.is_migrated_index(index):
+                yield index.get_pycode(self.name, reverse=reverse)
+
+    def iter_pycode(self, reverse=False, online_rebuild=False):
+        """yields peewee migrator commands of a diff table, all the changes
+        of the table are merged into one ALTER TABLE (look migrator.py).
+        with online_rebuild changes needing a blocking copy are applied
+        through a shadow table instead (look online.py)"""
+        if self.mode in (MODE_DELETE, MODE_ADD):
+            return
+        primary_key = self.primary_key.columns if self.primary_key else None
         for column in self.columns.values():
-            code = code + column.as_pycode(self.name)
+            code = column.get_backfill_pycode(self.name, primary_key, reverse=reverse)
+            if code:
+                yield f'        {code}\n' if code.startswith('#') else f'        {code},\n'
+        operations = [code for code in self.iter_pycode_operations(reverse) if code]
+        if not operations:
+            return
+        algorithm = self.get_algorithm(reverse=reverse)
+        if online_rebuild and algorithm == ALGORITHM_COPY:
+            method = 'rebuild_table'
+            options = ''
+        else:
+            method = 'alter_table'
+            options = f', algorithm=\'{algorithm}\''
+            if get_lock(algorithm):
+                options += f', lock=\'{get_lock(algorithm)}\''
+        yield f'        migrator.{method}(\'{self.name}\', [\n'
+        for code in operations:
+            yield f'            {code},\n'
+        yield f'        ]{options}),\n'
+
+    def iter_pycode_reversed(self, online_rebuild=False):
+        """yields peewee migrator commands of a diff table for roll_back()"""
+        return self.iter_pycode(reverse=True, online_rebuild=online_rebuild)
 
-        if self.indexes:
-            for index in self.indexes:
-                if len(index.indexes) > 1 or index.indexes[0] not in self.columns.keys():
-                    code = code + index.as_pycode(self.name)
-        return code
+    def as_pycode(self) -> str:
+        return ''.join(self.iter_pycode())
 
     def as_pycode_reversed(self) -> str:
-        if self.mode == MODE_DELETE:
-            return ''
-
-        if self.mode == MODE_ADD:
-            return ''
-        code = ''
-
-        for column in self.columns.values():
-            code = code + column.as_pycode_reversed(self.name)
-
-        if self.indexes:
-            for index in self.indexes:
-                if len(index.indexes) > 1 or index.indexes[0] not in self.columns.keys():
-                    code = code + index.as_pycode_reversed(self.name)
-        return code
+        return ''.join(self.iter_pycode_reversed())
 
 
 class DbNode(Node):
+    __slots__ = ('tables', '_fingerprint')
+
     def __init__(self, tables: dict):
         self.tables = tables
+        self._fingerprint = None
+
+    def get_fingerprint(self) -> str:
+        """root hash of the schema built from the fingerprints of all tables"""
+        if self._fingerprint is None:
+            tables = sorted(
+                (name, table.get_fingerprint()) for name, table in self.tables.items()
+            )
+            self._fingerprint = hashlib.sha1(repr(tables).encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def is_equal(self, other) -> bool:
+        """True if there is no difference between two schemas"""
+        return self.get_fingerprint() == other.get_fingerprint()
 
     def get_foreign_keys_graph(self):
         graph = {}
@@ -514,25 +936,68 @@ class DbNode(Node):
             if not table.has_foreign_keys:
                 continue
             for column_name, column in table.columns.items():
-                if column.refl_column.is_foreign_key():
-                    graph[table_name].add(column.refl_column.foreign_key.dest_table)
+                if column.is_foreign_key():
+                    graph[table_name].add(column.dest_table)
 
         return graph
 
-    def get_right_order(self):
+    def get_right_order(self, tables=None) -> list:
+        """method to get tables ordered so that referenced tables go first,
+        with tables given only these tables and the tables they reference are ordered.
+        reference cycles are reported with the foreign keys to make deferred"""
         graph = self.get_foreign_keys_graph()
-        tables_right_order = []
-
-        while len(tables_right_order) != len(self.tables.keys()):
-            for table, refs in graph.items():
-                if refs.issubset(set(tables_right_order)) and table not in tables_right_order:
-                    tables_right_order.append(table)
-
+        if tables is not None:
+            closure = {}
+            queue = deque(table for table in tables if table in graph)
+            while queue:
+                table = queue.popleft()
+                if table in closure:
+                    continue
+                closure[table] = graph[table]
+                queue.extend(dest for dest in graph[table] if dest in graph)
+            graph = closure
+
+        tables_right_order, deferred = sort_tables(graph)
+        for table, dest in deferred:
+            columns = [
+                column.column_name for column in self.tables[table].get_foreign_key_refl_columns()
+                if column.foreign_key.dest_table == dest
+            ]
+            print(
+                '# Possible reference cycle: %s -> %s, consider DeferredForeignKey for %s'
+                % (table, dest, ', '.join('%s.%s' % (table, column) for column in columns)),
+            )
         return tables_right_order
 
+    def get_dependencies(self, reverse=False) -> dict:
+        """method for a diff_graph to get the altered tables whose changes go before
+        the changes of an altered table: the tables its changed foreign keys reference,
+        with reverse for roll_back() the tables referencing it (look scheduler.py)"""
+        altered = {name for name, table in self.tables.items() if table.mode == MODE_MODIFY}
+        dependencies = {}
+        for table_name, refs in self.get_foreign_keys_graph().items():
+            for dest in refs:
+                if table_name == dest or table_name not in altered or dest not in altered:
+                    continue
+                if reverse:
+                    dependencies.setdefault(dest, set()).add(table_name)
+                else:
+                    dependencies.setdefault(table_name, set()).add(dest)
+        return {table_name: sorted(refs) for table_name, refs in sorted(dependencies.items())}
+
+    def get_blocking_changes(self) -> list:
+        """method for a diff_graph to get the changes that need ALGORITHM=COPY,
+        such changes block writes to the table while it is copied"""
+        changes = []
+        for table in self.tables.values():
+            changes.extend(table.get_blocking_changes())
+        return changes
+
     def get_diff(self, other, only_tables: list = None):
 
         tabs = {}
+        if not only_tables and self.is_equal(other):
+            return DbNode(tabs)
         for table_name, table in self.tables.items():
             if only_tables and table_name not in only_tables:
                 continue
@@ -540,6 +1005,9 @@ class DbNode(Node):
                 # MODE_DELETE
                 curr = table.get_diff()
 
+            elif table.get_fingerprint() == other.tables[table_name].get_fingerprint():
+                # таблицы совпадают, подробное сравнение не нужно
+                continue
             else:
                 # MODE_MODIFY
                 curr = table.get_diff(other=other.tables[table_name])
@@ -561,52 +1029,54 @@ class DbNode(Node):
             table for table in tabs.keys() if tabs[table].mode in [MODE_DELETE, MODE_ADD]
         ]
         for table_name in tables_add_delete:
-            if tabs[table_name].has_foreign_keys:
-                for foreign_key in tabs[table_name].get_foreign_key_refl_columns():
-                    dest_table = foreign_key.foreign_key.dest_table
-                    dest_column = foreign_key.foreign_key.dest_column
-                if dest_table not in tabs.keys() or tabs[dest_table].mode == MODE_MODIFY:
-                    if tabs[table_name].mode == MODE_ADD:
-                        stub = TableNode(
-                            name=dest_table,
-                            mode=MODE_STUB,
-                            columns={dest_column: other.tables[dest_table].columns[dest_column]},
-                            primary_key=other.tables[dest_table].primary_key,
-                            model=other.tables[dest_table].model,
-                        )
-                        tabs[dest_table] = stub
-                    elif tabs[table_name].mode == MODE_DELETE:
-                        stub = TableNode(
-                            name=dest_table,
-                            mode=MODE_STUB,
-                            columns={dest_column: self.tables[dest_table].columns[dest_column]},
-                            primary_key=other.tables[dest_table].primary_key,
-                            model=other.tables[dest_table].model,
-                        )
-                        tabs[dest_table] = stub
+            if not tabs[table_name].has_foreign_keys:
+                continue
+            for foreign_key in tabs[table_name].get_foreign_key_refl_columns():
+                dest_table = foreign_key.foreign_key.dest_table
+                dest_column = foreign_key.foreign_key.dest_column
+                # графы, построенные по only_tables, могут содержать таблицу только с одной стороны
+                dest = other.tables.get(dest_table) or self.tables.get(dest_table)
+                if dest is None:
+                    continue
+                if dest_table not in tabs:
+                    stub = tabs[dest_table] = dest.get_stub()
+                elif tabs[dest_table].mode == MODE_STUB:
+                    stub = tabs[dest_table]
+                elif tabs[dest_table].mode == MODE_MODIFY:
+                    # изменения таблицы остаются в диффе, модель для скрипта берется из заглушки
+                    if tabs[dest_table].stub is None:
+                        tabs[dest_table].stub = dest.get_stub()
+                    stub = tabs[dest_table].stub
+                else:
+                    continue
+                stub.columns[dest_column] = dest.columns[dest_column]
         return DbNode(tabs)
 
-    def as_sql(self) -> str:
-        query = ''
+    def iter_sql(self):
+        """method for a diff_graph to yield sql statements table by table"""
         for table in self.tables.values():
-            query = query + table.as_sql()
-        return query
+            yield from table.iter_sql()
+
+    def iter_pycode(self, online_rebuild=False):
+        """method for a diff_graph to yield peewee commands for direct migration"""
+        for table in self.tables.values():
+            yield from table.iter_pycode(online_rebuild=online_rebuild)
+
+    def iter_pycode_reversed(self, online_rebuild=False):
+        """method for a diff_graph to yield peewee commands for roll_back() migration"""
+        for table in self.tables.values():
+            yield from table.iter_pycode_reversed(online_rebuild=online_rebuild)
+
+    def as_sql(self) -> str:
+        return ''.join(self.iter_sql())
 
     def as_pycode(self) -> str:
         """method for a diff_graph to get peewee commands for direct migration"""
-        query = ''
-        for table in self.tables.values():
-            query = query + table.as_pycode()
-            # print(query)
-        return query
+        return ''.join(self.iter_pycode())
 
     def as_pycode_reversed(self) -> str:
         """method for a diff_graph to get peewee commands for roll_back() migration"""
-        query = ''
-        for table in self.tables.values():
-            query = query + table.as_pycode_reversed()
-            # print(query)
-        return query
+        return ''.join(self.iter_pycode_reversed())
 
     def get_tables_mode_add(self) -> list:
         """method for a diff_graph to get all the tables's names that need to be added
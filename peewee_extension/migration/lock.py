@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""lock taken by migrate around applying migrations, so that processes started
+together (e.g. application nodes of one deploy) don't apply the same migration twice
+
+MySQL uses GET_LOCK: the lock belongs to the connection and is released by the server
+if the process dies. other databases insert a row into pe_locks, a row older than
+stale_after seconds is considered left by a dead process and is removed"""
+import datetime
+import hashlib
+import os
+import socket
+import time
+
+from peewee import IntegrityError, MySQLDatabase
+from peewee_extension.migration.models_migration_table import Lock, bind_copy
+
+LOCK_NAME = 'pe_migrate'
+# GET_LOCK names are limited to 64 characters
+MAX_LOCK_NAME_LENGTH = 64
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class MigrationLock:
+    """Lock of the migrations of one database.
+
+    timeout is how long acquire waits for the lock, None - forever.
+    wait_released lets a process wait for the holder instead of taking the lock"""
+
+    def __init__(self, database, timeout=None, poll=1.0, stale_after=6 * 3600):
+        self.database = database
+        self.timeout = timeout
+        self.poll = poll
+        self.stale_after = stale_after
+        name = '%s:%s' % (LOCK_NAME, database.database)
+        if len(name) > MAX_LOCK_NAME_LENGTH:
+            name = '%s:%s' % (LOCK_NAME, hashlib.sha1(name.encode('utf-8')).hexdigest())
+        self.name = name
+        self.owner = '%s:%s' % (socket.gethostname(), os.getpid())
+        self.model = bind_copy(Lock, database)
+        self.is_mysql = isinstance(database, MySQLDatabase)
+
+    def acquire(self, wait=True) -> bool:
+        """takes the lock, with wait=False returns False at once if it is held,
+        raises LockTimeout if the lock is not taken in timeout seconds"""
+        if self.is_mysql:
+            timeout = self.timeout if self.timeout is not None else -1
+            row = self.database.execute_sql(
+                'SELECT GET_LOCK(%s, %s)', (self.name, timeout if wait else 0),
+            ).fetchone()
+            if row[0] == 1:
+                return True
+        else:
+            self.model.create_table(safe=True)
+            started = time.monotonic()
+            while not self.insert_row():
+                if not wait or (
+                        self.timeout is not None and time.monotonic() - started >= self.timeout):
+                    break
+                time.sleep(self.poll)
+            else:
+                return True
+        if not wait:
+            return False
+        raise LockTimeout(
+            'Migrations of %s are locked by another process for more than %s s'
+            % (self.database.database, self.timeout),
+        )
+
+    def insert_row(self) -> bool:
+        now = datetime.datetime.now()
+        self.model.delete().where(
+            (self.model.name == self.name)
+            & (self.model.acquired_at < now - datetime.timedelta(seconds=self.stale_after)),
+        ).execute()
+        try:
+            with self.database.atomic():
+                self.model.insert(name=self.name, owner=self.owner, acquired_at=now).execute()
+        except IntegrityError:
+            return False
+        return True
+
+    def is_free(self) -> bool:
+        if self.is_mysql:
+            return self.database.execute_sql(
+                'SELECT IS_FREE_LOCK(%s)', (self.name,),
+            ).fetchone()[0] == 1
+        return not self.model.select().where(self.model.name == self.name).exists()
+
+    def wait_released(self):
+        """waits until the holder releases the lock, raises LockTimeout after timeout"""
+        started = time.monotonic()
+        while not self.is_free():
+            if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                raise LockTimeout(
+                    'Migrations of %s are still applied by another process after %s s'
+                    % (self.database.database, self.timeout),
+                )
+            time.sleep(self.poll)
+
+    def release(self):
+        if self.is_mysql:
+            self.database.execute_sql('SELECT RELEASE_LOCK(%s)', (self.name,))
+            return
+        self.model.delete().where(
+            (self.model.name == self.name) & (self.model.owner == self.owner),
+        ).execute()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""migrator used by generated migrations, look script.py"""
+from peewee import SQL, Entity, EnclosedNodeList, ForeignKeyField, NodeList, Value, callable_
+from peewee_extension.migration import online, scheduler
+from peewee_extension.migration.backfill import Backfill
+from playhouse.migrate import MySQLMigrator, _truncate_constraint_name, make_index_name, operation
+
+
+class MxMySQLMigrator(MySQLMigrator):
+    """MySQLMigrator that applies all the changes of a table with one ALTER TABLE.
+
+    alter_table takes operations made by the usual migrator methods (add_column,
+    drop_column, rename_column, alter_column_type, add_not_null, drop_not_null,
+    add_index, drop_index) and turns them into clauses of a single statement in
+    the given order, so InnoDB rebuilds the table once instead of once per column.
+    algorithm and lock are added as ALGORITHM=... and LOCK=... options, MySQL refuses
+    the statement instead of falling back to a costlier algorithm.
+    rebuild_table takes the same operations and applies them through a shadow table
+    for changes that would need a blocking copy, backfill updates existing rows in batches.
+    migrate applies operations like playhouse.migrate.migrate, with workers > 1
+    independent tables are altered in parallel (look scheduler.py)"""
+
+    merged_operations = (
+        'add_column', 'drop_column', 'rename_column', 'alter_column_type',
+        'add_not_null', 'drop_not_null', 'add_index', 'drop_index',
+    )
+    workers = 1
+
+    def migrate(self, *operations, dependencies=None):
+        """dependencies maps a table to the tables whose operations must be applied
+        before its own ones, used only with workers > 1"""
+        if self.workers <= 1:
+            for item in operations:
+                item.run()
+            return
+        scheduler.Scheduler(self.database, self.workers).run(operations, dependencies)
+
+    @operation
+    def alter_table(self, table, operations, algorithm=None, lock=None):
+        ctx = self.make_context()
+        clauses, dropped_defaults = self._make_clauses(ctx, table, operations)
+        if not clauses:
+            return []
+        if algorithm is not None:
+            clauses.append(SQL('ALGORITHM=%s' % algorithm))
+        if lock is not None:
+            clauses.append(SQL('LOCK=%s' % lock))
+
+        statements = [
+            self._alter_table(ctx, table).literal(' ').sql(NodeList(clauses, ', ')),
+        ]
+        if dropped_defaults:
+            statements.append(self._drop_defaults(table, dropped_defaults))
+        return statements
+
+    @operation
+    def rebuild_table(
+            self, table, operations, chunk_size=1000, sleep=0, max_threads_running=None,
+            drop_old=True,
+    ):
+        """applies the operations without blocking writes: the rows are copied
+        into an altered shadow table which replaces the table (look online.py)"""
+        ctx = self.make_context()
+        # в пустой теневой таблице внешних ключей еще нет, удалять нечего
+        clauses, dropped_defaults = self._make_clauses(ctx, table, operations, foreign_keys=False)
+        renames = {
+            item.args[2]: item.args[1] for item in operations if item.method == 'rename_column'
+        }
+        online.ShadowRebuild(
+            self, table, clauses, renames=renames, chunk_size=chunk_size, sleep=sleep,
+            max_threads_running=max_threads_running, drop_old=drop_old,
+        ).run()
+        if dropped_defaults:
+            return [self._drop_defaults(table, dropped_defaults)]
+        return []
+
+    @operation
+    def backfill(
+            self, table, values, primary_key=None, where=None, chunk_size=1000, sleep=0,
+            throttle=None, name=None,
+    ):
+        """updates existing rows in batches committed one by one instead of one huge
+        UPDATE, an interrupted backfill continues from the last key (look backfill.py)"""
+        if primary_key is None:
+            primary_key = self.database.get_primary_keys(table)
+        Backfill(
+            self.database, table, values, primary_key, where=where, chunk_size=chunk_size,
+            sleep=sleep, throttle=throttle, name=name,
+        ).run()
+        return []
+
+    def _make_clauses(self, ctx, table, operations, foreign_keys=True) -> tuple:
+        """returns (clauses, columns with temporary defaults) of the operations"""
+        clauses = []
+        dropped_defaults = []
+        for item in operations:
+            if item.method not in self.merged_operations:
+                raise ValueError('%s can not be merged into ALTER TABLE' % item.method)
+            if item.args[0] != table:
+                raise ValueError(
+                    '%s of table %s can not be merged into ALTER TABLE %s'
+                    % (item.method, item.args[0], table),
+                )
+            kwargs = dict(item.kwargs)
+            if item.method == 'drop_column':
+                kwargs['foreign_keys'] = foreign_keys
+            method = getattr(self, '_%s_clauses' % item.method)
+            clauses.extend(method(ctx, *item.args, **kwargs))
+            if item.method == 'add_column' and self._has_temporary_default(item.args[2]):
+                dropped_defaults.append(item.args[1])
+        return clauses, dropped_defaults
+
+    def _drop_defaults(self, table, column_names):
+        # the default only fills existing rows, python models keep defaults themselves
+        return self._alter_table(self.make_context(), table).literal(' ').sql(NodeList([
+            NodeList((SQL('ALTER COLUMN'), Entity(column_name), SQL('DROP DEFAULT')))
+            for column_name in column_names
+        ], ', '))
+
+    @staticmethod
+    def _has_temporary_default(field):
+        return not field.null and field.default is not None
+
+    def _add_column_clauses(self, ctx, table, column_name, field):
+        if field.column_name != column_name:
+            field.name = field.column_name = column_name
+        column_def = [SQL('ADD COLUMN'), field.ddl(ctx)]
+        if self._has_temporary_default(field):
+            default = field.default
+            if callable_(default):
+                default = default()
+            column_def.extend((SQL('DEFAULT'), Value(field.db_value(default))))
+        clauses = [NodeList(column_def)]
+
+        if isinstance(field, ForeignKeyField):
+            constraint = 'fk_%s_%s_refs_%s' % (table, column_name, field.rel_model._meta.table_name)
+            foreign_key = [
+                SQL('ADD CONSTRAINT'), Entity(_truncate_constraint_name(constraint)),
+                SQL('FOREIGN KEY'), EnclosedNodeList((Entity(column_name),)),
+                SQL('REFERENCES'), Entity(field.rel_model._meta.table_name),
+                EnclosedNodeList((Entity(field.rel_field.column_name),)),
+            ]
+            if field.on_delete is not None:
+                foreign_key.append(SQL('ON DELETE %s' % field.on_delete))
+            if field.on_update is not None:
+                foreign_key.append(SQL('ON UPDATE %s' % field.on_update))
+            clauses.append(NodeList(foreign_key))
+
+        if field.index or field.unique:
+            clauses.extend(self._add_index_clauses(ctx, table, (column_name,), field.unique))
+        return clauses
+
+    def _drop_column_clauses(self, ctx, table, column_name, cascade=True, foreign_keys=True):
+        clauses = []
+        foreign_key_columns = []
+        if foreign_keys:
+            foreign_key_columns = [
+                foreign_key.column for foreign_key in self.database.get_foreign_keys(table)
+            ]
+        if column_name in foreign_key_columns:
+            clauses.append(NodeList((
+                SQL('DROP FOREIGN KEY'),
+                Entity(self.get_foreign_key_constraint(table, column_name)),
+            )))
+        clauses.append(NodeList((SQL('DROP COLUMN'), Entity(column_name))))
+        return clauses
+
+    def _rename_column_clauses(self, ctx, table, old_name, new_name):
+        # foreign keys follow the renamed column, no need to recreate them
+        return [NodeList((SQL('RENAME COLUMN'), Entity(old_name), SQL('TO'), Entity(new_name)))]
+
+    def _alter_column_type_clauses(self, ctx, table, column, field, cast=None):
+        if cast is not None:
+            raise ValueError('alter_column_type() does not support cast with MySQL.')
+        if field.column_name != column:
+            field.name = field.column_name = column
+        return [NodeList((SQL('MODIFY'), field.ddl(ctx)))]
+
+    def _add_not_null_clauses(self, ctx, table, column):
+        column_def = self._get_column_definition(table, column)
+        return [NodeList((SQL('MODIFY'), column_def.sql(is_null=False)))]
+
+    def _drop_not_null_clauses(self, ctx, table, column):
+        column_def = self._get_column_definition(table, column)
+        if column_def.is_pk:
+            raise ValueError('Primary keys can not be null')
+        return [NodeList((SQL('MODIFY'), column_def.sql(is_null=True)))]
+
+    def _add_index_clauses(self, ctx, table, columns, unique=False, using=None):
+        index = [SQL('ADD UNIQUE INDEX' if unique else 'ADD INDEX')]
+        index.append(Entity(make_index_name(table, columns)))
+        if using is not None:
+            index.append(SQL('USING %s' % using))
+        index.append(EnclosedNodeList([Entity(column) for column in columns]))
+        return [NodeList(index)]
+
+    def _drop_index_clauses(self, ctx, table, index_name):
+        return [NodeList((SQL('DROP INDEX'), Entity(index_name)))]
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from peewee import (
-    BooleanField, CharField, DatabaseProxy,
-    DateTimeField, Model,
+    BigIntegerField, BooleanField, CharField, DatabaseProxy,
+    DateTimeField, Model, TextField,
 )
 
 db = DatabaseProxy()
@@ -16,3 +16,36 @@ class Migration(Model):
     class Meta:
         database = db
         table_name = 'pe_migrations'
+
+
+class BackfillProgress(Model):
+    """last processed key of an interrupted backfill (look backfill.py)"""
+    name = CharField(max_length=255, unique=True)
+    last_key = TextField()
+    rows = BigIntegerField(default=0)
+
+    class Meta:
+        database = db
+        table_name = 'pe_backfills'
+
+
+class Lock(Model):
+    """lock of migrations for databases without GET_LOCK (look lock.py)"""
+    name = CharField(max_length=255, primary_key=True)
+    owner = CharField(max_length=255)
+    acquired_at = DateTimeField()
+
+    class Meta:
+        database = db
+        table_name = 'pe_locks'
+
+
+SERVICE_TABLES = ('pe_migrations', 'pe_backfills', 'pe_locks')
+
+
+def bind_copy(model, database):
+    """copy of a service model bound to the database. unlike Model.bind and bind_ctx
+    it doesn't change the model, so databases migrated at the same time in
+    different threads (look shards.py, scheduler.py) don't interfere"""
+    meta = type('Meta', (), {'database': database, 'table_name': model._meta.table_name})
+    return type(model.__name__, (model,), {'Meta': meta, '__module__': model.__module__})
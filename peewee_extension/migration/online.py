@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""online rebuild of a table through a shadow table, used by migrations
+for changes that MySQL can do only with a blocking table copy (look migrator.py)
+
+    1. the shadow table _<table>_new is created like the table and altered
+    2. triggers on the table repeat every insert, update and delete on the shadow
+    3. rows are copied in primary key ranged batches with throttling
+    4. RENAME TABLE swaps the tables atomically, the old one is dropped"""
+import time
+
+from peewee import NodeList
+from peewee_extension.migration.backfill import (
+    get_range_condition, iter_key_ranges, quote, quote_list,
+)
+
+FOREIGN_KEYS_SQL = """
+    SELECT k.constraint_name, k.column_name, k.referenced_table_name,
+        k.referenced_column_name, r.update_rule, r.delete_rule
+    FROM information_schema.key_column_usage k
+    JOIN information_schema.referential_constraints r
+        ON r.constraint_schema = k.table_schema AND r.constraint_name = k.constraint_name
+    WHERE k.table_schema = DATABASE() AND k.table_name = %s
+        AND k.referenced_table_name IS NOT NULL
+    ORDER BY k.constraint_name, k.ordinal_position
+"""
+
+REFERENCING_TABLES_SQL = """
+    SELECT DISTINCT table_name FROM information_schema.key_column_usage
+    WHERE table_schema = DATABASE() AND referenced_table_name = %s AND table_name != %s
+"""
+
+MAX_NAME_LENGTH = 64
+
+
+class ShadowRebuild:
+    """Online rebuild of one table.
+
+    clauses are the clauses of ALTER TABLE (peewee nodes, look MxMySQLMigrator)
+    applied to the empty shadow table, renames maps new column names to old ones.
+    the table must have a primary key and must not be referenced by foreign keys
+    of other tables, they would follow the old table on the swap"""
+
+    def __init__(
+            self, migrator, table, clauses, renames=None, chunk_size=1000, sleep=0,
+            max_threads_running=None, drop_old=True,
+    ):
+        self.migrator = migrator
+        self.database = migrator.database
+        self.table = table
+        self.clauses = clauses
+        self.renames = renames or {}
+        self.chunk_size = chunk_size
+        self.sleep = sleep
+        self.max_threads_running = max_threads_running
+        self.drop_old = drop_old
+        self.shadow = ('_%s_new' % table)[:MAX_NAME_LENGTH]
+        self.old = ('_%s_old' % table)[:MAX_NAME_LENGTH]
+        self.triggers = {
+            event: ('pe_%s_%s' % (table, event))[:MAX_NAME_LENGTH]
+            for event in ('ins', 'upd', 'del')
+        }
+        self.copied = 0
+
+    def execute(self, sql, params=None):
+        return self.database.execute_sql(sql, params)
+
+    def run(self):
+        self.check()
+        try:
+            self.create_shadow()
+            columns = self.get_copied_columns()
+            primary_key = self.get_primary_key()
+            self.create_triggers(columns, primary_key)
+            self.copy_rows(columns, primary_key)
+            self.swap()
+        except BaseException:
+            self.cleanup()
+            raise
+        print('Rebuilt', self.table, 'online,', self.copied, 'rows copied')
+
+    def check(self):
+        referencing = [
+            row[0] for row in self.execute(REFERENCING_TABLES_SQL, (self.table, self.table))
+        ]
+        if referencing:
+            raise ValueError(
+                'Table %s is referenced by foreign keys of %s, it can not be rebuilt online'
+                % (self.table, ', '.join(referencing)),
+            )
+        if self.shadow in self.database.get_tables():
+            raise ValueError(
+                'Shadow table %s already exists, a previous rebuild was interrupted' % self.shadow,
+            )
+
+    def create_shadow(self):
+        self.execute('CREATE TABLE %s LIKE %s' % (quote(self.shadow), quote(self.table)))
+        if self.clauses:
+            ctx = self.migrator.make_context()
+            ctx = self.migrator._alter_table(ctx, self.shadow).literal(' ')
+            self.database.execute(ctx.sql(NodeList(self.clauses, ', ')))
+        self.copy_foreign_keys()
+
+    def copy_foreign_keys(self):
+        """CREATE TABLE ... LIKE doesn't copy foreign keys, they are added to the shadow
+        with the names toggled by the leading underscore, as constraint names are unique"""
+        new_names = {old: new for new, old in self.renames.items()}
+        shadow_columns = {column.name for column in self.database.get_columns(self.shadow)}
+        constraints = {}
+        for name, column, dest_table, dest_column, on_update, on_delete in self.execute(
+                FOREIGN_KEYS_SQL, (self.table,)):
+            constraint = constraints.setdefault(name, {
+                'columns': [], 'dest_table': dest_table, 'dest_columns': [],
+                'on_update': on_update, 'on_delete': on_delete,
+            })
+            constraint['columns'].append(new_names.get(column, column))
+            constraint['dest_columns'].append(dest_column)
+        for name, constraint in constraints.items():
+            if not set(constraint['columns']) <= shadow_columns:
+                continue  # колонку удалили вместе с внешним ключом
+            shadow_name = name[1:] if name.startswith('_') else ('_' + name)[:MAX_NAME_LENGTH]
+            self.execute(
+                'ALTER TABLE %s ADD CONSTRAINT %s FOREIGN KEY (%s) REFERENCES %s (%s) '
+                'ON UPDATE %s ON DELETE %s' % (
+                    quote(self.shadow), quote(shadow_name), quote_list(constraint['columns']),
+                    quote(constraint['dest_table']), quote_list(constraint['dest_columns']),
+                    constraint['on_update'], constraint['on_delete'],
+                ),
+            )
+
+    def get_copied_columns(self) -> list:
+        """pairs (column of the shadow, column of the table) that are copied"""
+        table_columns = {column.name for column in self.database.get_columns(self.table)}
+        columns = []
+        for column in self.database.get_columns(self.shadow):
+            source = self.renames.get(column.name, column.name)
+            if source in table_columns:
+                columns.append((column.name, source))
+        return columns
+
+    def get_primary_key(self) -> list:
+        """pairs (column of the shadow, column of the table) of the primary key"""
+        primary_key = self.database.get_primary_keys(self.table)
+        if not primary_key:
+            raise ValueError(
+                'Table %s has no primary key, it can not be rebuilt online' % self.table,
+            )
+        new_names = {old: new for new, old in self.renames.items()}
+        shadow_columns = {column.name for column in self.database.get_columns(self.shadow)}
+        pairs = []
+        for column in primary_key:
+            shadow_column = new_names.get(column, column)
+            if shadow_column not in shadow_columns:
+                raise ValueError(
+                    'Primary key column %s.%s is dropped, it can not be rebuilt online'
+                    % (self.table, column),
+                )
+            pairs.append((shadow_column, column))
+        return pairs
+
+    def create_triggers(self, columns, primary_key):
+        shadow_columns = quote_list(column for column, source in columns)
+        new_values = ', '.join('NEW.%s' % quote(source) for column, source in columns)
+        replace = 'REPLACE INTO %s (%s) VALUES (%s)' % (
+            quote(self.shadow), shadow_columns, new_values,
+        )
+        delete = 'DELETE IGNORE FROM %s WHERE (%s) = (%s)' % (
+            quote(self.shadow),
+            quote_list(column for column, source in primary_key),
+            ', '.join('OLD.%s' % quote(source) for column, source in primary_key),
+        )
+        triggers = {
+            'ins': ('AFTER INSERT', replace),
+            'upd': ('AFTER UPDATE', 'BEGIN %s; %s; END' % (delete, replace)),
+            'del': ('AFTER DELETE', delete),
+        }
+        for event, (timing, body) in triggers.items():
+            self.execute('CREATE TRIGGER %s %s ON %s FOR EACH ROW %s' % (
+                quote(self.triggers[event]), timing, quote(self.table), body,
+            ))
+
+    def drop_triggers(self):
+        for trigger in self.triggers.values():
+            self.execute('DROP TRIGGER IF EXISTS %s' % quote(trigger))
+
+    def throttle(self):
+        if self.sleep:
+            time.sleep(self.sleep)
+        if self.max_threads_running is None:
+            return
+        while True:
+            row = self.execute("SHOW GLOBAL STATUS LIKE 'Threads_running'").fetchone()
+            if int(row[1]) <= self.max_threads_running:
+                return
+            time.sleep(max(self.sleep, 1))
+
+    def copy_rows(self, columns, primary_key):
+        """copies rows in batches of chunk_size by ranges of the primary key,
+        rows already written by the triggers are newer and are kept (INSERT IGNORE)"""
+        key = [source for column, source in primary_key]
+        insert = 'INSERT IGNORE INTO %s (%s) SELECT %s FROM %s' % (
+            quote(self.shadow), quote_list(column for column, source in columns),
+            quote_list(source for column, source in columns), quote(self.table),
+        )
+        for lower, upper in iter_key_ranges(self.database, self.table, key, self.chunk_size):
+            condition, params = get_range_condition(key, lower, upper)
+            with self.database.atomic():
+                cursor = self.execute(
+                    insert + ' WHERE ' + condition + ' LOCK IN SHARE MODE', params,
+                )
+            self.copied += cursor.rowcount
+            if upper is not None:
+                self.throttle()
+
+    def swap(self):
+        self.execute('RENAME TABLE %s TO %s, %s TO %s' % (
+            quote(self.table), quote(self.old), quote(self.shadow), quote(self.table),
+        ))
+        # после переименования триггеры остались на старой таблице
+        self.drop_triggers()
+        if self.drop_old:
+            self.execute('DROP TABLE %s' % quote(self.old))
+
+    def cleanup(self):
+        self.drop_triggers()
+        self.execute('DROP TABLE IF EXISTS %s' % quote(self.shadow))
+
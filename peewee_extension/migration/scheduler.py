@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""parallel application of migration operations (look MxMySQLMigrator.migrate)
+
+operations are grouped by table, the operations of one table are applied by one
+worker in the given order. a table waits for the tables it is related to by foreign
+keys, independent tables are altered at the same time on separate connections,
+at most workers of them, so a migration takes about the time of its slowest table"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from peewee import ForeignKeyField
+from peewee_extension.migration.graph import sort_tables
+from playhouse.migrate import Operation
+
+
+def get_table(operation: Operation) -> str:
+    """all the migrator operations take the table name first"""
+    if operation.args:
+        return operation.args[0]
+    return operation.kwargs['table']
+
+
+def get_references(operation: Operation) -> set:
+    """tables referenced by foreign keys the operation adds, merged operations
+    of alter_table and rebuild_table are looked through"""
+    references = set()
+    for arg in list(operation.args) + list(operation.kwargs.values()):
+        if isinstance(arg, ForeignKeyField):
+            references.add(arg.rel_model._meta.table_name)
+        elif isinstance(arg, (list, tuple)):
+            for item in arg:
+                if isinstance(item, Operation):
+                    references |= get_references(item)
+    return references
+
+
+def make_tasks(operations, dependencies: dict = None) -> tuple:
+    """groups the operations by table keeping their order, dependencies maps a table
+    to the tables whose operations go first (look DbNode.get_dependencies).
+    returns (tables, operations of every table, tables every table waits for),
+    tables are ordered by sort_tables, of two related tables the latter waits,
+    so related tables are never altered at the same time even in a reference cycle"""
+    aliases = {}
+    tasks = {}
+    graph = {}
+    for operation in operations:
+        table = get_table(operation)
+        table = aliases.get(table, table)
+        tasks.setdefault(table, []).append(operation)
+        graph.setdefault(table, set()).update(get_references(operation))
+        if operation.method == 'rename_table':
+            # later operations of the renamed table go to the same worker
+            aliases[operation.args[1]] = table
+    for table, tables in (dependencies or {}).items():
+        table = aliases.get(table, table)
+        if table in graph:
+            graph[table].update(tables)
+    graph = {
+        table: {aliases.get(dest, dest) for dest in refs} for table, refs in graph.items()
+    }
+
+    order, deferred = sort_tables(graph)
+    position = {table: i for i, table in enumerate(order)}
+    waits = {table: set() for table in order}
+    for table, refs in graph.items():
+        for dest in refs:
+            if dest in position and dest != table:
+                first, second = sorted((table, dest), key=position.get)
+                waits[second].add(first)
+    return order, tasks, waits
+
+
+class Scheduler:
+    """Applies operations of independent tables in parallel.
+
+    every worker thread opens its own connection of the database (peewee keeps
+    connections per thread), so there are at most workers connections besides
+    the connection of the caller. if a table fails the tables which are not started
+    yet are skipped, the tables being migrated are waited for, then the error is raised"""
+
+    def __init__(self, database, workers: int):
+        self.database = database
+        self.workers = workers
+
+    def run_table(self, table, operations):
+        started = time.monotonic()
+        with self.database.connection_context():
+            for operation in operations:
+                operation.run()
+        print('Migrated', table, 'in %.1f s' % (time.monotonic() - started))
+
+    def run(self, operations, dependencies: dict = None):
+        order, tasks, waits = make_tasks(operations, dependencies)
+        pending = list(order)
+        running = {}
+        done = set()
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if not failed:
+                    for table in [table for table in pending if waits[table] <= done]:
+                        pending.remove(table)
+                        future = executor.submit(self.run_table, table, tasks[table])
+                        running[future] = table
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    table = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        done.add(table)
+                    else:
+                        print('Failed to migrate', table, error)
+                        failed[table] = error
+
+        if failed:
+            error = failed[min(failed, key=order.index)]
+            raise Exception(
+                'Failed to migrate %s, not started: %s, done: %s' % (
+                    ', '.join(sorted(failed)), ', '.join(pending) or '-',
+                    ', '.join(table for table in order if table in done) or '-',
+                ),
+            ) from error
+        return order
@@ -30,54 +30,41 @@ def get_models_order(diff_graph):
     pass
 
 
-seen = set()
-
-
 def get_models_right_order(
-        diff_graph: peewee_extension.migration.graph.DbNode,
-        table_name, right_order, accum=None,
-):
-
-    accum = accum or []
-    foreign_keys_columns = diff_graph.tables[table_name].get_foreign_key_columns()
-    for foreign_key_column in foreign_keys_columns:
-        column = diff_graph.tables[table_name].columns[foreign_key_column].refl_column
-        dest = column.foreign_key.dest_table
+        diff_graph: peewee_extension.migration.graph.DbNode, tables,
+) -> list:
+    """returns tables and the tables they reference ordered so that
+    referenced tables go first"""
+    return diff_graph.get_right_order(tables=tables)
 
-        # In the event the destination table has already been pushed
-        # for printing, then we have a reference cycle.
-        if dest in accum and table_name not in accum:
-            print('# Possible reference cycle: %s' % dest)
 
-        # If this is not a column-referential foreign key, and we have
-        # not already processed the destination table, do so now.
-        if dest not in seen and dest not in accum:
-            seen.add(dest)
-            if dest != table_name:
-                get_models_right_order(diff_graph, dest, right_order, accum + [table_name])
+def iter_models(diff_graph: peewee_extension.migration.graph.DbNode, tables: list):
+    """yields model descriptions of the given tables one by one"""
+    for table in tables:
+        table = diff_graph.tables[table]
+        # у измененной таблицы модель для внешних ключей - заглушка (см. DbNode.get_diff)
+        yield from (table.stub or table).iter_model()
 
-    right_order.append(table_name)
-    seen.add(table_name)
 
-
-def make(
+def iter_script(
         diff_graph: peewee_extension.migration.graph.DbNode,
         models_file: str, main_temp=None, model_temp=None, empty_temp=None,
-) -> str:
-    """ генерирует скрипт в строковом формате по разностному графу
-    с использованием готовых темплэйтов"""
+        online_rebuild: bool = False, squashed: list = None,
+):
+    """ генерирует скрипт по разностному графу с использованием готовых темплэйтов,
+    отдавая его по частям, чтобы не держать весь скрипт в памяти,
+    online_rebuild - перестраивать через теневую таблицу вместо блокирующего копирования,
+    squashed - миграции, которые заменяет базовая миграция (см. squash.py)"""
     if not diff_graph:
         empty_temp = Path(__file__).parent / 'templates' / 'empty_migration.j2'
         with open(empty_temp, 'r') as file_handle:
-            script = file_handle.read()
-        return script
+            yield file_handle.read()
+        return
 
     if main_temp is None:
         main_temp = Path(__file__).parent / 'templates' / 'migration_template.j2'
     if model_temp is None:
         model_temp = Path(__file__).parent / 'templates' / 'table_model_template.j2'
-    query = diff_graph.as_pycode()
-    reversed_query = diff_graph.as_pycode_reversed()
     tables_to_add = diff_graph.get_tables_mode_add()
     tables_to_delete = diff_graph.get_tables_mode_delete()
     tables_to_print = {}
@@ -99,22 +86,14 @@ def make(
             if dest not in tables_to_print:
                 tables_to_print[dest] = column.get_field_parameters()['model']
     fields = diff_graph.get_fields_names()
-    models_description = ''
     models_names_for_deleting = []
-    right_order = []
-    for table in tables_to_print.keys():
-        if table not in seen:
-            get_models_right_order(diff_graph, table, right_order)
+    right_order = get_models_right_order(diff_graph, tables_to_print.keys())
     models_names_for_adding = []
     for table in right_order:
         if table in tables_to_delete:
             models_names_for_deleting.append(diff_graph.tables[table].model)
-            models_description += diff_graph.tables[table].get_model()
         elif table in tables_to_add:
             models_names_for_adding.append(diff_graph.tables[table].model)
-            models_description += diff_graph.tables[table].get_model()
-        else:
-            models_description += diff_graph.tables[table].get_model()
 
     with open(main_temp, 'r') as file_handle:
         script = file_handle.read()
@@ -127,22 +106,35 @@ def make(
     data = {
         'peewee_fields': get_peewee_fields_used(fields),
         'core_fields': get_additional_fields_used(fields),
-        'migrations': query,
-        'reversed_migrations': reversed_query,
+        'migrations': diff_graph.iter_pycode(online_rebuild=online_rebuild),
+        'reversed_migrations': diff_graph.iter_pycode_reversed(online_rebuild=online_rebuild),
+        'dependencies': diff_graph.get_dependencies(),
+        'reversed_dependencies': diff_graph.get_dependencies(reverse=True),
         'tables_to_delete': models_names_for_deleting,
         'tables_to_add': models_names_for_adding,
         'fields': fields,
         'model_init': model_init,
-        'models_to_delete': models_description,
+        'has_models': bool(right_order),
+        'models_to_delete': iter_models(diff_graph, right_order),
         'models_file': models_file,
+        'squashed': squashed,
     }
-    script = script.render(data)
-    script = script + '\n'
-    return script
+    yield from script.generate(data)
+    yield '\n'
+
+
+def make(
+        diff_graph: peewee_extension.migration.graph.DbNode,
+        models_file: str, main_temp=None, model_temp=None, empty_temp=None,
+) -> str:
+    """ генерирует скрипт в строковом формате по разностному графу
+    с использованием готовых темплэйтов"""
+    return ''.join(iter_script(diff_graph, models_file, main_temp, model_temp, empty_temp))
 
 
-def write_in_file(migrations_path: str, db_name: str, script: str, migration_name: str = None):
-    """ записывает скрипт в файл с названием вида ГГГГММДДччммсс_имябд_затронутыетаблицы"""
+def write_in_file(migrations_path: str, db_name: str, script, migration_name: str = None):
+    """ записывает скрипт в файл с названием вида ГГГГММДДччммсс_имябд_затронутыетаблицы,
+    script - строка или итератор частей скрипта (см. iter_script)"""
     if migration_name:
         filepath = str(migrations_path) + '/' + migration_name + '.py'
     else:
@@ -150,6 +142,9 @@ def write_in_file(migrations_path: str, db_name: str, script: str, migration_nam
         date_time = date_time.strftime('%Y%m%d%H%M%S')
         filepath = str(migrations_path) + '/' + date_time + '_' + db_name
         filepath = filepath + '.py'
+    if isinstance(script, str):
+        script = [script]
     with open(filepath, 'w') as file_handle:
-        file_handle.write(script)
+        for chunk in script:
+            file_handle.write(chunk)
     return filepath
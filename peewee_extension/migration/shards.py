@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""running the migration tools on many databases (shards) with the same schema
+
+shards are given as db urls or manifest files listing db urls (one per line,
+# for comments, or a json list), every shard is processed in its own thread,
+at most jobs shards at the same time. a failed shard doesn't stop the others,
+its error is kept in the result and reported in the summary"""
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlparse
+
+from termcolor import colored, cprint
+
+
+def read_manifest(path) -> list:
+    """db urls of a shard manifest file"""
+    with open(path, 'r') as file_handle:
+        content = file_handle.read()
+    if Path(path).suffix == '.json':
+        return list(json.loads(content))
+    urls = []
+    for line in content.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if line:
+            urls.append(line)
+    return urls
+
+
+def get_shard_urls(items: list) -> list:
+    """db urls out of urls and manifest files, duplicates are dropped"""
+    urls = []
+    for item in items:
+        if '://' not in item and Path(item).is_file():
+            shard_urls = read_manifest(item)
+        else:
+            shard_urls = [item]
+        for url in shard_urls:
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def get_shard_name(db_url: str) -> str:
+    """host:port/db of a db url, without user and password"""
+    parsed = urlparse(db_url)
+    host = parsed.hostname or ''
+    if parsed.port:
+        host = '%s:%s' % (host, parsed.port)
+    return '%s%s' % (host, parsed.path)
+
+
+def get_shard_dirname(db_url: str) -> str:
+    """shard name usable as a directory name, e.g. for the schema cache of the shard"""
+    return re.sub(r'[^\w.-]+', '_', get_shard_name(db_url)).strip('_')
+
+
+class ShardResult:
+    __slots__ = ('name', 'db_url', 'result', 'error', 'seconds')
+
+    def __init__(self, name, db_url, result=None, error=None, seconds=0):
+        self.name = name
+        self.db_url = db_url
+        self.result = result
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def run_shard(function, db_url: str) -> ShardResult:
+    name = get_shard_name(db_url)
+    started = time.monotonic()
+    try:
+        result = function(db_url)
+    except Exception as err:  # ошибка одного шарда не останавливает остальные
+        return ShardResult(name, db_url, error=err, seconds=time.monotonic() - started)
+    return ShardResult(name, db_url, result=result, seconds=time.monotonic() - started)
+
+
+def run_on_shards(db_urls: list, function, jobs: int = 4) -> list:
+    """calls function(db_url) for every shard, at most jobs at the same time,
+    prints every shard as it is done, returns ShardResult's in the order of db_urls"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {executor.submit(run_shard, function, db_url): db_url for db_url in db_urls}
+        for future in as_completed(futures):
+            shard = future.result()
+            results[futures[future]] = shard
+            if shard.ok:
+                cprint(f'[{shard.name}] done in {shard.seconds:.1f} s', color='green')
+            else:
+                cprint(f'[{shard.name}] failed: {shard.error}', color='red')
+    return [results[db_url] for db_url in db_urls]
+
+
+def print_summary(results: list) -> bool:
+    """prints which shards succeeded and which failed, True if all of them succeeded"""
+    succeeded = [shard for shard in results if shard.ok]
+    failed = [shard for shard in results if not shard.ok]
+    print('Succeeded on %d of %d shards' % (len(succeeded), len(results)))
+    for shard in succeeded:
+        print('   ', colored(shard.name, color='green'))
+    for shard in failed:
+        print('   ', colored(shard.name, color='red'), shard.error)
+    return not failed
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""module to save a database graph (look graph.py) into a snapshot file and load it back,
+so graphs can be compared without a database connection or importing models
+
+snapshot is a versioned json document, files ending with .gz are gzip compressed"""
+import gzip
+import importlib
+import json
+from pathlib import Path
+
+import peewee
+from peewee import ForeignKeyMetadata
+from peewee_extension import core
+from peewee_extension.migration import graph
+from playhouse.reflection import Column, UnknownField
+
+SNAPSHOT_FORMAT = 'peewee_extension.snapshot'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIXES = ('.json', '.gz')
+
+
+def is_snapshot(source) -> bool:
+    """function to check whether db_url/models option points to a snapshot file"""
+    if not source:
+        return False
+    path = Path(str(source))
+    return path.suffix in SNAPSHOT_SUFFIXES and path.is_file()
+
+
+def get_snapshot_name(source) -> str:
+    """function to get snapshot name without suffixes, used instead of database name"""
+    name = Path(str(source)).name
+    return name.split('.')[0]
+
+
+def field_class_to_str(field_class) -> str:
+    return '%s:%s' % (field_class.__module__, field_class.__name__)
+
+
+def field_class_from_str(value: str):
+    module_name, class_name = value.split(':')
+    for module in (core, peewee):
+        if hasattr(module, class_name):
+            return getattr(module, class_name)
+    try:
+        return getattr(importlib.import_module(module_name), class_name)
+    except (ImportError, AttributeError):
+        print('WARNING unknown field class', value)
+        return UnknownField
+
+
+def dump_default(default):
+    """callable defaults of python models are stored as {'callable': 'module:qualname'},
+    the ones that can't be imported back (lambdas, local functions) are dropped,
+    defaults are not used for diffing"""
+    if default is None or isinstance(default, (str, int, float, bool)):
+        return default
+    if callable(default):
+        # у встроенных методов (datetime.now) модуль берется у класса
+        module_name = getattr(default, '__module__', None) or getattr(
+            getattr(default, '__self__', None), '__module__', None,
+        )
+        qualname = getattr(default, '__qualname__', '')
+        if module_name and qualname and '<' not in qualname:
+            return {'callable': '%s:%s' % (module_name, qualname)}
+    return None
+
+
+def load_default(value):
+    if not isinstance(value, dict):
+        return value
+    module_name, qualname = value['callable'].split(':')
+    try:
+        default = importlib.import_module(module_name)
+        for name in qualname.split('.'):
+            default = getattr(default, name)
+    except (ImportError, AttributeError):
+        print('WARNING unknown default', value['callable'])
+        return None
+    return default
+
+
+def dump_column(column_node: graph.ColumnNode) -> dict:
+    refl_column = column_node.refl_column
+    data = {
+        'name': refl_column.name,
+        'column_name': refl_column.column_name,
+        'field_class': field_class_to_str(refl_column.field_class),
+        'raw_column_type': refl_column.raw_column_type,
+        'nullable': refl_column.nullable,
+        'primary_key': refl_column.primary_key,
+        'index': refl_column.index,
+        'unique': refl_column.unique,
+        'default': dump_default(refl_column.default),
+        'extra_parameters': refl_column.extra_parameters,
+    }
+    if refl_column.is_foreign_key():
+        data['foreign_key'] = list(refl_column.foreign_key)
+        data['rel_model'] = refl_column.rel_model
+        data['to_field'] = refl_column.to_field
+        data['related_name'] = refl_column.related_name
+    return data
+
+
+def load_column(name: str, data: dict) -> graph.ColumnNode:
+    refl_column = Column(
+        data['name'],
+        field_class=field_class_from_str(data['field_class']),
+        raw_column_type=data['raw_column_type'],
+        nullable=data['nullable'],
+        primary_key=data['primary_key'],
+        column_name=data['column_name'],
+        index=data['index'],
+        unique=data['unique'],
+        default=load_default(data['default']),
+        extra_parameters=data['extra_parameters'],
+    )
+    if 'foreign_key' in data:
+        refl_column.foreign_key = ForeignKeyMetadata(*data['foreign_key'])
+        refl_column.rel_model = data['rel_model']
+        refl_column.to_field = data['to_field']
+        refl_column.related_name = data['related_name']
+    return graph.ColumnNode(name, refl_column=refl_column)
+
+
+def dump_table(table_node: graph.TableNode) -> dict:
+    return {
+        'model': table_node.model,
+        'primary_key': table_node.primary_key.columns,
+        'has_foreign_keys': table_node.has_foreign_keys,
+        'columns': {
+            name: dump_column(column) for name, column in table_node.columns.items()
+        },
+        'indexes': [
+            {'columns': index.indexes, 'unique': index.unique, 'name': index.name}
+            for index in table_node.indexes
+        ],
+    }
+
+
+def load_table(name: str, data: dict) -> graph.TableNode:
+    return graph.TableNode(
+        name,
+        primary_key=graph.PrimaryKeyNode(data['primary_key']),
+        columns={
+            column_name: load_column(column_name, column)
+            for column_name, column in data['columns'].items()
+        },
+        model=data['model'],
+        indexes=[
+            graph.IndexNode(index['columns'], index['unique'], name=index.get('name'))
+            for index in data['indexes']
+        ],
+        has_foreign_keys=data['has_foreign_keys'],
+    )
+
+
+def get_table_references(data: dict) -> set:
+    """tables referenced by the foreign keys of a table dict made by dump_table"""
+    return {
+        column['foreign_key'][1] for column in data['columns'].values() if 'foreign_key' in column
+    }
+
+
+def dump_graph(db_node: graph.DbNode) -> dict:
+    """function that converts a database graph into a json-compatible dict"""
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'tables': {name: dump_table(table) for name, table in db_node.tables.items()},
+    }
+
+
+def load_graph(data: dict) -> graph.DbNode:
+    """function that builds a database graph out of a dict made by dump_graph"""
+    if data.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError('Not a peewee_extension snapshot')
+    if data.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version {data.get("version")}')
+    return graph.DbNode({name: load_table(name, table) for name, table in data['tables'].items()})
+
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def save(db_node: graph.DbNode, path):
+    """function that writes a database graph into a snapshot file"""
+    with _open(path, 'w') as file_handle:
+        json.dump(dump_graph(db_node), file_handle, separators=(',', ':'))
+    return path
+
+
+def load(path) -> graph.DbNode:
+    """function that reads a database graph from a snapshot file"""
+    with _open(path, 'r') as file_handle:
+        return load_graph(json.load(file_handle))
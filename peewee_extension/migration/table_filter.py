@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""filter of the tables a migration is made for (only_tables option).
+
+an item of the filter is a table name, a glob pattern (iss_*, log_[0-9]*) or
+a regular expression after re: (re:^iss_(queries|statements)$), the expression
+must match the whole name. the graph builders load only the matching tables and
+the tables they reference by foreign keys, so a migration of a few tables doesn't
+introspect the whole schema and the referenced stub tables are still resolved"""
+import fnmatch
+import re
+
+REGEX_PREFIX = 're:'
+GLOB_CHARS = '*?['
+
+
+def is_pattern(item: str) -> bool:
+    return item.startswith(REGEX_PREFIX) or any(char in item for char in GLOB_CHARS)
+
+
+class TableFilter:
+
+    def __init__(self, items):
+        self.names = set()
+        self.globs = []
+        self.regexes = []
+        for item in items:
+            if item.startswith(REGEX_PREFIX):
+                self.regexes.append(re.compile(item[len(REGEX_PREFIX):]))
+            elif is_pattern(item):
+                self.globs.append(item)
+            else:
+                self.names.add(item)
+
+    @property
+    def has_patterns(self) -> bool:
+        """without patterns the filter is just a list of names,
+        it can be applied without knowing all the tables"""
+        return bool(self.globs or self.regexes)
+
+    def match(self, table_name: str) -> bool:
+        return (
+            table_name in self.names
+            or any(fnmatch.fnmatchcase(table_name, glob) for glob in self.globs)
+            or any(regex.fullmatch(table_name) for regex in self.regexes)
+        )
+
+    def select(self, table_names) -> list:
+        return sorted(table_name for table_name in table_names if self.match(table_name))
+
+
+def expand(table_names, get_references) -> set:
+    """table_names and the tables they reference by foreign keys directly or through
+    other tables, get_references(table_name) returns the referenced table names"""
+    tables = set(table_names)
+    pending = list(tables)
+    while pending:
+        for referenced in get_references(pending.pop()):
+            if referenced not in tables:
+                tables.add(referenced)
+                pending.append(referenced)
+    return tables
+
+
+def get_references(table_node) -> set:
+    """tables referenced by the foreign keys of a TableNode"""
+    return {
+        column.dest_table for column in table_node.columns.values()
+        if column.dest_table is not None
+    }
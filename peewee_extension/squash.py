@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""console tool, squashes the migration history into one baseline migration
+
+the migrations are replayed on a scratch database (the ones already applied to it
+are skipped), its schema is introspected and the baseline migration creating
+the whole schema in foreign keys order is written. the baseline lists the squashed
+migrations: applied to a fresh database it creates the schema and marks all of them
+as applied with one insert, a database which already has them only records the baseline.
+the squashed scripts are moved to the squashed/ directory"""
+import datetime
+import sys
+from pathlib import Path
+
+from peewee_extension.migrate import get_unapplied_migrations, migrate_database
+from peewee_extension.migration import from_db, graph, script
+from peewee_extension.migration.models_migration_table import Migration, bind_copy
+from peewee_extension.utils import SquashConfigurator, get_db_name
+from playhouse.db_url import connect
+from termcolor import colored
+
+SQUASHED_DIR = 'squashed'
+
+
+def move_squashed(migrations_path: Path, names: list) -> Path:
+    """moves the squashed scripts and the files made for them (cost reports)"""
+    squashed_path = migrations_path / SQUASHED_DIR
+    squashed_path.mkdir(exist_ok=True)
+    names = set(names)
+    for path in migrations_path.iterdir():
+        if path.is_file() and path.name.split('.', 1)[0] in names:
+            path.replace(squashed_path / path.name)
+    return squashed_path
+
+
+def do_squash(db_url: str, migrations_path, migration_name: str = None) -> str:
+    migrations_path = Path(migrations_path).resolve()
+    migrate_database(db_url, migrations_path, ask_user=False)
+    db = connect(db_url)
+    try:
+        unapplied = get_unapplied_migrations(db, migrations_path)
+        if unapplied:
+            raise Exception('Migrations are not applied: %s' % ', '.join(unapplied))
+        migration_model = bind_copy(Migration, db)
+        # вместе с историей из папки сюда попадают и миграции, сжатые ранее
+        squashed = sorted(row.name for row in migration_model.select(migration_model.name))
+        if not squashed:
+            raise Exception('No migrations to squash in %s' % migrations_path)
+
+        diff_graph = graph.DbNode({}).get_diff(other=from_db.get_graph(db_url))
+        if migration_name is None:
+            migration_name = datetime.datetime.now().strftime('%Y%m%d%H%M%S') + '_baseline'
+        filename = script.write_in_file(
+            migrations_path, get_db_name(db_url),
+            script.iter_script(diff_graph, '', squashed=squashed), migration_name,
+        )
+        move_squashed(migrations_path, [name for name in squashed if name != migration_name])
+        now = datetime.datetime.now()
+        migration_model.create(
+            name=migration_name, is_applied=True, created_at=now, applied_at=now,
+        )
+    finally:
+        db.close()
+    print('Squashed', len(squashed), 'migrations')
+    return filename
+
+
+def main():
+    sys.path.append('')
+    configurator = SquashConfigurator()
+    configurator.run()
+    filename = do_squash(
+        configurator.get_dburl(), configurator.get_filepath(), configurator.migration_name,
+    )
+    print('Wrote', colored(filename, color='red'))
+
+
+if __name__ == '__main__':
+    main()
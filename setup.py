@@ -35,6 +35,8 @@ setuptools.setup(
             'migrate = peewee_extension.migrate:main',
             'inspectdb = peewee_extension.inspect_db:main',
             'comparedb = peewee_extension.compare_db:main',
+            'make_snapshot = peewee_extension.make_snapshot:main',
+            'squash = peewee_extension.squash:main',
         ],
     },
     classifiers=[
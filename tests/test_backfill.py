@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from peewee import SQL, SqliteDatabase
+from peewee_extension.migration.backfill import Backfill
+from peewee_extension.migration.models_migration_table import BackfillProgress
+
+
+class Interrupted(Exception):
+    pass
+
+
+class BackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = SqliteDatabase(':memory:')
+        self.db.execute_sql(
+            'CREATE TABLE `items` (`shop` INTEGER NOT NULL, `num` INTEGER NOT NULL, '
+            '`price` INTEGER, `title` TEXT, PRIMARY KEY (`shop`, `num`))',
+        )
+        for shop in range(3):
+            for num in range(10):
+                price = None if num % 2 else num
+                self.db.execute_sql(
+                    'INSERT INTO `items` VALUES (?, ?, ?, ?)', (shop, num, price, 'x'),
+                )
+
+    def make_backfill(self, throttle=None):
+        return Backfill(
+            self.db, 'items', {'price': 0, 'title': SQL("'y'")}, ['shop', 'num'],
+            where='`price` IS NULL', chunk_size=4, throttle=throttle,
+        )
+
+    def test_backfill(self):
+        batches = []
+        backfill = self.make_backfill(throttle=lambda rows, key: batches.append(key))
+        backfill.run()
+        self.assertEqual(backfill.rows, 15)
+        self.assertEqual(batches[:2], [[0, 3], [0, 7]])
+        self.assertEqual(len(batches), 7)
+        self.assertEqual(
+            self.db.execute_sql('SELECT COUNT(*) FROM `items` WHERE `price` IS NULL').fetchone(),
+            (0,),
+        )
+        self.assertEqual(
+            self.db.execute_sql("SELECT COUNT(*) FROM `items` WHERE `title` = 'y'").fetchone(),
+            (15,),
+        )
+        with self.db.bind_ctx([BackfillProgress]):
+            self.assertEqual(BackfillProgress.select().count(), 0)
+
+    def test_resume(self):
+        def interrupt(rows, key):
+            if key == [1, 5]:
+                raise Interrupted
+
+        with self.assertRaises(Interrupted):
+            self.make_backfill(throttle=interrupt).run()
+        with self.db.bind_ctx([BackfillProgress]):
+            progress = BackfillProgress.get()
+            self.assertEqual(progress.last_key, '[1, 5]')
+            self.assertEqual(progress.rows, 8)
+
+        batches = []
+        backfill = self.make_backfill(throttle=lambda rows, key: batches.append(key))
+        backfill.run()
+        self.assertEqual(batches[0], [1, 9])
+        self.assertEqual(backfill.rows, 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
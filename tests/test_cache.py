@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from peewee_extension.migration.cache import SchemaCache
+from peewee_extension.migration.graph import ColumnNode, PrimaryKeyNode, TableNode
+from playhouse.reflection import AutoField, CharField, Column
+from tests.test_snapshot import make_graph
+
+
+def make_table(name):
+    columns = {
+        'id': ColumnNode('id', Column(
+            'id', field_class=AutoField, raw_column_type='int', nullable=False,
+            primary_key=True, column_name='id',
+        )),
+        'title': ColumnNode('title', Column(
+            'title', field_class=CharField, raw_column_type='varchar', nullable=True,
+            primary_key=False, column_name='title', extra_parameters={'max_length': 63},
+        )),
+    }
+    return TableNode(name, primary_key=PrimaryKeyNode(['id']), columns=columns, indexes=[])
+
+
+class StampsDatabase:
+    """records the stamps queries, every listed table has the same stamp"""
+    database = 'testdb'
+
+    def __init__(self):
+        self.queries = []
+
+    def execute_sql(self, sql, params=None):
+        self.queries.append((sql, params))
+        tables = sorted(set(params or ()) - {self.database})
+        return [(name, '2021-01-01', 'a', 'b', None) for name in tables]
+
+
+class SchemaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_round_trip(self):
+        cache = SchemaCache(self.cache_dir.name, 'testdb')
+        cache.put('table_1', ('2021-01-01', 'abc'), make_table('table_1'))
+        cache.save()
+
+        cache = SchemaCache(self.cache_dir.name, 'testdb')
+        table = cache.get('table_1')
+        self.assertIsInstance(table, TableNode)
+        self.assertEqual(table.columns['title'].get_max_length(), 63)
+        self.assertEqual(table.primary_key.columns, ['id'])
+
+    def test_foreign_key(self):
+        db_graph = make_graph()
+        cache = SchemaCache(self.cache_dir.name, 'testdb')
+        for table_name, table in db_graph.tables.items():
+            cache.put(table_name, ('1',), table)
+        cache.save()
+
+        cache = SchemaCache(self.cache_dir.name, 'testdb')
+        column = cache.get('child').columns['parent_id']
+        self.assertEqual(column.get_sql_type(), 'INT')
+        self.assertEqual(column.dest_table, 'parent')
+        self.assertEqual(
+            cache.get('child').get_fingerprint(), db_graph.tables['child'].get_fingerprint(),
+        )
+
+    def test_fingerprint_in_other_process(self):
+        fingerprint = subprocess.run(
+            [sys.executable, '-c', 'from tests.test_snapshot import make_graph; '
+                                   'print(make_graph().get_fingerprint())'],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip()
+        self.assertEqual(fingerprint, make_graph().get_fingerprint())
+
+    def test_get_table_stamps_for_tables(self):
+        database = StampsDatabase()
+        stamps = SchemaCache.get_table_stamps(database, {'book', 'author'})
+        sql, params = database.queries[-1]
+        self.assertEqual(sql.count('%s'), len(params))
+        self.assertEqual(sql.count('table_name IN (%s, %s)'), 4)
+        self.assertEqual(params, ['testdb', 'author', 'book'] * 4)
+        self.assertEqual(stamps['book'], ('2021-01-01', 'a', 'b', 'None'))
+
+        SchemaCache.get_table_stamps(database)
+        sql, params = database.queries[-1]
+        self.assertNotIn(' IN (', sql)
+        self.assertEqual(params, ['testdb'] * 4)
+        self.assertEqual(SchemaCache.get_table_stamps(database, []), {})
+
+    def test_get_stale_tables(self):
+        cache = SchemaCache(self.cache_dir.name, 'testdb')
+        cache.put('table_1', ('1',), make_table('table_1'))
+        cache.put('table_2', ('1',), make_table('table_2'))
+        stamps = {'table_1': ('1',), 'table_2': ('2',), 'table_3': ('1',)}
+        self.assertEqual(cache.get_stale_tables(stamps), ['table_2', 'table_3'])
+
+        cache.retain(['table_1'])
+        self.assertEqual(list(cache.tables.keys()), ['table_1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import unittest
+
+from peewee_extension.migration import cost
+from peewee_extension.migration.graph import ALGORITHM_COPY, DbNode, IndexNode
+from playhouse.reflection import CharField
+from tests.test_diff import make_column, make_table
+
+GIB = 1024 ** 3
+
+
+class CostTest(unittest.TestCase):
+
+    def make_diff(self):
+        db_self = DbNode({
+            'big': make_table('big', [make_column('a'), make_column('b')]),
+            'small': make_table('small', [make_column('a')]),
+        })
+        db_other = DbNode({
+            'big': make_table('big', [
+                make_column('a', CharField, max_length=5), make_column('b'), make_column('c'),
+            ], indexes=[IndexNode(['b', 'c'])]),
+            'small': make_table('small', [make_column('a'), make_column('d')]),
+        })
+        return db_self.get_diff(db_other)
+
+    def test_estimate(self):
+        stats = {'big': {'rows': 10 ** 7, 'data_length': 3 * GIB, 'index_length': GIB}}
+        report = cost.estimate(self.make_diff(), stats)
+        big, small = report['tables']
+        self.assertEqual(big['algorithm'], ALGORITHM_COPY)
+        self.assertEqual(
+            [(item['algorithm'], item['rebuilds_table']) for item in big['operations']],
+            [('COPY', True), ('INSTANT', False), ('INPLACE', False)],
+        )
+        rebuild = big['operations'][0]
+        self.assertEqual(rebuild['extra_disk'], 4 * GIB)
+        self.assertAlmostEqual(rebuild['seconds'], 4 * GIB / cost.COPY_BYTES_PER_SECOND, places=0)
+        index = big['operations'][2]
+        self.assertEqual(big['extra_disk'], 4 * GIB + index['extra_disk'])
+        self.assertEqual(small['algorithm'], 'INSTANT')
+        self.assertEqual(small['seconds'], 0)
+        self.assertIsNone(small['rows'])
+        self.assertEqual(report['extra_disk'], big['extra_disk'])
+
+    def test_write_report(self):
+        report = cost.estimate(self.make_diff(), {})
+        with tempfile.TemporaryDirectory() as directory:
+            script_path = os.path.join(directory, '20210804114259_test_db.py')
+            text_path, json_path = cost.write_report(script_path, report)
+            self.assertTrue(str(text_path).endswith('20210804114259_test_db.cost.txt'))
+            with open(json_path) as file_handle:
+                self.assertEqual(json.load(file_handle), report)
+            with open(text_path) as file_handle:
+                self.assertIn('MODIFY COLUMN `a` VARCHAR(5) NOT NULL', file_handle.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
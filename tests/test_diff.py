@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from peewee import (
+    BigAutoField, CharField as ModelCharField, ForeignKeyField, ForeignKeyMetadata, Model,
+    UUIDField,
+)
+from peewee_extension.migration import script
+from peewee_extension.migration.from_py import get_models_graph
+from peewee_extension.migration.graph import (
+    ALGORITHM_COPY, ALGORITHM_INPLACE, ALGORITHM_INSTANT, MODE_ADD, MODE_DELETE, MODE_MODIFY,
+    MODE_RENAME, MODE_STUB,
+    ColumnNode, DbNode, IndexNode, PrimaryKeyNode, TableNode, sort_tables,
+)
+from playhouse.reflection import AutoField, CharField, Column, IntegerField
+
+
+def make_column(name, field_class=IntegerField, nullable=False, max_length=None):
+    extra = {'max_length': max_length} if max_length is not None else None
+    return ColumnNode(name, Column(
+        name, field_class=field_class, raw_column_type=field_class.field_type.lower(),
+        nullable=nullable, primary_key=field_class is AutoField, column_name=name,
+        extra_parameters=extra,
+    ))
+
+
+def make_table(name, columns, indexes=None):
+    columns = [make_column('id', AutoField)] + list(columns)
+    return TableNode(
+        name, primary_key=PrimaryKeyNode(['id']), indexes=indexes or [],
+        columns={column.name: column for column in columns},
+    )
+
+
+class IndexDiffTest(unittest.TestCase):
+
+    def test_signature(self):
+        self.assertEqual(
+            IndexNode(['a', 'b'], unique=1).get_signature(),
+            IndexNode(['a', 'b'], unique=True).get_signature(),
+        )
+        self.assertNotEqual(
+            IndexNode(['a', 'b']).get_signature(), IndexNode(['b', 'a']).get_signature(),
+        )
+
+    def test_get_diff(self):
+        columns = [make_column('a'), make_column('b'), make_column('c')]
+        table_self = make_table('t', columns, indexes=[
+            IndexNode(['a', 'b']), IndexNode(['c'], unique=True), IndexNode(['b', 'c']),
+        ])
+        table_other = make_table('t', columns, indexes=[
+            IndexNode(['c'], unique=False), IndexNode(['a', 'b']), IndexNode(['c', 'b']),
+        ])
+        diff = table_self.get_diff(other=table_other)
+        self.assertEqual(
+            [(index.indexes, index.unique, index.mode) for index in diff.indexes],
+            [
+                (['c'], True, MODE_DELETE),
+                (['b', 'c'], False, MODE_DELETE),
+                (['c'], False, MODE_ADD),
+                (['c', 'b'], False, MODE_ADD),
+            ],
+        )
+        self.assertIsNone(table_self.get_diff(other=table_self))
+
+
+class ColumnDiffTest(unittest.TestCase):
+
+    def test_rename_detection(self):
+        table_self = make_table('t', [
+            make_column('static'),
+            make_column('old_title', CharField, max_length=63),
+            make_column('old_count'),
+            make_column('dropped', CharField, max_length=10),
+            make_column('old_flag', nullable=True),
+        ])
+        table_other = make_table('t', [
+            make_column('static'),
+            make_column('new_count'),
+            make_column('added', CharField, max_length=11),
+            make_column('new_title', CharField, max_length=63),
+            make_column('new_flag', nullable=True),
+        ])
+        diff = table_self.get_diff(other=table_other)
+        self.assertEqual(
+            [(name, column.mode, column.other) for name, column in diff.columns.items()],
+            [
+                ('new_title', MODE_RENAME, 'old_title'),
+                ('new_count', MODE_RENAME, 'old_count'),
+                ('new_flag', MODE_RENAME, 'old_flag'),
+                ('dropped', MODE_DELETE, None),
+                ('added', MODE_ADD, None),
+            ],
+        )
+
+    def test_rename_order_is_deterministic(self):
+        table_self = make_table('t', [make_column('a'), make_column('b')])
+        table_other = make_table('t', [make_column('d'), make_column('c')])
+        diff = table_self.get_diff(other=table_other)
+        self.assertEqual(diff.columns['d'].other, 'a')
+        self.assertEqual(diff.columns['c'].other, 'b')
+
+    def test_lazy_column(self):
+        built = []
+
+        def column_factory(source):
+            built.append(source)
+            return make_column(source, CharField, max_length=10).refl_column
+
+        column = ColumnNode.lazy('title', column_factory, 'title', CharField, False, 10)
+        self.assertTrue(column.is_equal(make_column('title', CharField, max_length=10)))
+        self.assertEqual(column.get_full_sql_type(), 'VARCHAR(10) NOT NULL')
+        diff = column.get_diff(mode=MODE_ADD)
+        self.assertEqual(built, [])
+        self.assertEqual(diff.refl_column.extra_parameters, {'max_length': 10})
+        self.assertEqual(built, ['title'])
+
+
+class AlterTableTest(unittest.TestCase):
+
+    def make_diff(self):
+        table_self = make_table('t', [make_column('a'), make_column('old'), make_column('b')],
+                                indexes=[IndexNode(['a', 'b'], name='a_b_idx')])
+        table_other = make_table('t', [
+            make_column('a', nullable=True), make_column('new'),
+            make_column('c', CharField, max_length=5, nullable=True),
+        ], indexes=[IndexNode(['a', 'c'], unique=True)])
+        return table_self.get_diff(other=table_other)
+
+    def test_sql(self):
+        self.assertEqual(self.make_diff().as_sql(), (
+            'ALTER TABLE `t`\n'
+            '    DROP INDEX `a_b_idx`,\n'
+            '    MODIFY COLUMN `a` INT,\n'
+            '    RENAME COLUMN `old` to `new`,\n'
+            '    DROP COLUMN `b`,\n'
+            '    ADD COLUMN `c` VARCHAR(5),\n'
+            '    ADD UNIQUE INDEX `t_a_c` (`a`, `c`),\n'
+            '    ALGORITHM=INPLACE, LOCK=NONE;\n'
+        ))
+
+    def test_pycode(self):
+        lines = self.make_diff().as_pycode().splitlines()
+        self.assertEqual(lines[0], "        migrator.alter_table('t', [")
+        self.assertEqual(lines[1], "            migrator.drop_index('t', 'a_b_idx'),")
+        self.assertEqual(lines[3], '            migrator.rename_column("t", "old", "new"),')
+        self.assertEqual(lines[-2], "            migrator.add_index('t', ('a', 'c'), True),")
+        self.assertEqual(lines[-1], "        ], algorithm='INPLACE', lock='NONE'),")
+        self.assertEqual(len(lines), 8)
+
+    def test_pycode_reversed(self):
+        lines = self.make_diff().as_pycode_reversed().splitlines()
+        self.assertEqual(
+            lines[0], '        # t.a becomes NOT NULL, fill its NULL values with migrator.backfill',
+        )
+        self.assertEqual(lines[2], "            migrator.drop_index('t', 't_a_c'),")
+        self.assertEqual(
+            lines[3], '            migrator.alter_column_type("t", "a", IntegerField()),',
+        )
+        self.assertEqual(lines[4], '            migrator.rename_column("t", "new", "old"),')
+        self.assertEqual(lines[6], '            migrator.drop_column("t", "c"),')
+        self.assertEqual(lines[-2], "            migrator.add_index('t', ('a', 'b'), False),")
+
+    def test_backfill(self):
+        column = make_column('a')
+        column.refl_column.default = 0
+        table_self = make_table('t', [make_column('a', nullable=True)])
+        diff = table_self.get_diff(other=make_table('t', [column]))
+        lines = diff.as_pycode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "        migrator.backfill('t', {'a': 0}, ['id'], where='`a` IS NULL'),",
+        )
+        self.assertEqual(lines[1], "        migrator.alter_table('t', [")
+
+
+class AlgorithmTest(unittest.TestCase):
+
+    def get_algorithm(self, column_self, column_other):
+        diff = make_table('t', [column_self]).get_diff(other=make_table('t', [column_other]))
+        return diff.get_algorithm()
+
+    def test_columns(self):
+        varchar = make_column('a', CharField, max_length=10)
+        self.assertEqual(
+            self.get_algorithm(varchar, make_column('a', CharField, max_length=20)),
+            ALGORITHM_INPLACE,
+        )
+        self.assertEqual(
+            self.get_algorithm(varchar, make_column('a', CharField, max_length=100)),
+            ALGORITHM_COPY,
+        )
+        self.assertEqual(
+            self.get_algorithm(varchar, make_column('a', CharField, max_length=10, nullable=True)),
+            ALGORITHM_INPLACE,
+        )
+        self.assertEqual(self.get_algorithm(varchar, make_column('a')), ALGORITHM_COPY)
+        diff = make_table('t', []).get_diff(other=make_table('t', [make_column('a')]))
+        self.assertEqual(diff.get_algorithm(), ALGORITHM_INSTANT)
+        self.assertEqual(diff.get_alter_options(), ['ALGORITHM=INSTANT'])
+        self.assertEqual(diff.get_algorithm(reverse=True), ALGORITHM_INPLACE)
+
+    def test_blocking_changes(self):
+        db_self = DbNode({'t': make_table('t', [make_column('a'), make_column('b')])})
+        db_other = DbNode({'t': make_table('t', [
+            make_column('a', CharField, max_length=5), make_column('b', nullable=True),
+        ])})
+        diff = db_self.get_diff(db_other)
+        self.assertEqual(diff.get_blocking_changes(), ['t.a'])
+        self.assertIn('ALGORITHM=COPY, LOCK=SHARED;', diff.as_sql())
+        lines = ''.join(diff.iter_pycode(online_rebuild=True)).splitlines()
+        self.assertEqual(lines[0], "        migrator.rebuild_table('t', [")
+        self.assertEqual(lines[-1], '        ]),')
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_table_fingerprint(self):
+        table = make_table('t', [make_column('a'), make_column('b', CharField, max_length=5)],
+                           indexes=[IndexNode(['a', 'b']), IndexNode(['b'])])
+        same = make_table('t', [make_column('b', CharField, max_length=5), make_column('a')],
+                          indexes=[IndexNode(['b']), IndexNode(['a', 'b'])])
+        other = make_table('t', [make_column('a'), make_column('b', CharField, max_length=6)],
+                           indexes=[IndexNode(['a', 'b']), IndexNode(['b'])])
+        self.assertEqual(table.get_fingerprint(), same.get_fingerprint())
+        self.assertIsNone(table.get_diff(other=same))
+        self.assertNotEqual(table.get_fingerprint(), other.get_fingerprint())
+        self.assertIsNotNone(table.get_diff(other=other))
+
+    def test_db_fingerprint(self):
+        db_self = DbNode({'t': make_table('t', [make_column('a')]), 'u': make_table('u', [])})
+        db_same = DbNode({'u': make_table('u', []), 't': make_table('t', [make_column('a')])})
+        db_other = DbNode({'t': make_table('t', [make_column('b')]), 'u': make_table('u', [])})
+        self.assertTrue(db_self.is_equal(db_same))
+        self.assertEqual(db_self.get_diff(db_same).tables, {})
+        self.assertFalse(db_self.is_equal(db_other))
+        self.assertEqual(list(db_self.get_diff(db_other).tables), ['t'])
+
+
+def make_models_graph(module_name, models):
+    for model in models:
+        model.__module__ = module_name
+    return get_models_graph(module_name, {model.__name__: model for model in models})
+
+
+class AuthorBefore(Model):
+    name = ModelCharField(max_length=63)
+
+    class Meta:
+        table_name = 'author'
+
+
+class AuthorAfter(Model):
+    name = ModelCharField(max_length=127)
+    email = ModelCharField(max_length=63, index=True)
+
+    class Meta:
+        table_name = 'author'
+
+
+class Book(Model):
+    author = ForeignKeyField(AuthorAfter)
+    editor = ForeignKeyField(AuthorAfter, null=True)
+    title = ModelCharField()
+
+
+class ReferencedTableTest(unittest.TestCase):
+
+    def test_modified_table_is_kept(self):
+        source = make_models_graph('test_diff_before', [AuthorBefore])
+        target = make_models_graph('test_diff_after', [AuthorAfter, Book])
+        diff = source.get_diff(target)
+        self.assertEqual(diff.tables['book'].mode, MODE_ADD)
+        author = diff.tables['author']
+        self.assertEqual(author.mode, MODE_MODIFY)
+        self.assertEqual(sorted(author.columns), ['email', 'name'])
+        self.assertEqual(author.stub.mode, MODE_STUB)
+        self.assertEqual(author.stub.model, 'AuthorAfter')
+        self.assertEqual(list(author.stub.columns), ['id'])
+
+        self.assertIn('ALTER TABLE `author`', diff.as_sql())
+        text = ''.join(script.iter_script(diff, 'models'))
+        self.assertIn("migrator.alter_table('author'", text)
+        self.assertIn('class AuthorAfter(BaseModel):', text)
+
+    def test_table_on_one_side(self):
+        # в графах по only_tables таблица, на которую ссылается удаленная, может быть
+        # только на другой стороне
+        source = make_models_graph('test_diff_book', [Book])
+        target = make_models_graph('test_diff_after', [AuthorAfter])
+        diff = source.get_diff(target, only_tables=['book'])
+        self.assertEqual(diff.tables['book'].mode, MODE_DELETE)
+        self.assertEqual(diff.tables['author'].mode, MODE_STUB)
+        self.assertEqual(diff.tables['author'].model, 'AuthorAfter')
+
+
+class Tag(Model):
+    id = BigAutoField()
+
+
+class Token(Model):
+    id = UUIDField(primary_key=True)
+
+
+class TagLink(Model):
+    tag = ForeignKeyField(Tag)
+    token = ForeignKeyField(Token)
+
+
+def make_foreign_key(name, raw_column_type, dest_table):
+    column = Column(
+        name, field_class=ForeignKeyField, raw_column_type=raw_column_type, nullable=False,
+        primary_key=False, column_name=name,
+    )
+    column.set_foreign_key(
+        ForeignKeyMetadata(name, dest_table, 'id', 'taglink'),
+        model_names={dest_table: dest_table.title(), 'taglink': 'TagLink'},
+    )
+    return ColumnNode(name, column)
+
+
+class ForeignKeyTypeTest(unittest.TestCase):
+
+    def test_type_of_referenced_column(self):
+        columns = make_models_graph('test_diff_tags', [Tag, Token, TagLink]).tables[
+            'taglink'
+        ].columns
+        self.assertEqual(columns['tag_id'].get_sql_type(), 'BIGINT')
+        self.assertEqual(columns['token_id'].get_sql_type(), 'VARCHAR')
+        # the same columns introspected from the database
+        self.assertEqual(
+            columns['tag_id'].get_signature(),
+            make_foreign_key('tag_id', 'bigint', 'tag').get_signature(),
+        )
+        self.assertEqual(
+            columns['token_id'].get_signature(),
+            make_foreign_key('token_id', 'varchar', 'token').get_signature(),
+        )
+        self.assertNotEqual(
+            columns['tag_id'].get_signature(),
+            make_foreign_key('tag_id', 'int', 'tag').get_signature(),
+        )
+
+
+class ModelTest(unittest.TestCase):
+
+    def test_lower_case(self):
+        column = Column(
+            'Title', field_class=CharField, raw_column_type='varchar', nullable=True,
+            primary_key=False, column_name='TITLE', default="'none'",
+            extra_parameters={'max_length': 63},
+        )
+        table = make_table('book', [ColumnNode('Title', column)])
+        model = table.get_model(lower_case=True)
+        self.assertIn("column_name='title'", model)
+        self.assertIn('constraints=[SQL("DEFAULT \'none\'")]', model)
+        # the column of the graph is not changed
+        self.assertEqual(column.column_name, 'TITLE')
+        self.assertIn("column_name='TITLE'", table.get_model())
+
+
+class RightOrderTest(unittest.TestCase):
+
+    def test_sort_tables(self):
+        graph = {'c': {'b'}, 'b': {'a'}, 'a': set(), 'd': {'d', 'outside'}}
+        order, deferred = sort_tables(graph)
+        self.assertEqual(order, ['a', 'b', 'c', 'd'])
+        self.assertEqual(deferred, [])
+
+    def test_sort_tables_cycle(self):
+        graph = {'a': {'b'}, 'b': {'c'}, 'c': {'a'}, 'd': {'a'}, 'e': set()}
+        order, deferred = sort_tables(graph)
+        self.assertEqual(deferred, [('c', 'a')])
+        self.assertEqual(order, ['e', 'c', 'b', 'a', 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
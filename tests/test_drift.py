@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import unittest
+from unittest import mock
+
+from peewee_extension import compare_db
+from peewee_extension.migration.graph import DbNode
+from tests.test_diff import make_column, make_table
+
+
+class DriftTest(unittest.TestCase):
+
+    def test_check_drift(self):
+        checksums = {'mysql://ref/db': 'a', 'mysql://s1/db': 'a', 'mysql://s2/db': 'b',
+                     'mysql://s3/db': 'b'}
+        graphs = {
+            'mysql://ref/db': DbNode({'t': make_table('t', [make_column('a')])}),
+            'mysql://s2/db': DbNode({'t': make_table('t', [make_column('b')])}),
+            'mysql://s3/db': DbNode({'t': make_table('t', [make_column('a')])}),
+        }
+        introspected = []
+
+        def get_graph(db_url, cache_dir=None):
+            introspected.append(db_url)
+            return graphs[db_url]
+
+        def get_checksum(db_url):
+            if db_url == 'mysql://s4/db':
+                raise ConnectionError('unreachable')
+            return checksums[db_url]
+
+        with mock.patch.object(compare_db, 'get_checksum', get_checksum), \
+                mock.patch.object(compare_db, 'get_graph', get_graph):
+            drift, failed = compare_db.check_drift(
+                'mysql://ref/db', ['mysql://s1/db', 'mysql://s2/db', 'mysql://s3/db',
+                                   'mysql://s4/db'],
+            )
+        self.assertEqual(sorted(introspected), ['mysql://ref/db', 'mysql://s2/db', 'mysql://s3/db'])
+        self.assertEqual(list(drift), ['mysql://s1/db', 'mysql://s2/db', 'mysql://s3/db'])
+        self.assertIsNone(drift['mysql://s1/db'])
+        self.assertEqual(list(drift['mysql://s2/db'].tables), ['t'])
+        self.assertIsNone(drift['mysql://s3/db'])
+        self.assertEqual([shard.name for shard in failed], ['s4/db'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from peewee_extension.migration import from_ast, from_py
+
+BASE = '''"""base of the models, importing it connects to the database"""
+from peewee import DatabaseProxy, Model
+from peewee_extension.core import EnumField
+
+db = DatabaseProxy()
+db.initialize(None)
+
+
+class BaseModel(Model):
+    class Meta:
+        database = db
+'''
+
+MODELS = '''import datetime
+from typing import TYPE_CHECKING
+
+from peewee import *
+from .base import BaseModel, EnumField
+
+if TYPE_CHECKING:
+    from .services import Client
+
+STATUSES = ('new', 'done')
+ABSTRACT_MODELS = [BaseModel]
+
+
+def now():
+    return datetime.datetime.now()
+
+
+class Author(BaseModel):
+    name = CharField(max_length=2 * 64, unique=True)
+    created = DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        table_name = 'authors'
+
+
+class Book(BaseModel):
+    """a book"""
+    author = ForeignKeyField(Author, field=Author.id, null=True, backref='books')
+    parent = ForeignKeyField('self', null=True)
+    title = CharField(index=True)
+    status = EnumField(values=STATUSES, default='new')
+    price = DecimalField(max_digits=10, decimal_places=2, constraints=[SQL('DEFAULT 0')])
+
+    class Meta:
+        indexes = ((('title', 'status'), True),)
+
+    def __str__(self):
+        return self.title
+
+
+class BookTag(BaseModel):
+    book = ForeignKeyField(Book)
+    tag = CharField(max_length=32)
+
+    class Meta:
+        primary_key = CompositeKey('book', 'tag')
+'''
+
+
+def describe(graph):
+    """everything of the graph the migration script is built from"""
+    tables = {}
+    for name, table in graph.tables.items():
+        tables[name] = (
+            table.model, table.get_fingerprint(), table.has_foreign_keys,
+            sorted(
+                (column_name, column.get_field(), column.refl_column.default)
+                for column_name, column in table.columns.items()
+            ),
+        )
+    return tables
+
+
+class FromAstTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.package = Path(self.directory.name) / 'static_app'
+        self.package.mkdir()
+        (self.package / '__init__.py').write_text('raise ImportError("heavy package")\n')
+        (self.package / 'base.py').write_text(BASE)
+        (self.package / 'models.py').write_text(MODELS)
+        sys.path.insert(0, self.directory.name)
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        for name in list(sys.modules):
+            if name.startswith('static_app'):
+                del sys.modules[name]
+        self.directory.cleanup()
+
+    def import_graph(self):
+        (self.package / '__init__.py').write_text('')
+        return from_py.get_graph('static_app.models')
+
+    def test_same_graph(self):
+        static_graph = from_py.get_graph('static_app.models', static=True)
+        self.assertNotIn('static_app', sys.modules)
+        self.assertEqual(sorted(static_graph.tables), ['authors', 'book', 'booktag'])
+        self.assertEqual(describe(static_graph), describe(self.import_graph()))
+
+    def test_fallback(self):
+        with open(self.package / 'models.py', 'a') as models:
+            models.write(
+                '\n\nclass MoneyField(DecimalField):\n    pass\n'
+                '\n\nclass Payment(BaseModel):\n    amount = MoneyField()\n',
+            )
+        with self.assertRaises(from_ast.Unresolvable):
+            from_ast.get_namespace('static_app.models')
+        (self.package / '__init__.py').write_text('')
+        graph = from_py.get_graph('static_app.models', static=True)
+        self.assertIn('static_app.models', sys.modules)
+        self.assertEqual(sorted(graph.tables), ['authors', 'book', 'booktag', 'payment'])
+
+    def test_unresolvable_field(self):
+        with open(self.package / 'models.py', 'a') as models:
+            models.write('\n\nclass Other(BaseModel):\n    value = now()\n')
+        with self.assertRaises(from_ast.Unresolvable):
+            from_ast.get_namespace('static_app.models')
+
+    def test_find_source(self):
+        self.assertEqual(from_ast.find_source('static_app.models'), self.package / 'models.py')
+        self.assertEqual(from_ast.find_source('static_app'), self.package / '__init__.py')
+        self.assertIsNone(from_ast.find_source('static_app.missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
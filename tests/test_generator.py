@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import unittest
+
+from peewee_extension.migration.generator import MigrationGenerator, format_timings
+from peewee_extension.migration.graph import DbNode
+from tests.test_snapshot import make_graph
+
+DELAY = 0.2
+
+
+class SlowGenerator(MigrationGenerator):
+    """the database and the models take DELAY seconds each"""
+
+    def __init__(self):
+        super().__init__('mysql://localhost/test', 'models')
+        self.threads = {}
+
+    def get_source_graph(self, tables: list = None):
+        self.threads['source'] = threading.current_thread()
+        time.sleep(DELAY)
+        return DbNode({})
+
+    def get_target_graph(self, tables: list = None):
+        self.threads['target'] = threading.current_thread()
+        time.sleep(DELAY)
+        return make_graph()
+
+
+class GenerateTest(unittest.TestCase):
+
+    def test_concurrent_graphs(self):
+        generator = SlowGenerator()
+        generator.generate()
+        self.assertEqual(sorted(generator.diff_graph.tables), ['child', 'parent'])
+        self.assertIs(generator.threads['target'], threading.main_thread())
+        self.assertIsNot(generator.threads['source'], threading.main_thread())
+        self.assertEqual(set(generator.timings), {'source', 'target', 'diff', 'total'})
+        self.assertGreaterEqual(generator.timings['source'], DELAY)
+        self.assertLess(generator.timings['total'], 2 * DELAY)
+        self.assertIn('total', format_timings(generator.timings))
+
+    def test_source_graph_given(self):
+        generator = SlowGenerator()
+        generator.generate(source_graph=make_graph())
+        self.assertNotIn('source', generator.threads)
+        self.assertEqual(generator.diff_graph.tables, {})
+        self.assertNotIn('source', generator.timings)
+
+    def test_source_error(self):
+        generator = SlowGenerator()
+        generator.get_source_graph = lambda tables=None: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            generator.generate()
+
+    def test_target_error(self):
+        generator = SlowGenerator()
+        generator.get_target_graph = lambda tables=None: 1 / 0
+        generator.get_source_graph = lambda tables=None: time.sleep(5 * DELAY)
+        started = time.perf_counter()
+        with self.assertRaises(ZeroDivisionError):
+            generator.generate()
+        self.assertLess(time.perf_counter() - started, 5 * DELAY)
+
+
+if __name__ == '__main__':
+    unittest.main()
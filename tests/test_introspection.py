@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import re
+import unittest
+
+from peewee import MySQLDatabase
+from peewee_extension.core import MxMySQLMetadata
+from peewee_extension.migration.from_db import build_tables
+from playhouse.reflection import Introspector
+
+COLUMN_NAMES = (
+    'table_name', 'column_name', 'ordinal_position', 'data_type', 'column_type',
+    'is_nullable', 'column_default', 'character_maximum_length', 'numeric_precision',
+    'numeric_scale', 'column_comment',
+)
+COLUMNS = [dict(zip(COLUMN_NAMES, row)) for row in (
+    ('author', 'id', 1, 'int', 'int(11)', 'NO', None, None, 10, 0, ''),
+    ('author', 'name', 2, 'varchar', 'varchar(63)', 'NO', None, 63, None, None, 'full name'),
+    ('author', 'status', 3, 'enum', "enum('new','done')", 'NO', 'new', 4, None, None, ''),
+    ('book', 'id', 1, 'int', 'int(11)', 'NO', None, None, 10, 0, ''),
+    ('book', 'author_id', 2, 'int', 'int(11)', 'NO', None, None, 10, 0, ''),
+    ('book', 'title', 3, 'varchar', 'varchar(127)', 'YES', 'untitled', 127, None, None, ''),
+    ('book', 'pages', 4, 'int', 'int(10) unsigned', 'YES', '100', None, 10, 0, ''),
+    ('book', 'price', 5, 'decimal', 'decimal(10,2)', 'YES', None, None, 10, 2, ''),
+)]
+# table_name, index_name, non_unique, seq_in_index, column_name
+STATISTICS = [
+    ('author', 'PRIMARY', 0, 1, 'id'),
+    ('author', 'name', 0, 1, 'name'),
+    ('book', 'PRIMARY', 0, 1, 'id'),
+    ('book', 'book_author_title', 0, 1, 'author_id'),
+    ('book', 'book_author_title', 0, 2, 'title'),
+    ('book', 'book_pages', 1, 1, 'pages'),
+]
+# table_name, constraint_name, column_name, referenced_table_name, referenced_column_name
+FOREIGN_KEYS = [('book', 'book_ibfk_1', 'author_id', 'author', 'id')]
+
+
+class FakeCursor(list):
+
+    def __init__(self, rows, names=()):
+        super().__init__(rows)
+        self.description = [(name, None) for name in names]
+
+    def fetchall(self):
+        return list(self)
+
+
+class FakeDatabase(MySQLDatabase):
+    """answers the information_schema queries of MySQLMetadata and MxMySQLMetadata
+    from the canned rows above"""
+
+    def __init__(self):
+        super().__init__('testdb')
+        self.queries = []
+
+    def execute_sql(self, sql, params=None, commit=None):
+        self.queries.append(sql)
+        if 'information_schema.tables' in sql:
+            return FakeCursor((name,) for name in sorted({row['table_name'] for row in COLUMNS}))
+        show_index = re.match(r'SHOW INDEX FROM `(\w+)`', sql)
+        if show_index:
+            # Table, Non_unique, Key_name, Seq_in_index, Column_name
+            return FakeCursor(
+                (table, non_unique, index, seq, column)
+                for table, index, non_unique, seq, column in STATISTICS
+                if table == show_index.group(1)
+            )
+        # параметры запросов - имя схемы и имена таблиц
+        tables = [param for param in params or () if param != self.database]
+
+        def select(rows, key, order=None):
+            rows = [row for row in rows if not tables or key(row) in tables]
+            if order is None:
+                return rows
+            # без ORDER BY сервер может вернуть строки в любом порядке
+            return sorted(rows, key=order) if 'ORDER BY' in sql else rows[::-1]
+
+        if 'referential_constraints' in sql:
+            rows = select(FOREIGN_KEYS, lambda row: row[0])
+            return FakeCursor([(row[1],) for row in rows], ['constraint_name'])
+        if 'key_column_usage' in sql:
+            if 'constraint_name' in sql:
+                rows = select(FOREIGN_KEYS, lambda row: row[0], lambda row: row[:2])
+                return FakeCursor(rows, [
+                    'table_name', 'constraint_name', 'column_name',
+                    'referenced_table_name', 'referenced_column_name',
+                ])
+            return FakeCursor(
+                row[2:] for row in select(FOREIGN_KEYS, lambda row: row[0])
+            )
+        if 'information_schema.statistics' in sql:
+            rows = select(
+                STATISTICS, lambda row: row[0], lambda row: (row[0], row[1].lower(), row[3]),
+            )
+            return FakeCursor(rows, [
+                'table_name', 'index_name', 'non_unique', 'seq_in_index', 'column_name',
+            ])
+        if sql.strip().startswith('SELECT *'):
+            rows = select(COLUMNS, lambda row: row['table_name'])
+            return FakeCursor([tuple(row.values()) for row in rows], COLUMN_NAMES)
+        if 'information_schema.columns' in sql:
+            return FakeCursor(
+                (row['column_name'], row['is_nullable'], row['data_type'], row['column_default'])
+                for row in select(COLUMNS, lambda row: row['table_name'])
+            )
+        raise AssertionError(f'unexpected query {sql}')
+
+
+def get_foreign_key(column):
+    foreign_key = getattr(column, 'foreign_key', None)
+    return foreign_key and (foreign_key.dest_table, foreign_key.dest_column)
+
+
+def describe(tables: dict) -> dict:
+    """everything the reflection columns and the table nodes are built from"""
+    return {
+        table_name: (
+            table.model, table.has_foreign_keys, table.primary_key.columns,
+            sorted((index.name, index.get_signature()) for index in table.indexes),
+            [
+                (
+                    name, column.field_class, column.raw_column_type, column.nullable,
+                    column.primary_key, column.default, column.extra_parameters,
+                    column.index, column.unique,
+                    get_foreign_key(column),
+                )
+                for name, column in (
+                    (name, node.refl_column) for name, node in table.columns.items()
+                )
+            ],
+        )
+        for table_name, table in tables.items()
+    }
+
+
+def introspect(batched: bool, tables=None):
+    database = FakeDatabase()
+    metadata = MxMySQLMetadata(database, batched=batched, tables=tables)
+    return build_tables(Introspector(metadata=metadata), tables), database.queries
+
+
+class BatchedIntrospectionTest(unittest.TestCase):
+
+    def test_same_graph(self):
+        tables, queries = introspect(batched=False)
+        batched_tables, batched_queries = introspect(batched=True)
+        self.assertEqual(sorted(tables), ['author', 'book'])
+        self.assertEqual(describe(batched_tables), describe(tables))
+        self.assertLess(len(batched_queries), len(queries))
+
+        book = batched_tables['book']
+        self.assertEqual(
+            [index.name for index in book.indexes], ['book_author_title', 'book_pages'],
+        )
+        self.assertTrue(book.has_foreign_keys)
+        self.assertIn(
+            (('author_id', 'title'), True), [index.get_signature() for index in book.indexes],
+        )
+        self.assertEqual(get_foreign_key(book.columns['author_id'].refl_column), ('author', 'id'))
+        title = book.columns['title'].refl_column
+        self.assertTrue(title.nullable)
+        self.assertEqual(title.default, "'untitled'")
+        status = batched_tables['author'].columns['status'].refl_column
+        self.assertEqual(status.extra_parameters['values'], "('new','done')")
+
+    def test_same_graph_for_tables(self):
+        tables, _ = introspect(batched=False, tables=['book'])
+        batched_tables, _ = introspect(batched=True, tables=['book'])
+        self.assertEqual(sorted(tables), ['author', 'book'])
+        self.assertEqual(describe(batched_tables), describe(tables))
+
+
+if __name__ == '__main__':
+    unittest.main()
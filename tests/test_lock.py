@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+
+from peewee import SqliteDatabase
+from peewee_extension.migration.lock import LockTimeout, MigrationLock
+
+
+class LockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = str(Path(self.directory.name) / 'test.db')
+        # two connections to one file, as two processes of one deploy
+        self.db = SqliteDatabase(path)
+        self.other_db = SqliteDatabase(path)
+        self.lock = MigrationLock(self.db, timeout=0.2, poll=0.05)
+        self.other = MigrationLock(self.other_db, timeout=0.2, poll=0.05)
+        self.other.owner = 'other:1'
+
+    def tearDown(self):
+        self.db.close()
+        self.other_db.close()
+        self.directory.cleanup()
+
+    def test_acquire_release(self):
+        self.assertTrue(self.lock.acquire())
+        self.assertFalse(self.other.is_free())
+        self.lock.release()
+        self.assertTrue(self.other.is_free())
+        self.assertTrue(self.other.acquire())
+
+    def test_nowait(self):
+        with self.lock:
+            self.assertFalse(self.other.acquire(wait=False))
+        self.assertTrue(self.other.acquire(wait=False))
+
+    def test_timeout(self):
+        with self.lock:
+            with self.assertRaises(LockTimeout):
+                self.other.acquire()
+            with self.assertRaises(LockTimeout):
+                self.other.wait_released()
+
+    def test_release_of_other_owner(self):
+        with self.lock:
+            self.other.release()
+            self.assertFalse(self.other.is_free())
+
+    def test_stale(self):
+        self.lock.acquire()
+        self.lock.model.update(
+            acquired_at=datetime.datetime.now() - datetime.timedelta(days=1),
+        ).execute()
+        self.assertTrue(self.other.acquire(wait=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
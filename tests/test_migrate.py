@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from peewee import SqliteDatabase
+from peewee_extension.migrate import apply_batch, get_unapplied_migrations
+from peewee_extension.migration.models_migration_table import Migration, bind_copy
+
+MIGRATION = '''from peewee import DatabaseProxy
+db = DatabaseProxy()
+
+
+def apply():
+    db.execute_sql('{sql}')
+'''
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        os.chdir(self.path)
+        self.db = SqliteDatabase(str(self.path / 'test.db'))
+        self.write('20240102000000_b', 'CREATE TABLE `b` (`id` INTEGER PRIMARY KEY)')
+        self.write('20240101000000_a', 'CREATE TABLE `a` (`id` INTEGER PRIMARY KEY)')
+
+    def tearDown(self):
+        self.db.close()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def write(self, name, sql):
+        (self.path / f'{name}.py').write_text(MIGRATION.format(sql=sql))
+
+    def get_applied(self):
+        return [(row.name, row.applied_at) for row in bind_copy(Migration, self.db).select()]
+
+    def test_batch(self):
+        migrations = get_unapplied_migrations(self.db, self.path)
+        self.assertEqual(migrations, ['20240101000000_a', '20240102000000_b'])
+        self.assertEqual(apply_batch(migrations, self.db), migrations)
+        applied = self.get_applied()
+        self.assertEqual([name for name, applied_at in applied], migrations)
+        self.assertEqual(applied[0][1], applied[1][1])
+        self.assertEqual(get_unapplied_migrations(self.db, self.path), [])
+
+    def test_rollback(self):
+        self.write('20240103000000_c', 'CREATE TABLE `a` (`id` INTEGER PRIMARY KEY)')
+        migrations = get_unapplied_migrations(self.db, self.path)
+        with self.assertRaises(Exception):
+            apply_batch(migrations, self.db)
+        # sqlite has transactional DDL, the whole batch is rolled back
+        self.assertEqual(self.db.get_tables(), ['pe_migrations'])
+        self.assertEqual(self.get_applied(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
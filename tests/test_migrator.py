@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from peewee import CharField, IntegerField, MySQLDatabase
+from peewee_extension.migration.migrator import MxMySQLMigrator
+
+
+class AlterTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.migrator = MxMySQLMigrator(MySQLDatabase('test_db'))
+
+    def get_queries(self, operations):
+        statements = self.migrator.alter_table('t', operations, with_context=True)
+        return [statement.query() for statement in statements]
+
+    def test_merge(self):
+        migrator = self.migrator
+        queries = self.get_queries([
+            migrator.drop_index('t', 't_a'),
+            migrator.add_column('t', 'x', IntegerField(default=3)),
+            migrator.alter_column_type('t', 'y', CharField(max_length=10, null=True)),
+            migrator.rename_column('t', 'a', 'b'),
+            migrator.add_index('t', ('x', 'b'), True),
+        ])
+        self.assertEqual(queries, [
+            (
+                'ALTER TABLE `t` DROP INDEX `t_a`, '
+                'ADD COLUMN `x` INTEGER NOT NULL DEFAULT %s, '
+                'MODIFY `y` VARCHAR(10), '
+                'RENAME COLUMN `a` TO `b`, '
+                'ADD UNIQUE INDEX `t_x_b` (`x`, `b`)',
+                [3],
+            ),
+            ('ALTER TABLE `t` ALTER COLUMN `x` DROP DEFAULT', []),
+        ])
+
+    def test_wrong_operation(self):
+        with self.assertRaises(ValueError):
+            self.get_queries([self.migrator.rename_table('t', 'u')])
+        with self.assertRaises(ValueError):
+            self.get_queries([self.migrator.drop_index('u', 'u_a')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from peewee import CharField, CompositeKey, ForeignKeyField, Model
+from peewee_extension.core import EnumField
+from peewee_extension.migration.from_py import get_models_graph
+
+MODULE_NAME = 'test_models_graph_module'
+
+
+class Author(Model):
+    name = CharField(unique=True)
+
+    class Meta:
+        table_name = 'author'
+
+
+class Book(Model):
+    writer = ForeignKeyField(Author, column_name='author_ref')
+    parent = ForeignKeyField('self', null=True, unique=True)
+    status = EnumField(values=('new', 'done'))
+    code = CharField(index=True)
+
+    class Meta:
+        indexes = ((('code', 'status'), True),)
+
+
+class BookTag(Model):
+    book = ForeignKeyField(Book)
+    tag = CharField()
+
+    class Meta:
+        primary_key = CompositeKey('book', 'tag')
+
+
+for model in (Author, Book, BookTag):
+    model.__module__ = MODULE_NAME
+
+
+class ModelsGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = get_models_graph(
+            MODULE_NAME, {'Author': Author, 'Book': Book, 'BookTag': BookTag, 'name': 'x'},
+        )
+
+    def test_columns(self):
+        book = self.graph.tables['book']
+        # in the order of the model attributes, writer is also reachable as author_ref
+        self.assertEqual(list(book.columns), ['author_ref', 'code', 'id', 'parent_id', 'status'])
+        self.assertEqual(book.columns['author_ref'].dest_table, 'author')
+        self.assertEqual(book.columns['parent_id'].dest_table, 'book')
+        self.assertTrue(book.has_foreign_keys)
+        self.assertFalse(self.graph.tables['author'].has_foreign_keys)
+        self.assertEqual(book.columns['status'].sql_type, "ENUM('new', 'done')")
+
+    def test_indexes(self):
+        # a foreign key index is added once
+        self.assertEqual(
+            [index.get_signature() for index in self.graph.tables['book'].indexes],
+            [
+                (('code', 'status'), True), (('author_ref',), False),
+                (('code',), False), (('parent_id',), True),
+            ],
+        )
+        self.assertEqual(self.graph.tables['booktag'].primary_key.columns, ['book', 'tag'])
+        self.assertEqual(
+            [index.get_signature() for index in self.graph.tables['booktag'].indexes],
+            [(('book_id',), False)],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from peewee_extension.migration import from_py
+from peewee_extension.utils import CreateMigrationConfigurator
+
+BASE = '''from peewee import Model
+
+
+class BaseModel(Model):
+    pass
+'''
+
+AUTHORS = '''from peewee import CharField
+from ..base import BaseModel
+
+
+class Author(BaseModel):
+    name = CharField()
+'''
+
+BOOKS = '''from peewee import CharField, ForeignKeyField
+from cached_app.base import BaseModel
+from cached_app.people import authors
+
+
+class Book(BaseModel):
+    author = ForeignKeyField(authors.Author)
+    title = CharField()
+'''
+
+EVENTS = '''import datetime
+
+from peewee import DateTimeField
+from cached_app.base import BaseModel
+
+
+class Event(BaseModel):
+    created_at = DateTimeField(default=datetime.datetime.now)
+'''
+
+# модули, которые нельзя разобрать статически, импортируются в процессе-исполнителе
+SLOW = 3
+SLOW_MODULE = f'''import time
+
+time.sleep({SLOW})
+'''
+BROKEN_MODULE = '''raise ValueError('broken models')
+'''
+
+
+class PackageModelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name)
+        self.package = self.root / 'cached_app'
+        (self.package / 'people').mkdir(parents=True)
+        self.write('__init__.py', '')
+        self.write('base.py', BASE)
+        self.write('people/__init__.py', '')
+        self.write('people/authors.py', AUTHORS)
+        self.write('books.py', BOOKS)
+        self.cache_dir = str(self.root / 'cache')
+        sys.path.insert(0, self.directory.name)
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        self.directory.cleanup()
+
+    def write(self, name, source):
+        path = self.package / name
+        path.write_text(source)
+        # the next write must be seen even within the mtime resolution
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def get_graph(self):
+        with mock.patch.object(
+                from_py, 'extract_module', wraps=from_py.extract_module,
+        ) as extract_module:
+            db_graph = from_py.get_graph(
+                'cached_app', static=True, cache_dir=self.cache_dir, jobs=1,
+            )
+        return db_graph, sorted(call.args[0] for call in extract_module.call_args_list)
+
+    def test_package_modules(self):
+        self.assertEqual(
+            sorted(from_py.get_package_modules('cached_app')),
+            ['cached_app', 'cached_app.base', 'cached_app.books',
+             'cached_app.people', 'cached_app.people.authors'],
+        )
+
+    def test_merged_graph(self):
+        db_graph, extracted = self.get_graph()
+        self.assertEqual(len(extracted), 5)
+        self.assertEqual(sorted(db_graph.tables), ['author', 'book'])
+        self.assertEqual(db_graph.tables['book'].columns['author_id'].dest_table, 'author')
+
+    def test_parallel(self):
+        with mock.patch.object(
+                from_py.multiprocessing, 'get_context', wraps=multiprocessing.get_context,
+        ) as get_context:
+            db_graph = from_py.get_graph('cached_app', static=True, jobs=2)
+        get_context.assert_called_once_with('spawn')
+        self.assertEqual(sorted(db_graph.tables), ['author', 'book'])
+        self.assertEqual(db_graph.tables['book'].columns['author_id'].dest_table, 'author')
+
+    def test_parallel_error(self):
+        self.write('slow.py', SLOW_MODULE)
+        self.write('broken.py', BROKEN_MODULE)
+        started = time.perf_counter()
+        with self.assertRaisesRegex(ValueError, 'broken models'):
+            from_py.extract_modules(['cached_app.slow', 'cached_app.broken'], jobs=2)
+        self.assertLess(time.perf_counter() - started, SLOW)
+
+    def test_cache(self):
+        db_graph, extracted = self.get_graph()
+        fingerprint = db_graph.get_fingerprint()
+        db_graph, extracted = self.get_graph()
+        self.assertEqual(extracted, [])
+        self.assertEqual(db_graph.get_fingerprint(), fingerprint)
+
+        # touched but not changed
+        self.write('books.py', BOOKS)
+        self.assertEqual(self.get_graph()[1], [])
+
+        self.write('books.py', BOOKS + '    isbn = CharField(null=True)\n')
+        db_graph, extracted = self.get_graph()
+        self.assertEqual(extracted, ['cached_app.books'])
+        self.assertIn('isbn', db_graph.tables['book'].columns)
+
+        # the modules importing the changed one are extracted again
+        self.write('people/authors.py', AUTHORS + '\n    class Meta:\n        table_name = "a"\n')
+        db_graph, extracted = self.get_graph()
+        self.assertEqual(extracted, ['cached_app.books', 'cached_app.people.authors'])
+        self.assertEqual(db_graph.tables['book'].columns['author_id'].dest_table, 'a')
+
+    def test_callable_default(self):
+        self.write('events.py', EVENTS)
+        module_graph = from_py.get_graph('cached_app.events', static=True)
+        self.get_graph()
+        db_graph, extracted = self.get_graph()
+        self.assertEqual(extracted, [])
+        column = db_graph.tables['event'].columns['created_at'].refl_column
+        self.assertEqual(column.default, datetime.datetime.now)
+        self.assertEqual(
+            db_graph.tables['event'].get_model(), module_graph.tables['event'].get_model(),
+        )
+
+    def test_filepath_without_import(self):
+        sys.modules.pop('cached_app.books', None)
+        configurator = CreateMigrationConfigurator()
+        configurator.options = argparse.Namespace(
+            filepath=None, models='cached_app.books', static_models=False,
+        )
+        self.assertEqual(configurator.get_filepath(), self.package / 'pe_migrations')
+        self.assertNotIn('cached_app.books', sys.modules)
+
+    def test_duplicate_table(self):
+        self.write('copy.py', AUTHORS.replace('..base', '.base'))
+        with self.assertRaises(Exception):
+            self.get_graph()
+
+
+if __name__ == '__main__':
+    unittest.main()
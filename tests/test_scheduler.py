@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import tempfile
+import unittest
+from pathlib import Path
+
+from peewee import ForeignKeyField, IntegerField, Model, SqliteDatabase
+from peewee_extension.migration.graph import DbNode
+from peewee_extension.migration.scheduler import Scheduler, make_tasks
+from playhouse.migrate import SqliteMigrator
+from tests.test_diff import make_column, make_table
+
+
+class Parent(Model):
+    class Meta:
+        table_name = 'parent'
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = SqliteDatabase(str(Path(self.directory.name) / 'test.db'))
+        for table in ('parent', 'child', 'other'):
+            self.db.execute_sql(f'CREATE TABLE `{table}` (`id` INTEGER PRIMARY KEY)')
+        self.migrator = SqliteMigrator(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_make_tasks(self):
+        migrator = self.migrator
+        operations = [
+            migrator.add_column('child', 'parent_id', ForeignKeyField(Parent, field=Parent.id, null=True)),
+            migrator.add_column('parent', 'a', IntegerField(null=True)),
+            migrator.add_column('other', 'a', IntegerField(null=True)),
+            migrator.rename_table('other', 'another'),
+            migrator.add_column('another', 'b', IntegerField(null=True)),
+            migrator.add_column('child', 'b', IntegerField(null=True)),
+        ]
+        order, tasks, waits = make_tasks(operations)
+        self.assertEqual(order, ['parent', 'child', 'other'])
+        self.assertEqual(waits, {'parent': set(), 'child': {'parent'}, 'other': set()})
+        self.assertEqual([len(tasks[table]) for table in order], [1, 2, 3])
+
+        order, tasks, waits = make_tasks(operations, dependencies={
+            'parent': ['another'], 'another': ['child'],
+        })
+        # the cycle child -> parent -> other -> child is broken, the tables still wait in turn
+        self.assertEqual(order, ['other', 'parent', 'child'])
+        self.assertEqual(waits, {'other': set(), 'parent': {'other'}, 'child': {'parent', 'other'}})
+
+    def test_run(self):
+        migrator = self.migrator
+        operations = [
+            migrator.add_column('parent', 'a', IntegerField(null=True)),
+            migrator.add_column('other', 'a', IntegerField(null=True)),
+            migrator.add_column('child', 'parent_id', ForeignKeyField(Parent, field=Parent.id, null=True)),
+        ]
+        order = Scheduler(self.db, workers=2).run(operations)
+        self.assertEqual(order, ['parent', 'other', 'child'])
+        self.assertEqual(
+            [column.name for column in self.db.get_columns('child')], ['id', 'parent_id'],
+        )
+        self.assertEqual([column.name for column in self.db.get_columns('other')], ['id', 'a'])
+
+    def test_failure(self):
+        migrator = self.migrator
+        operations = [
+            migrator.add_column('missing', 'a', IntegerField(null=True)),
+            migrator.add_column('child', 'parent_id', ForeignKeyField(Parent, field=Parent.id, null=True)),
+            migrator.add_column('other', 'a', IntegerField(null=True)),
+        ]
+        with self.assertRaises(Exception) as context:
+            Scheduler(self.db, workers=2).run(operations, dependencies={'child': ['missing']})
+        self.assertIn('Failed to migrate missing, not started: child', str(context.exception))
+        self.assertEqual([column.name for column in self.db.get_columns('child')], ['id'])
+        self.assertEqual([column.name for column in self.db.get_columns('other')], ['id', 'a'])
+
+
+class DependenciesTest(unittest.TestCase):
+
+    def test_get_dependencies(self):
+        child_from = make_table('child', [make_column('a')])
+        child_to = make_table('child', [make_column('a'), make_column('parent_id')])
+        child_to.columns['parent_id'].dest_table = 'parent'
+        db_self = DbNode({
+            'parent': make_table('parent', [make_column('a')]), 'child': child_from,
+        })
+        db_other = DbNode({
+            'parent': make_table('parent', [make_column('a', nullable=True)]), 'child': child_to,
+        })
+        diff = db_self.get_diff(db_other)
+        self.assertEqual(diff.get_dependencies(), {'child': ['parent']})
+        self.assertEqual(diff.get_dependencies(reverse=True), {'parent': ['child']})
+
+
+if __name__ == '__main__':
+    unittest.main()
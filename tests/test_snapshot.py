@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from peewee import ForeignKeyMetadata
+from peewee_extension.core import EnumField
+from peewee_extension.migration import snapshot
+from peewee_extension.migration.graph import (
+    ColumnNode, DbNode, IndexNode, PrimaryKeyNode, TableNode,
+)
+from playhouse.reflection import AutoField, CharField, Column, IntegerField
+
+
+def make_graph():
+    status = Column(
+        'status', field_class=EnumField, raw_column_type='enum', nullable=False,
+        primary_key=False, column_name='status',
+        extra_parameters={'values': "('new','done')"},
+    )
+    parent = Column(
+        'parent', field_class=IntegerField, raw_column_type='int', nullable=True,
+        primary_key=False, column_name='parent_id',
+    )
+    parent.set_foreign_key(
+        ForeignKeyMetadata('parent_id', 'parent', 'id', 'child'),
+        model_names={'parent': 'Parent', 'child': 'Child'},
+    )
+    child = TableNode(
+        'child', primary_key=PrimaryKeyNode(['id']), model='Child', has_foreign_keys=True,
+        columns={
+            'id': ColumnNode('id', Column(
+                'id', field_class=AutoField, raw_column_type='int', nullable=False,
+                primary_key=True, column_name='id',
+            )),
+            'status': ColumnNode('status', status),
+            'parent_id': ColumnNode('parent_id', parent),
+        },
+        indexes=[IndexNode(['status', 'parent_id'], unique=True)],
+    )
+    parent_table = TableNode(
+        'parent', primary_key=PrimaryKeyNode(['id']), model='Parent', indexes=[],
+        columns={
+            'id': ColumnNode('id', Column(
+                'id', field_class=AutoField, raw_column_type='int', nullable=False,
+                primary_key=True, column_name='id',
+            )),
+            'title': ColumnNode('title', Column(
+                'title', field_class=CharField, raw_column_type='varchar', nullable=True,
+                primary_key=False, column_name='title', extra_parameters={'max_length': 63},
+            )),
+        },
+    )
+    return DbNode({'parent': parent_table, 'child': child})
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_round_trip(self, filename):
+        db_graph = make_graph()
+        path = os.path.join(self.directory.name, filename)
+        snapshot.save(db_graph, path)
+        self.assertTrue(snapshot.is_snapshot(path))
+
+        loaded = snapshot.load(path)
+        self.assertEqual(list(loaded.tables.keys()), ['parent', 'child'])
+        self.assertEqual(loaded.as_sql(), db_graph.as_sql())
+        for table_name, table in db_graph.tables.items():
+            self.assertEqual(loaded.tables[table_name].get_model(), table.get_model())
+        self.assertEqual(loaded.get_diff(db_graph).tables, {})
+        self.assertEqual(db_graph.get_diff(loaded).tables, {})
+        self.assertEqual(loaded.get_fingerprint(), db_graph.get_fingerprint())
+
+        foreign_key = loaded.tables['child'].columns['parent_id'].refl_column
+        self.assertTrue(foreign_key.is_foreign_key())
+        self.assertEqual(foreign_key.foreign_key.dest_table, 'parent')
+
+    def test_json(self):
+        self.check_round_trip('schema.json')
+
+    def test_gzip(self):
+        self.check_round_trip('schema.json.gz')
+
+    def test_wrong_version(self):
+        data = snapshot.dump_graph(make_graph())
+        data['version'] = snapshot.SNAPSHOT_VERSION + 1
+        with self.assertRaises(ValueError):
+            snapshot.load_graph(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from peewee import SqliteDatabase
+from peewee_extension.migrate import do_migrate
+from peewee_extension.migration import script
+from peewee_extension.migration.graph import DbNode
+from peewee_extension.migration.models_migration_table import Migration, bind_copy
+from peewee_extension.squash import move_squashed
+from peewee_extension.utils import SquashConfigurator
+from tests.test_diff import make_column, make_table
+
+BASELINE = '''from peewee import DatabaseProxy
+db = DatabaseProxy()
+squashed = ['20240101000000_a', '20240102000000_b']
+
+
+def apply():
+    db.execute_sql('CREATE TABLE `a` (`id` INTEGER PRIMARY KEY)')
+'''
+
+
+class SquashTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / '20240103000000_baseline.py').write_text(BASELINE)
+        os.chdir(self.path)
+        self.db = SqliteDatabase(':memory:')
+        self.migration_model = bind_copy(Migration, self.db)
+        self.migration_model.create_table()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def get_applied(self):
+        return sorted(row.name for row in self.migration_model.select())
+
+    def test_fresh_database(self):
+        do_migrate('20240103000000_baseline', self.db)
+        self.assertEqual(self.db.get_tables(), ['a', 'pe_migrations'])
+        self.assertEqual(
+            self.get_applied(),
+            ['20240101000000_a', '20240102000000_b', '20240103000000_baseline'],
+        )
+
+    def test_migrated_database(self):
+        for name in ('20240101000000_a', '20240102000000_b'):
+            self.migration_model.create(
+                name=name, is_applied=True, created_at='2024-01-01', applied_at='2024-01-01',
+            )
+        do_migrate('20240103000000_baseline', self.db)
+        self.assertEqual(self.db.get_tables(), ['pe_migrations'])
+        self.assertEqual(len(self.get_applied()), 3)
+
+    def test_partly_migrated_database(self):
+        self.migration_model.create(
+            name='20240101000000_a', is_applied=True,
+            created_at='2024-01-01', applied_at='2024-01-01',
+        )
+        with self.assertRaises(Exception):
+            do_migrate('20240103000000_baseline', self.db)
+        self.assertEqual(self.get_applied(), ['20240101000000_a'])
+
+    def test_move_squashed(self):
+        for name in ('20240101000000_a.py', '20240101000000_a.cost.txt', '20240102000000_b.py'):
+            (self.path / name).write_text('')
+        squashed_path = move_squashed(self.path, ['20240101000000_a', '20240102000000_b'])
+        self.assertEqual(
+            sorted(path.name for path in squashed_path.iterdir()),
+            ['20240101000000_a.cost.txt', '20240101000000_a.py', '20240102000000_b.py'],
+        )
+        self.assertEqual(
+            sorted(path.name for path in self.path.iterdir()),
+            ['20240103000000_baseline.py', 'squashed'],
+        )
+
+    def test_baseline_script(self):
+        table = make_table('t', [make_column('a')])
+        table.model = 'T'
+        diff = DbNode({}).get_diff(other=DbNode({'t': table}))
+        code = ''.join(script.iter_script(diff, '', squashed=['20240101000000_a']))
+        self.assertIn("squashed = ['20240101000000_a']\n", code)
+        self.assertIn('db.create_tables([', code)
+        compile(code, 'baseline.py', 'exec')
+
+
+class SquashConfiguratorTest(unittest.TestCase):
+
+    def test_filepath_is_required(self):
+        argv = sys.argv
+        sys.argv = ['squash', '-d', 'sqlite:///scratch.db']
+        try:
+            with contextlib.redirect_stderr(io.StringIO()) as stderr:
+                with self.assertRaises(SystemExit):
+                    SquashConfigurator().run()
+        finally:
+            sys.argv = argv
+        self.assertIn('--filepath', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
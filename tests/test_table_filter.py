@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from peewee import CharField, ForeignKeyField, Model
+from peewee_extension.migration.from_py import get_models_graph
+from peewee_extension.migration.table_filter import TableFilter, expand
+
+MODULE_NAME = 'test_table_filter_module'
+
+
+class Country(Model):
+    name = CharField()
+
+
+class City(Model):
+    country = ForeignKeyField(Country)
+    name = CharField()
+
+
+class Street(Model):
+    city = ForeignKeyField(City)
+    name = CharField()
+
+
+class LogEntry(Model):
+    text = CharField()
+
+    class Meta:
+        table_name = 'log_2024'
+
+
+for model in (Country, City, Street, LogEntry):
+    model.__module__ = MODULE_NAME
+
+NAMESPACE = {'City': City, 'Country': Country, 'LogEntry': LogEntry, 'Street': Street}
+
+
+class TableFilterTest(unittest.TestCase):
+
+    def test_match(self):
+        tables_filter = TableFilter(['city', 'log_*', r're:st\w+'])
+        self.assertTrue(tables_filter.has_patterns)
+        self.assertEqual(
+            tables_filter.select(['city', 'country', 'log_2024', 'street', 'last_street']),
+            ['city', 'log_2024', 'street'],
+        )
+        self.assertFalse(TableFilter(['city']).has_patterns)
+
+    def test_expand(self):
+        references = {'a': {'b'}, 'b': {'c', 'b'}, 'c': set(), 'd': {'a'}}
+        self.assertEqual(expand(['a'], references.get), {'a', 'b', 'c'})
+
+    def test_models_graph(self):
+        db_graph = get_models_graph(MODULE_NAME, NAMESPACE, tables=['street'])
+        self.assertEqual(sorted(db_graph.tables), ['city', 'country', 'street'])
+        db_graph = get_models_graph(MODULE_NAME, NAMESPACE, tables=['log_*', 'country'])
+        self.assertEqual(sorted(db_graph.tables), ['country', 'log_2024'])
+        self.assertEqual(
+            len(get_models_graph(MODULE_NAME, NAMESPACE).tables), len(NAMESPACE),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()